@@ -0,0 +1,127 @@
+# This script benchmarks the event matching (compare_events_dtw) on the reference/align pairs of the test data.
+# The banded DTW with lower bound pruning and early abandoning (greedy and global event assignment) is compared to the
+# previous matcher that evaluated fastdtw for every candidate pair. For each variant it reports the runtime, the number
+# of DTW evaluations that were avoided by the lower bounds or abandoned early, and the number of pairs with the same
+# accepted matches as fastdtw.
+# The cross-correlation matcher (compare_events_cca) is timed as well, its accuracy is compared in
+# error_quantification/compare_matching_methods.py.
+# Usage: python benchmark_event_comparison.py [--test_configurations ../error_quantification/test_run_configurations.json]
+#                                            [--window_fractions 0.1 0.2] [--cache_folder cache]
+
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+from fastdtw import fastdtw
+from scipy.spatial.distance import euclidean
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from main import process_signal
+from pipeline_steps.event_comparison import compare_events_dtw, compare_events_cca
+
+outlier_neighbors = {'cosinuss': 400, 'corsano': 200, 'vivalink': 50, 'sensomative': 20}
+max_time_gap_events = 2.0
+dtw_distance_threshold = 150
+cca_distance_threshold = 0.5
+
+
+def find_pairs(test_configurations):
+    # paths in the test configurations are relative to the error_quantification folder
+    base_folder = os.path.dirname(os.path.abspath(test_configurations))
+    with open(test_configurations, 'r') as file:
+        data = json.load(file)
+    pairs = []
+    for user_data in data.values():
+        for reference_data in user_data:
+            reference_file = os.path.join(base_folder, reference_data['reference_file'])
+            for alignment in reference_data['alignments']:
+                files_folder = os.path.join(base_folder, alignment['files_folder'])
+                if not os.path.exists(files_folder):
+                    continue
+                for file in sorted(os.listdir(files_folder)):
+                    if file.endswith('.csv'):
+                        pairs.append((reference_file, reference_data['sensor_name_reference'],
+                                      os.path.join(files_folder, file), alignment['sensor_name_align']))
+    return pairs
+
+
+def compare_events_fastdtw(event_stats1, event_stats2, max_time_difference):
+    # previous matcher: fastdtw for every candidate pair, conflicts resolved by the smaller distance
+    matched_event2_ids = {}
+    for event1 in event_stats1:
+        best_match = None
+        best_distance = np.inf
+        for event2 in event_stats2:
+            if abs(event1['start_time'] - event2['start_time']) <= max_time_difference:
+                data1 = np.asarray(event1['normalized_event_data']).reshape(-1, 1)
+                data2 = np.asarray(event2['normalized_event_data']).reshape(-1, 1)
+                distance, _ = fastdtw(data1, data2, dist=euclidean)
+                if distance < best_distance:
+                    best_distance = distance
+                    best_match = event2
+        if best_match:
+            event2_id = best_match['event_id']
+            if event2_id not in matched_event2_ids or best_distance < matched_event2_ids[event2_id]['dtw_distance']:
+                matched_event2_ids[event2_id] = {'event1_id': event1['event_id'], 'dtw_distance': best_distance}
+    return [{'event1_id': result['event1_id'], 'best_match_event2_id': event2_id, 'dtw_distance': result['dtw_distance']}
+            for event2_id, result in matched_event2_ids.items()]
+
+
+def accepted_matches(comparison_results, threshold):
+    return [(result['event1_id'], result['best_match_event2_id'])
+            for result in comparison_results if result['dtw_distance'] < threshold]
+
+
+def main(test_configurations, window_fractions, cache_folder):
+    diverse_settings = {'min_time_event': 0.5, 'min_outlier_fraction_event': 0.5, 'normalization_window_duration': 10,
+                        'cache_folder_path': cache_folder}
+    pairs = find_pairs(test_configurations)
+    events = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for reference_file, sensor_name_reference, file_to_align, sensor_name_align in pairs:
+            for input_file, sensor_name in ((reference_file, sensor_name_reference), (file_to_align, sensor_name_align)):
+                if input_file not in events:
+                    events[input_file] = process_signal(input_file, sensor_name, outlier_neighbors[sensor_name], diverse_settings)[1]
+    print(f"{len(pairs)} pairs, {len(events)} recordings")
+
+    start = time.perf_counter()
+    reference_matches = [accepted_matches(compare_events_fastdtw(events[pair[0]], events[pair[2]], max_time_gap_events), dtw_distance_threshold)
+                         for pair in pairs]
+    runtime = time.perf_counter() - start
+    print(f"{'matcher':<32} {'runtime':>9} {'candidates':>10} {'pruned':>8} {'abandoned':>9} {'evaluated':>9} {'same':>9}")
+    print(f"{'fastdtw (previous)':<32} {runtime:>8.2f}s {'-':>10} {'-':>8} {'-':>9} {'-':>9} {len(pairs):>4}/{len(pairs)}")
+
+    for assignment, window_fraction, threshold in [(assignment, window_fraction, threshold) for assignment in ('greedy', 'global')
+                                               for window_fraction in window_fractions for threshold in (np.inf, dtw_distance_threshold)]:
+        statistics = {}
+        start = time.perf_counter()
+        matches = [accepted_matches(compare_events_dtw(events[pair[0]], events[pair[2]], max_time_gap_events, threshold,
+                                                       window_fraction, statistics, assignment), dtw_distance_threshold)
+                   for pair in pairs]
+        runtime = time.perf_counter() - start
+        same = sum(match == reference_match for match, reference_match in zip(matches, reference_matches))
+        name = f"{assignment} {window_fraction}, threshold {threshold}"
+        print(f"{name:<32} {runtime:>8.2f}s {statistics['candidates']:>10} {statistics['pruned_lower_bound']:>8} "
+              f"{statistics['abandoned']:>9} {statistics['evaluated']:>9} {same:>4}/{len(pairs)}")
+
+    start = time.perf_counter()
+    matches = [accepted_matches(compare_events_cca(events[pair[0]], events[pair[2]], max_time_gap_events, distance_threshold=cca_distance_threshold), cca_distance_threshold)
+               for pair in pairs]
+    runtime = time.perf_counter() - start
+    same = sum(match == reference_match for match, reference_match in zip(matches, reference_matches))
+    print(f"{'cross-correlation':<32} {runtime:>8.2f}s {'-':>10} {'-':>8} {'-':>9} {'-':>9} {same:>4}/{len(pairs)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the event matching.")
+    parser.add_argument("--test_configurations", default="../error_quantification/test_run_configurations.json", help="Test run configurations with the pairs.")
+    parser.add_argument("--window_fractions", nargs='*', type=float, default=[0.1, 0.2], help="DTW band widths to benchmark.")
+    parser.add_argument("--cache_folder", default="", help="Cache folder for the processed signals, '' to disable.")
+    args = parser.parse_args()
+
+    main(args.test_configurations, args.window_fractions, args.cache_folder)
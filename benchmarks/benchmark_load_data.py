@@ -0,0 +1,93 @@
+# This script measures load time and peak memory of load_data for the CSV files and their binary conversions.
+# A recording of the data folder is copied to a temporary folder (optionally repeated to a given number of rows with
+# continuing time) and converted to every available binary format. Each variant is then loaded with all columns and
+# with only the columns needed for the 1d_signal.
+# Usage: python benchmark_load_data.py [--input_file <csv>] [--sensor sensomative] [--rows 1000000]
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from utils.data_utils import load_data, save_binary_data, required_columns
+
+default_input_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  '../data/sensei-103/sensomative/start_sensei_103_2022-11-08_09-57-41-307_mod221207SA.csv')
+
+
+def make_recording(input_file, rows, output_file):
+    df = pd.read_csv(input_file)
+    if rows is not None and rows > len(df):
+        repetitions = int(np.ceil(rows / len(df)))
+        duration = df['time'].iloc[-1] - df['time'].iloc[0] + (df['time'].iloc[1] - df['time'].iloc[0])
+        df = pd.concat([df.assign(time=df['time'] + k * duration) for k in range(repetitions)], ignore_index=True).iloc[:rows]
+    df.to_csv(output_file, index=False)
+
+
+def measure(input_file, columns):
+    # tracemalloc slows down the creation of Python objects a lot, so time and memory are measured in separate runs
+    start = time.perf_counter()
+    df = load_data(input_file, columns=columns)
+    duration = time.perf_counter() - start
+    del df
+
+    tracemalloc.start()
+    df = load_data(input_file, columns=columns)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak_memory, df.shape
+
+
+def available_formats():
+    formats = ['csv', 'npy']
+    try:
+        import pyarrow  # noqa: F401
+        formats += ['parquet', 'feather']
+    except ImportError:
+        pass
+    return formats
+
+
+def main(input_file, sensor_name, rows):
+    temporary_folder = tempfile.mkdtemp()
+    try:
+        csv_file = os.path.join(temporary_folder, 'recording.csv')
+        make_recording(input_file, rows, csv_file)
+        print(f"Recording: {os.path.basename(input_file)} ({os.path.getsize(csv_file) / 1e6:.1f}MB CSV)")
+        print(f"{'format':<10} {'columns':<8} {'rows':>9} {'cols':>5} {'load time':>10} {'peak mem':>10} {'file size':>10}")
+
+        df = load_data(csv_file)
+        for binary_format in available_formats():
+            binary_file = None
+            file_size = os.path.getsize(csv_file)
+            if binary_format != 'csv':
+                binary_file = save_binary_data(df, csv_file, binary_format)
+                if os.path.isdir(binary_file):
+                    file_size = sum(os.path.getsize(os.path.join(binary_file, file)) for file in os.listdir(binary_file))
+                else:
+                    file_size = os.path.getsize(binary_file)
+            for label, columns in [('all', None), ('sensor', required_columns(sensor_name))]:
+                duration, peak_memory, shape = measure(csv_file, columns)
+                print(f"{binary_format:<10} {label:<8} {shape[0]:>9} {shape[1]:>5} {duration:>9.3f}s "
+                      f"{peak_memory / 1e6:>8.1f}MB {file_size / 1e6:>8.1f}MB")
+            if binary_file is not None:
+                shutil.rmtree(binary_file) if os.path.isdir(binary_file) else os.remove(binary_file)
+    finally:
+        shutil.rmtree(temporary_folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark load_data for CSV and binary recordings.")
+    parser.add_argument("--input_file", default=default_input_file, help="CSV recording to benchmark.")
+    parser.add_argument("--sensor", default='sensomative', choices=['cosinuss', 'corsano', 'vivalink', 'sensomative'], help="Sensor of the recording.")
+    parser.add_argument("--rows", type=int, default=None, help="Repeat the recording to this number of rows.")
+    args = parser.parse_args()
+
+    main(args.input_file, args.sensor, args.rows)
@@ -0,0 +1,143 @@
+# This script measures the peak memory (maximum resident set size) of the out-of-core mode (out_of_core.py) compared to
+# the in-memory pipeline on synthetic recordings of a given size. A corsano reference recording with bursts of movement
+# and a copy shifted by a time drift are written as CSV files (synthetic_recordings.py), every run is started in a
+# separate process and reports its own peak RSS and runtime.
+# The in-memory pipeline is only run up to --max_in_memory_mb, larger recordings do not fit into the memory.
+# With --check it instead checks that the out-of-core mode detects the same events as process_signal for every
+# recording in the data folder, every outlier detector (the default lof included) and every --check_chunk_sizes, and
+# exits with 1 if any differ.
+# Usage: python benchmark_out_of_core.py [--sizes_mb 200 2000] [--chunk_size 1000000] [--max_in_memory_mb 500]
+#                                        [--folder synthetic] [--keep]
+#        python benchmark_out_of_core.py --check [--data_folder ../data] [--check_chunk_sizes 100 700]
+
+import io
+import os
+import sys
+import json
+import warnings
+import contextlib
+import numpy as np
+import shutil
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from synthetic_recordings import write_recording
+from benchmark_outlier_detection import find_recordings, outlier_neighbors
+from main import process_signal
+from out_of_core import process_signal_out_of_core
+from pipeline_steps.outlier_detection import OUTLIER_DETECTORS
+
+time_drift = 1.0            # s between the reference and the file to align
+bytes_per_row = 60          # approximate CSV row size, used to derive the number of rows from the size
+
+settings = {
+    'outlier_neighbors_cosinuss': 400, 'outlier_neighbors_corsano': 200, 'outlier_neighbors_vivalink': 50, 'outlier_neighbors_sensomative': 20,
+    'outlier_method_corsano': 'rolling_mad',
+    'min_time_event': 0.5, 'min_outlier_fraction_event': 0.5, 'max_time_gap_events': 2.0,
+    'dtw_distance_threshold_accelerator': 150, 'dtw_distance_threshold_sensomative': 150,
+    'normalization_window_duration': 10, 'save_output_files': True,
+    'plotting': False, 'scaling_factor_reference': 100, 'scaling_factor_align': 1.0
+}
+
+run_script = """
+import sys, time, json, resource
+sys.path.append(sys.argv[1])
+from main import settings_from_config, run_synchronization_pipeline
+from out_of_core import run_out_of_core_alignment
+config = json.loads(sys.argv[2])
+outlier_settings, diverse_settings, plotting, plot_settings = settings_from_config(config)
+start = time.perf_counter()
+if config['out_of_core']:
+    run_out_of_core_alignment(config['reference_file'], config['file_to_align'], 'corsano', 'corsano', outlier_settings, diverse_settings, config['chunk_size'])
+else:
+    run_synchronization_pipeline(config['reference_file'], config['file_to_align'], 'corsano', 'corsano', outlier_settings['corsano'],
+                                 outlier_settings['corsano'], diverse_settings, False, plot_settings)
+print(json.dumps({'runtime': time.perf_counter() - start, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def run(config):
+    pipeline_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline')
+    result = subprocess.run([sys.executable, '-c', run_script, pipeline_folder, json.dumps(config)], capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'runtime': None, 'peak_rss_mb': None, 'error': result.stderr.strip().splitlines()[-1] if result.stderr else f"exit code {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def same_events(events, chunked_events):
+    # the event information of process_signal and process_signal_out_of_core (which additionally has the value times),
+    # the normalized event data up to rounding (the prefix sums of the normalization windows start at the chunks)
+    def same(key, value, chunked_value):
+        if key == 'normalized_event_data':
+            return len(value) == len(chunked_value) and np.allclose(value, chunked_value, rtol=1e-9, atol=1e-12)
+        return np.array_equal(value, chunked_value)
+    return len(events) == len(chunked_events) and all(
+        all(same(key, event[key], chunked_event[key]) for key in event) for event, chunked_event in zip(events, chunked_events))
+
+
+def check_equivalence(data_folder, chunk_sizes):
+    diverse_settings = {'min_time_event': settings['min_time_event'], 'min_outlier_fraction_event': settings['min_outlier_fraction_event'],
+                        'normalization_window_duration': settings['normalization_window_duration'], 'cache_folder_path': ''}
+    recordings = find_recordings(data_folder)
+    differences = 0
+    print(f"{'method':<15} {'chunk size':>10} {'identical':>10}")
+    for method in OUTLIER_DETECTORS:
+        for chunk_size in chunk_sizes:
+            identical = 0
+            for input_file, sensor_name in recordings:
+                method_settings = dict(diverse_settings, outlier_methods={sensor_name: method})
+                with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    _, events, _ = process_signal(input_file, sensor_name, outlier_neighbors[sensor_name], method_settings)
+                    chunked_events, _, _ = process_signal_out_of_core(input_file, sensor_name, outlier_neighbors[sensor_name], method_settings, chunk_size)
+                identical += same_events(events, chunked_events)
+            differences += len(recordings) - identical
+            print(f"{method:<15} {chunk_size:>10} {identical:>5}/{len(recordings):<4}")
+    return 1 if differences else 0
+
+
+def main(sizes_mb, chunk_size, max_in_memory_mb, folder, keep):
+    os.makedirs(folder, exist_ok=True)
+    print(f"{'size':>8} {'rows':>10} {'mode':<12} {'runtime':>9} {'peak RSS':>10}")
+    for size_mb in sizes_mb:
+        rows = int(size_mb * 1e6 / bytes_per_row)
+        reference_file = os.path.join(folder, f"reference_{size_mb}mb.csv")
+        file_to_align = os.path.join(folder, f"align_{size_mb}mb.csv")
+        write_recording(reference_file, 'corsano', rows)
+        write_recording(file_to_align, 'corsano', rows, time_drift=time_drift, noise_seed=1)
+        actual_size_mb = os.path.getsize(reference_file) / 1e6
+
+        modes = ['out-of-core'] + (['in memory'] if size_mb <= max_in_memory_mb else [])
+        for mode in modes:
+            config = dict(settings, reference_file=reference_file, file_to_align=file_to_align, out_of_core=mode == 'out-of-core',
+                          chunk_size=chunk_size, output_folder_path=os.path.join(folder, 'output'))
+            result = run(config)
+            runtime = f"{result['runtime']:.1f}s" if result['runtime'] is not None else result['error']
+            peak_rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else '-'
+            print(f"{actual_size_mb:>6.0f}MB {rows:>10} {mode:<12} {runtime:>9} {peak_rss:>10}")
+            shutil.rmtree(os.path.join(folder, 'output'), ignore_errors=True)
+        if not keep:
+            os.remove(reference_file)
+            os.remove(file_to_align)
+    if not keep:
+        shutil.rmtree(folder, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the peak memory of the out-of-core mode.")
+    parser.add_argument("--sizes_mb", nargs='*', type=int, default=[200, 2000], help="Sizes of the synthetic CSV recordings in MB.")
+    parser.add_argument("--chunk_size", type=int, default=1000000, help="Rows per chunk in out-of-core mode.")
+    parser.add_argument("--max_in_memory_mb", type=int, default=500, help="Largest recording also run in memory.")
+    parser.add_argument("--folder", default="synthetic", help="Folder for the synthetic recordings and outputs.")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic recordings.")
+    parser.add_argument("--check", action="store_true", help="Check the events of the out-of-core mode against the in-memory pipeline instead.")
+    parser.add_argument("--data_folder", default="../data", help="Folder with the recordings for --check.")
+    parser.add_argument("--check_chunk_sizes", nargs='*', type=int, default=[100, 700], help="Chunk sizes (rows) for --check.")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(check_equivalence(args.data_folder, args.check_chunk_sizes))
+    sys.exit(main(args.sizes_mb, args.chunk_size, args.max_in_memory_mb, args.folder, args.keep))
@@ -0,0 +1,105 @@
+# This script benchmarks the outlier detection methods against the sklearn LocalOutlierFactor ('lof').
+# For each original recording in the data folder (and optionally for synthetic signals of given lengths) it reports the
+# runtime, the peak memory allocated during detection (tracemalloc) and the agreement of the outlier flags with 'lof'.
+# Usage: python benchmark_outlier_detection.py [--data_folder ../data] [--synthetic_samples 100000 1000000] [--max_lof_samples 200000]
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.outlier_detection import detect_outliers, OUTLIER_DETECTORS
+from utils.data_utils import load_data, create_1D_signal, calculate_1D_signal_derivative
+
+sensor_folders = {
+    'cosinuss_ear_acc_x_acc_y_acc_z': 'cosinuss',
+    'corsano_wrist_acc': 'corsano',
+    'vivalnk_vv330_acceleration': 'vivalink',
+    'sensomative': 'sensomative'
+}
+outlier_neighbors = {'cosinuss': 400, 'corsano': 200, 'vivalink': 50, 'sensomative': 20}
+
+
+def find_recordings(data_folder):
+    # original snippets only, no ground truth, drifted or output files
+    recordings = []
+    for root, _, files in os.walk(data_folder):
+        sensor_folder = os.path.basename(root)
+        if sensor_folder not in sensor_folders:
+            continue
+        for file in sorted(files):
+            if file.endswith('.csv') and 'synched_to' not in file:
+                recordings.append((os.path.join(root, file), sensor_folders[sensor_folder]))
+    return recordings
+
+
+def load_signal(input_file, sensor_name):
+    df = create_1D_signal(load_data(input_file), sensor_name)
+    if sensor_name == 'sensomative':
+        df = calculate_1D_signal_derivative(df, '1d_signal')
+        return df, '1d_signal_derivative'
+    return df, '1d_signal'
+
+
+def synthetic_signal(n_samples, seed=0):
+    # accelerometer-like magnitude: noise around a baseline with short bursts of movement
+    rng = np.random.default_rng(seed)
+    signal = 1.0 + 0.02 * rng.standard_normal(n_samples)
+    for start in rng.integers(0, n_samples, size=max(1, n_samples // 2000)):
+        length = rng.integers(10, 100)
+        signal[start:start + length] += rng.uniform(0.5, 3.0) * np.abs(rng.standard_normal(len(signal[start:start + length])))
+    return pd.DataFrame({'1d_signal': signal}), '1d_signal'
+
+
+def measure(df, signal_column, n_neighbors, method):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        flags = detect_outliers(df, signal_column, n_neighbors=n_neighbors, method=method)
+    runtime = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return flags, runtime, peak_memory
+
+
+def benchmark(name, df, signal_column, n_neighbors, max_lof_samples):
+    reference_flags = None
+    for method in OUTLIER_DETECTORS:
+        if method == 'lof' and len(df) > max_lof_samples:
+            print(f"{name:<60} {len(df):>9} {method:<15} {'skipped':>10}")
+            continue
+        flags, runtime, peak_memory = measure(df, signal_column, n_neighbors, method)
+        if method == 'lof':
+            reference_flags = flags
+        agreement = f"{np.mean(flags == reference_flags) * 100:.2f}%" if reference_flags is not None else '-'
+        print(f"{name:<60} {len(df):>9} {method:<15} {runtime:>9.3f}s {peak_memory / 1e6:>9.1f}MB "
+              f"{int(flags.sum()):>8} {agreement:>9}")
+
+
+def main(data_folder, synthetic_samples, max_lof_samples):
+    print(f"{'signal':<60} {'samples':>9} {'method':<15} {'runtime':>10} {'peak mem':>11} {'outliers':>8} {'agree':>9}")
+    for input_file, sensor_name in find_recordings(data_folder):
+        df, signal_column = load_signal(input_file, sensor_name)
+        name = os.path.basename(input_file)[:40] + f" ({sensor_name})"
+        benchmark(name, df, signal_column, outlier_neighbors[sensor_name], max_lof_samples)
+
+    for n_samples in synthetic_samples:
+        df, signal_column = synthetic_signal(n_samples)
+        benchmark(f"synthetic (corsano settings)", df, signal_column, outlier_neighbors['corsano'], max_lof_samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the outlier detection methods.")
+    parser.add_argument("--data_folder", default="../data", help="Folder with the recordings.")
+    parser.add_argument("--synthetic_samples", nargs='*', type=int, default=[], help="Lengths of synthetic signals to benchmark.")
+    parser.add_argument("--max_lof_samples", type=int, default=200000, help="Skip the sklearn LOF for longer signals.")
+    args = parser.parse_args()
+
+    main(args.data_folder, args.synthetic_samples, args.max_lof_samples)
@@ -0,0 +1,227 @@
+# This script benchmarks every step of the synchronization pipeline separately on synthetic recordings
+# (synthetic_recordings.py) of the four sensors with a given number of samples and event density. For every sensor and
+# size a reference recording is written as CSV file and a copy with a time drift is generated in memory, the reference
+# then runs through load_data, create_1D_signal (and the derivative for sensomative), detect_outliers, identify_events
+# and extract_event_information, the events are matched with compare_events_dtw against the drifted copy, aligned with
+# align_signals, resampled and saved in --output_format (stage save_dataframe_to_csv, also for the other formats). The runtimes (minimum and median of --repeats runs) are
+# printed and written as JSON file together with the git commit and the library versions, so that the results of two
+# commits can be compared with --compare.
+# Usage: python benchmark_pipeline.py [--sizes 10000 100000 1000000 10000000] [--sensors corsano sensomative]
+#                                     [--events_per_minute 1] [--repeats 3] [--output_format csv] [--output results.json]
+#                                     [--plot scaling.png]
+#        python benchmark_pipeline.py --compare baseline.json results.json [--tolerance 0.2]
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.outlier_detection import detect_outliers
+from pipeline_steps.event_detection import identify_events
+from pipeline_steps.event_information import extract_event_information
+from pipeline_steps.event_comparison import compare_events_dtw
+from pipeline_steps.signal_alignment import align_signals
+from utils.data_utils import load_data, create_1D_signal, calculate_1D_signal_derivative, resample, save_dataframe, OUTPUT_FORMATS
+from synthetic_recordings import SENSOR_PROFILES, write_recording, generate_recording
+
+outlier_neighbors = {'cosinuss': 400, 'corsano': 200, 'vivalink': 50, 'sensomative': 20}
+settings = {
+    'min_time_event': 0.5, 'min_outlier_fraction_event': 0.5, 'max_time_gap_events': 2,
+    'dtw_distance_threshold': 150, 'normalization_window_duration': 10
+}
+time_drift = 1.0        # s between the reference and the drifted copy
+STAGES = ['load_data', 'create_1D_signal', 'detect_outliers', 'identify_events', 'extract_event_information',
+          'compare_events_dtw', 'align_signals', 'resample', 'save_dataframe_to_csv']
+
+
+def detect_events(df, sensor_name, outlier_method, timings=None):
+    # steps from create_1D_signal to extract_event_information as in process_dataframe, each timed separately
+    timings = {} if timings is None else timings
+
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    signal_column = '1d_signal'
+    df = timed('create_1D_signal', create_1D_signal, df, sensor_name)
+    if sensor_name == 'sensomative':
+        start = time.perf_counter()
+        df = calculate_1D_signal_derivative(df, '1d_signal')
+        timings['create_1D_signal'] += time.perf_counter() - start
+        signal_column = '1d_signal_derivative'
+    outlier_flags = timed('detect_outliers', detect_outliers, df, signal_column, n_neighbors=outlier_neighbors[sensor_name], method=outlier_method)
+    events = timed('identify_events', identify_events, df, outlier_flags, time_column='time', threshold=settings['min_time_event'],
+                   min_outlier_percentage=settings['min_outlier_fraction_event'])
+    event_stats = timed('extract_event_information', extract_event_information, df, events, signal_column,
+                        settings['normalization_window_duration'], time_column='time')
+    return df, event_stats, signal_column
+
+
+def run_once(reference_file, align_df, align_events, sensor_name, outlier_method, output_folder, output_format='csv'):
+    timings = {}
+    start = time.perf_counter()
+    df1 = load_data(reference_file)
+    timings['load_data'] = time.perf_counter() - start
+
+    df1, reference_events, signal_column = detect_events(df1, sensor_name, outlier_method, timings)
+
+    start = time.perf_counter()
+    comparison_results = compare_events_dtw(reference_events, align_events, settings['max_time_gap_events'], settings['dtw_distance_threshold'])
+    timings['compare_events_dtw'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, df2_aligned = align_signals(df1, align_df.copy(), comparison_results, sensor_name, sensor_name, settings['dtw_distance_threshold'])
+    timings['align_signals'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resampled_df2 = resample(df2_aligned, df1, signal_column=signal_column)
+    timings['resample'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    save_dataframe(df2_aligned, reference_file, sensor_name, "aligned", output_folder, output_format)
+    save_dataframe(resampled_df2, reference_file, sensor_name, "resampled", output_folder, output_format)
+    timings['save_dataframe_to_csv'] = time.perf_counter() - start
+    return timings, len(reference_events), len(comparison_results)
+
+
+def benchmark(sensor_name, samples, events_per_minute, outlier_method, repeats, folder, output_format='csv'):
+    reference_file = os.path.join(folder, f"{sensor_name}_{samples}.csv")
+    write_recording(reference_file, sensor_name, samples, events_per_minute)
+    align_df, align_events, _ = detect_events(generate_recording(sensor_name, samples, events_per_minute, time_drift, noise_seed=1), sensor_name, outlier_method)
+
+    runs = []
+    for _ in range(repeats):
+        timings, events, matches = run_once(reference_file, align_df, align_events, sensor_name, outlier_method, os.path.join(folder, 'output'),
+                                            output_format)
+        runs.append(timings)
+        shutil.rmtree(os.path.join(folder, 'output'), ignore_errors=True)
+    os.remove(reference_file)
+
+    results = []
+    for stage in STAGES:
+        times = [timings[stage] for timings in runs]
+        results.append({'sensor': sensor_name, 'samples': samples, 'events': events, 'matches': matches, 'stage': stage,
+                        'time': min(times), 'median': float(np.median(times)), 'times': times})
+    return results
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'events_per_minute': args.events_per_minute,
+        'outlier_method': args.outlier_method,
+        'output_format': args.output_format,
+        'repeats': args.repeats,
+        'settings': settings
+    }
+
+
+def compare(baseline_file, results_file, tolerance):
+    # prints the runtime ratio of every stage and returns the number of stages slower than 1 + tolerance
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    with open(results_file) as f:
+        results = json.load(f)
+    baseline_times = {(r['sensor'], r['samples'], r['stage']): r['time'] for r in baseline['results']}
+
+    print(f"{baseline['environment']['commit']} -> {results['environment']['commit']}")
+    print(f"{'sensor':<12} {'samples':>9} {'stage':<26} {'baseline':>10} {'new':>10} {'ratio':>7}")
+    regressions = 0
+    for result in results['results']:
+        key = (result['sensor'], result['samples'], result['stage'])
+        if key not in baseline_times:
+            continue
+        ratio = result['time'] / baseline_times[key] if baseline_times[key] > 0 else np.inf
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = ' slower'
+            regressions += 1
+        elif ratio < 1 / (1 + tolerance):
+            flag = ' faster'
+        print(f"{result['sensor']:<12} {result['samples']:>9} {result['stage']:<26} {baseline_times[key]:>9.4f}s {result['time']:>9.4f}s {ratio:>7.2f}{flag}")
+    print(f"{regressions} stages slower than {1 + tolerance:.2f}x the baseline")
+    return regressions
+
+
+def plot_scaling(results, plot_file):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    sensors = sorted({result['sensor'] for result in results})
+    fig, axes = plt.subplots(1, len(sensors), figsize=(5 * len(sensors), 4), squeeze=False, sharey=True)
+    for ax, sensor_name in zip(axes[0], sensors):
+        for stage in STAGES:
+            points = sorted((r['samples'], r['time']) for r in results if r['sensor'] == sensor_name and r['stage'] == stage)
+            ax.loglog([p[0] for p in points], [p[1] for p in points], marker='o', label=stage)
+        ax.set_title(sensor_name)
+        ax.set_xlabel('samples')
+        ax.grid(True, which='both', alpha=0.3)
+    axes[0][0].set_ylabel('runtime (s)')
+    axes[0][-1].legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(plot_file)
+    print(f"Scaling plot saved to: {plot_file}")
+
+
+def main(args):
+    folder = tempfile.mkdtemp(dir=args.folder)
+    results = []
+    print(f"{'sensor':<12} {'samples':>9} {'events':>7} {'stage':<26} {'min':>10} {'median':>10}")
+    try:
+        for samples in args.sizes:
+            for sensor_name in args.sensors:
+                for result in benchmark(sensor_name, samples, args.events_per_minute, args.outlier_method, args.repeats, folder, args.output_format):
+                    results.append(result)
+                    print(f"{sensor_name:<12} {samples:>9} {result['events']:>7} {result['stage']:<26} {result['time']:>9.4f}s {result['median']:>9.4f}s")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(args), 'results': results}, f, indent=4)
+    print(f"Results saved to: {args.output}")
+    if args.plot:
+        plot_scaling(results, args.plot)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every step of the synchronization pipeline on synthetic recordings.")
+    parser.add_argument("--sizes", nargs='*', type=int, default=[10000, 100000, 1000000, 10000000], help="Numbers of samples per recording.")
+    parser.add_argument("--sensors", nargs='*', default=list(SENSOR_PROFILES), choices=list(SENSOR_PROFILES), help="Sensors to benchmark.")
+    parser.add_argument("--events_per_minute", type=float, default=1.0, help="Event density of the synthetic recordings.")
+    parser.add_argument("--outlier_method", default='rolling_mad',
+                        help="Outlier detection method. The LOF methods flag the values of frequent events as inliers on long recordings.")
+    parser.add_argument("--output_format", default='csv', choices=list(OUTPUT_FORMATS), help="Format of the saved files.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per sensor and size.")
+    parser.add_argument("--folder", default=None, help="Folder for the temporary recordings (default: system temporary folder).")
+    parser.add_argument("--output", default="benchmark_pipeline.json", help="JSON file for the results.")
+    parser.add_argument("--plot", default=None, help="Save a log-log plot of the runtimes over the number of samples to this file.")
+    parser.add_argument("--compare", nargs=2, metavar=('BASELINE', 'RESULTS'), help="Compare two result files instead of running the benchmark.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown reported as regression by --compare.")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0)
+    main(args)
@@ -0,0 +1,54 @@
+# This script measures the startup time of the pipeline (importing main.py in a fresh interpreter, as run_tests.py
+# --subprocess does for every pair) and optionally lists the slowest imports. That runs without plotting do not import
+# the plotting libraries is checked by tests/test_imports.py.
+# Usage: python benchmark_startup.py [--repeats 5] [--importtime]
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import numpy as np
+
+pipeline_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline')
+
+
+def startup_times(repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f"import sys; sys.path.append({pipeline_folder!r}); import main"], check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def slowest_imports(count=15):
+    # -X importtime writes the cumulative import time (in us) of every module to stderr
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import sys; sys.path.append({pipeline_folder!r}); import main"],
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line.split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(repeats, importtime):
+    times = startup_times(repeats)
+    print(f"Startup (import main): median {np.median(times):.3f}s, min {min(times):.3f}s over {repeats} runs")
+    if importtime:
+        print(f"{'cumulative':>12}  module")
+        for cumulative, module in slowest_imports():
+            print(f"{cumulative / 1e6:>11.3f}s  {module}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the startup time of the pipeline.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of fresh interpreters to time.")
+    parser.add_argument("--importtime", action="store_true", help="List the slowest imports of main.py.")
+    args = parser.parse_args()
+
+    sys.exit(main(args.repeats, args.importtime))
@@ -0,0 +1,68 @@
+# Synthetic recordings for the benchmarks. The recordings have the sampling rate, the channels and roughly the value
+# range of the sensors in the data folder: sensor noise around a resting posture and a short burst of movement
+# (accelerometers) or a change of the sitting pressure (sensomative) every 1 / events_per_minute minutes. The bursts
+# of every event are the same in all recordings with the same seed, so the events of a recording and of a drifted copy match.
+
+import numpy as np
+import pandas as pd
+
+from utils.data_utils import SENSOR_COLUMNS
+
+# Sampling rate (Hz), resting value and noise of the channels per sensor
+SENSOR_PROFILES = {
+    'cosinuss': {'sampling_rate': 100.0, 'rest': [0.1, -0.2, -0.7], 'noise': 0.05, 'burst': 1.5, 'decimals': 3},
+    'corsano': {'sampling_rate': 32.0, 'rest': [340, -120, -45], 'noise': 20, 'burst': 600, 'decimals': 0},
+    'vivalink': {'sampling_rate': 5.0, 'rest': [-795, 1720, 659], 'noise': 25, 'burst': 900, 'decimals': 0},
+    'sensomative': {'sampling_rate': 8.8, 'rest': [20, 0, 16, 3, 36, 9, 21, 37, 12, 9, 5, 26, 139], 'noise': 1, 'burst': 60, 'decimals': 0},
+}
+BURST_DURATION = 1.5    # s
+START_TIME = 1.6e9
+
+
+def generate_recording(sensor_name, samples, events_per_minute=1.0, time_drift=0.0, first_sample=0, seed=0, noise_seed=None):
+    """
+    Returns samples rows of a synthetic recording of sensor_name (time, timestamp and the sensor channels) starting at
+    sample first_sample. The times are shifted by time_drift seconds. The bursts depend on seed, the sensor noise on
+    noise_seed (default: seed) and on first_sample.
+    """
+    profile = SENSOR_PROFILES[sensor_name]
+    columns = SENSOR_COLUMNS[sensor_name]
+    rate = profile['sampling_rate']
+    rng = np.random.default_rng([seed if noise_seed is None else noise_seed, first_sample])
+    index = np.arange(first_sample, first_sample + samples)
+
+    values = np.asarray(profile['rest'], dtype=float) + rng.normal(0, profile['noise'], (samples, len(columns)))
+    if events_per_minute > 0:
+        interval = int(60 * rate / events_per_minute)
+        burst_samples = max(2, min(int(BURST_DURATION * rate), interval // 2))
+        # event k occupies the samples k * interval + interval // 2 + [0, burst_samples)
+        first_event = max(0, (first_sample - interval // 2 - burst_samples) // interval + 1)
+        last_event = (first_sample + samples - 1 - interval // 2) // interval
+        for event_number in range(first_event, last_event + 1):
+            # the burst of an event only depends on the seed and the event number, not on the chunk
+            event_rng = np.random.default_rng([seed, event_number, 1])
+            burst = event_rng.uniform(0.5, 2.0) * event_rng.normal(0, profile['burst'], (burst_samples, len(columns)))
+            if sensor_name == 'sensomative':
+                # shifting the weight: the pressure steps up and slowly returns
+                burst = np.abs(burst) * np.linspace(1, 0.3, burst_samples)[:, None]
+            burst_start = event_number * interval + interval // 2 - first_sample
+            lo, hi = max(0, burst_start), min(samples, burst_start + burst_samples)
+            values[lo:hi] += burst[lo - burst_start:hi - burst_start]
+    if sensor_name == 'sensomative':
+        values = np.maximum(values, 0)
+    values = np.round(values, profile['decimals'])
+    if profile['decimals'] == 0:
+        values = values.astype(np.int64)
+
+    df = pd.DataFrame(values, columns=columns)
+    df.insert(0, 'time', np.round(START_TIME + index / rate + time_drift, 6))
+    df['timestamp'] = pd.to_datetime(df['time'], unit='s')
+    return df
+
+
+def write_recording(path, sensor_name, samples, events_per_minute=1.0, time_drift=0.0, seed=0, noise_seed=None, chunk_size=1000000):
+    """Writes a synthetic recording as CSV file in chunks, so that it can be larger than the memory."""
+    for first_sample in range(0, samples, chunk_size):
+        df = generate_recording(sensor_name, min(chunk_size, samples - first_sample), events_per_minute, time_drift, first_sample,
+                                seed, noise_seed)
+        df.to_csv(path, index=False, mode='w' if first_sample == 0 else 'a', header=first_sample == 0)
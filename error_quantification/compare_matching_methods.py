@@ -0,0 +1,53 @@
+# This script compares the accuracy of the event matching methods (DTW and cross-correlation), of the event
+# assignments (greedy and global) and of the drift models (piecewise, affine, spline) on the test data. For every combination the test runs are executed (see run_tests.py) and the time differences between the aligned files and
+# the ground truth are collected as in error_quantification.py. MAE, standard deviation and RMSE per sensor type and
+# drift level are printed side by side and saved to matching_methods_comparison.csv.
+# Note: the aligned files in the data folder are overwritten by every run, the last method's files remain.
+# Usage: python compare_matching_methods.py [--methods dtw cca] [--assignments greedy global]
+#                                    [--drift_models piecewise affine spline] [--workers N]
+
+import os
+import time
+import argparse
+import pandas as pd
+
+import run_tests
+from error_quantification import collect_time_differences, calculate_statistics
+
+
+def main(methods, assignments, workers, drift_models=("piecewise",), base_folder="../data"):
+    rows = []
+    for method, assignment, drift_model in [(method, assignment, drift_model) for method in methods
+                                            for assignment in assignments for drift_model in drift_models]:
+        start = time.perf_counter()
+        run_tests.main(workers, False, {"event_matching_method": method, "event_assignment": assignment, "drift_model": drift_model})
+        runtime = time.perf_counter() - start
+        results = calculate_statistics(collect_time_differences(base_folder, workers))
+        for sensor_type, drift_data in results.items():
+            for drift_level, stats in drift_data.items():
+                rows.append({
+                    'Method': f"{method} {assignment} {drift_model}",
+                    'Sensor Type': sensor_type,
+                    'Drift (in s)': float(drift_level),
+                    'MAE': stats['MAE'],
+                    'Standard Deviation': stats['Standard Deviation'],
+                    'RMSE': stats['RMSE'],
+                    'Runtime (in s)': round(runtime, 1)
+                })
+
+    df_results = pd.DataFrame(rows)
+    df_results.to_csv('matching_methods_comparison.csv', index=False)
+    table = df_results.pivot_table(index=['Sensor Type', 'Drift (in s)'], columns='Method', values=['MAE', 'RMSE'])
+    print(table.to_string())
+    print(df_results.groupby('Method')['Runtime (in s)'].first().to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the accuracy of the event matching methods.")
+    parser.add_argument("--methods", nargs='*', default=["dtw", "cca"], choices=["dtw", "cca"], help="Methods to compare.")
+    parser.add_argument("--assignments", nargs='*', default=["global"], choices=["greedy", "global"], help="Event assignments to compare.")
+    parser.add_argument("--drift_models", nargs='*', default=["piecewise"], choices=["piecewise", "affine", "spline"], help="Drift models to compare.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    args = parser.parse_args()
+
+    main(args.methods, args.assignments, args.workers, args.drift_models)
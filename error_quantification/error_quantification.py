@@ -1,15 +1,34 @@
 # This script was used to quantify the error in the synchronizated data and ground truth data.
 # It goes through the current folder structure, looks for an 'aligned_' file, finds the corresponding ground truth file and then
 # calculates the (absolute) time difference between the aligned data and the ground truth data.
+# Without an 'aligned_' file (output_content: 'mapping') the aligned times are computed from the time map (time_map.json)
+# and the times of the file to align.
 # It plots the found points, calculates the average, standard deviation and RMSE of the time differences 
 # and saves the results in the error_quantification.csv
+# The folder tree is scanned once, every ground truth file is read once for all its aligned files (in --workers processes)
+# and the time differences are stored per aligned file in error_quantification_index.json, so a re-run only evaluates
+# new or changed aligned files (--index_file '' evaluates all). --legacy runs the original traversal.
+# Usage: python error_quantification.py [--base_folder ../data] [--workers N] [--index_file error_quantification_index.json] [--legacy]
 
 # Note: vivalink folder must have same structure as the other folders, so not vivalink/yyyymmdd/drifted/... but vivalink/yyyymmdd/drifted/...
 
 import os
+import sys
+import json
+import argparse
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.time_mapping import TimeMap
+from utils.data_utils import load_data, read_output_file, find_binary_file
+
+# Time differences of the last run per aligned file, re-runs only evaluate new or changed aligned files
+INDEX_FILE = 'error_quantification_index.json'
+INDEX_VERSION = 1
 
 def find_gt_file(sensor_folder, start_or_end):
     for root, _, files in os.walk(sensor_folder):
@@ -22,11 +41,39 @@ def find_aligned_file(aligned_subfolder):
     for file in os.listdir(aligned_subfolder):
         if file.startswith("aligned_"):
             return os.path.join(aligned_subfolder, file)
+    if os.path.isfile(os.path.join(aligned_subfolder, "time_map.json")):
+        return os.path.join(aligned_subfolder, "time_map.json")
     return None
 
+def read_aligned_file(aligned_file):
+    # the aligned file is saved as CSV (also gzip compressed), Parquet or Feather (output_format in config.yaml)
+    if aligned_file.endswith("time_map.json"):
+        return aligned_times_from_time_map(aligned_file)
+    return read_output_file(aligned_file)
+
+
+def aligned_times_from_time_map(time_map_file):
+    # maps the times of the file to align with the time map, the same times as in its aligned file
+    time_map = TimeMap.load(time_map_file)
+    df = load_data(time_map_file_to_align(time_map_file, time_map), columns=['time'])
+    return pd.DataFrame({'time': time_map(df['time'].to_numpy())})
+
+
+def time_map_file_to_align(time_map_file, time_map=None):
+    # the file to align of the time map (provenance), or the file named like the folder of the time map next to the
+    # aligned_to_<sensor> folder if it was moved
+    if time_map is None:
+        time_map = TimeMap.load(time_map_file)
+    file_to_align = time_map.provenance.get('file_to_align')
+    if not file_to_align or not os.path.isfile(file_to_align):
+        aligned_subfolder = os.path.dirname(os.path.abspath(time_map_file))
+        file_to_align = os.path.join(aligned_subfolder, "../..", f"{os.path.basename(aligned_subfolder)}.csv")
+    return file_to_align
+
+
 def process_aligned_and_gt_files(aligned_file, gt_file, time_differences, sensor_type, drift_level):
     df_gt = pd.read_csv(gt_file)
-    df_aligned = pd.read_csv(aligned_file)
+    df_aligned = read_aligned_file(aligned_file)
 
     synch_points = df_gt[df_gt['alignment_point'] == 1]
 
@@ -123,7 +170,176 @@ def plot_results(results):
     plt.savefig('error_quantification_plots.png')
     plt.show()
 
-def main(base_folder):
+def collect_time_differences(base_folder, workers=1, index_file=None):
+    """
+    Collects the time differences between the aligned files under base_folder and their ground truth files, grouped by
+    sensor type and drift level (the same differences, in the same order, as collect_time_differences_legacy).
+    The folder tree is scanned once, every ground truth file is read once for all its aligned files and the groups are
+    evaluated in workers processes. With index_file the differences of every aligned file are stored there and reused by
+    the next run as long as the aligned file and its ground truth file (for a time map also the file to align it maps)
+    are unchanged (size and modification time).
+    """
+    pairs = scan_output_tree(base_folder)
+    index = load_index(index_file) if index_file else {}
+    signatures = {aligned_file: index_signature(aligned_file, gt_file) for aligned_file, gt_file, _, _ in pairs}
+
+    groups = {}
+    for aligned_file, gt_file, _, _ in pairs:
+        entry = index.get(os.path.abspath(aligned_file))
+        if entry is None or entry['signature'] != signatures[aligned_file] or entry['ground_truth'] != os.path.abspath(gt_file):
+            groups.setdefault(gt_file, []).append(aligned_file)
+
+    evaluated = {}
+    if workers > 1 and len(groups) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(evaluate_ground_truth, groups.keys(), groups.values()):
+                evaluated.update(result)
+    else:
+        for gt_file, aligned_files in groups.items():
+            evaluated.update(evaluate_ground_truth(gt_file, aligned_files))
+    print(f"Evaluated {len(evaluated)} of {len(pairs)} aligned files ({len(groups)} ground truth files read)")
+
+    # the new index only keeps the aligned files found in this run
+    time_differences = {}
+    new_index = {}
+    for aligned_file, gt_file, sensor_type, drift_level in pairs:
+        key = os.path.abspath(aligned_file)
+        if aligned_file in evaluated:
+            new_index[key] = {'signature': signatures[aligned_file], 'ground_truth': os.path.abspath(gt_file),
+                              'differences': evaluated[aligned_file]}
+        else:
+            new_index[key] = index[key]
+        differences = new_index[key]['differences']
+        if differences:
+            time_differences.setdefault(sensor_type, {}).setdefault(drift_level, []).extend(differences)
+
+    if index_file and new_index != index:
+        save_index(index_file, new_index)
+    return time_differences
+
+
+def scan_output_tree(base_folder):
+    # Walks base_folder once and returns the (aligned file, ground truth file, sensor type, drift level) of every drift
+    # folder, in the order of the nested folder loops of collect_time_differences_legacy
+    tree = {root: (folders, files) for root, folders, files in os.walk(base_folder, followlinks=True)}
+    pairs = []
+    ground_truth_files = {}
+    for user_folder in tree[base_folder][0] if base_folder in tree else []:
+        user_path = os.path.join(base_folder, user_folder)
+        for sensor_folder in tree[user_path][0]:
+            sensor_path = os.path.join(user_path, sensor_folder)
+            sensor_type = "Pressure Mat" if "sensomative" in sensor_folder.lower() else "Accelerometer"
+            drifted_folder_path = os.path.join(sensor_path, 'drifted')
+            if drifted_folder_path not in tree:
+                continue
+            for start_end_folder in tree[drifted_folder_path][0]:
+                start_end_path = os.path.join(drifted_folder_path, start_end_folder)
+                start_or_end = "start" if "start" in start_end_folder.lower() else "end"
+                for aligned_to_folder in tree[start_end_path][0]:
+                    aligned_to_path = os.path.join(start_end_path, aligned_to_folder)
+                    for drift_folder in tree[aligned_to_path][0]:
+                        drift_folder_path = os.path.join(aligned_to_path, drift_folder)
+                        drift_level = drift_folder.split("_")[-1].replace("timedrift", "").replace("s", "")
+
+                        aligned_file = _aligned_file_in(drift_folder_path, tree[drift_folder_path][1])
+                        if not aligned_file:
+                            print(f"No aligned file found in {drift_folder_path}")
+                            continue
+                        key = (sensor_path, start_or_end)
+                        if key not in ground_truth_files:
+                            ground_truth_files[key] = _gt_file_in(tree, sensor_path, start_or_end)
+                        if ground_truth_files[key]:
+                            pairs.append((aligned_file, ground_truth_files[key], sensor_type, drift_level))
+                        else:
+                            print(f"No GT file found for {os.path.abspath(sensor_path)} matching '{start_or_end}'")
+    return pairs
+
+
+def _aligned_file_in(folder, files):
+    # same choice as find_aligned_file
+    for file in files:
+        if file.startswith("aligned_"):
+            return os.path.join(folder, file)
+    if "time_map.json" in files:
+        return os.path.join(folder, "time_map.json")
+    return None
+
+
+def _gt_file_in(tree, folder, start_or_end):
+    # same search (top-down, like os.walk) as find_gt_file, on the scanned tree
+    folders, files = tree[folder]
+    for file in files:
+        if start_or_end in file and 'synched_to' in file:
+            return os.path.join(folder, file)
+    for subfolder in folders:
+        gt_file = _gt_file_in(tree, os.path.join(folder, subfolder), start_or_end)
+        if gt_file:
+            return gt_file
+    return None
+
+
+def evaluate_ground_truth(gt_file, aligned_files):
+    """
+    Reads gt_file once and returns {aligned_file: time differences} for all aligned_files: the absolute difference
+    between the ground truth time and the aligned time at every alignment point (row index) of the ground truth.
+    """
+    df_gt = pd.read_csv(gt_file, usecols=lambda column: column in ('time', 'alignment_point'))
+    if 'alignment_point' not in df_gt.columns:
+        return {aligned_file: [] for aligned_file in aligned_files}
+    points = np.flatnonzero(df_gt['alignment_point'].to_numpy() == 1)
+    gt_times = df_gt['time'].to_numpy(dtype=float)[points]
+
+    differences = {}
+    for aligned_file in aligned_files:
+        aligned_times = read_aligned_times(aligned_file)
+        valid = points < len(aligned_times)
+        differences[aligned_file] = np.abs(gt_times[valid] - aligned_times[points[valid]]).tolist()
+    return differences
+
+
+def read_aligned_times(aligned_file):
+    # only the time column of the aligned file (or the times mapped with the time map)
+    if aligned_file.endswith("time_map.json"):
+        return aligned_times_from_time_map(aligned_file)['time'].to_numpy(dtype=float)
+    return read_output_file(aligned_file, columns=['time'])['time'].to_numpy(dtype=float)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def index_signature(aligned_file, gt_file):
+    # signatures of the files the differences of an aligned file are computed from: a time map maps the times of the
+    # file to align (or of its converted binary file, which load_data reads instead)
+    signature = [file_signature(aligned_file), file_signature(gt_file)]
+    if aligned_file.endswith("time_map.json"):
+        file_to_align = time_map_file_to_align(aligned_file)
+        signature.append(file_signature(find_binary_file(file_to_align) or file_to_align))
+    return signature
+
+
+def load_index(index_file):
+    # {absolute aligned file: {'signature', 'ground_truth', 'differences'}} of the last run, empty if missing or outdated
+    if not os.path.isfile(index_file):
+        return {}
+    with open(index_file) as file:
+        index = json.load(file)
+    if index.get('version') != INDEX_VERSION:
+        return {}
+    return index['files']
+
+
+def save_index(index_file, index):
+    temporary_file = f"{index_file}.tmp"
+    with open(temporary_file, 'w') as file:
+        json.dump({'version': INDEX_VERSION, 'files': index}, file)
+    os.replace(temporary_file, index_file)
+
+
+def collect_time_differences_legacy(base_folder):
+    # Original nested os.listdir traversal with one os.walk and ground truth read per aligned file, kept as reference for
+    # collect_time_differences
     time_differences = {}
     for user_folder in os.listdir(base_folder):
         user_path = os.path.join(base_folder, user_folder)
@@ -161,6 +377,13 @@ def main(base_folder):
                                                     print(f"No GT file found for {sensor_parent_folder} matching '{start_or_end}'")
                                             else:
                                                 print(f"No aligned file found in {drift_folder_path}")
+    return time_differences
+
+def main(base_folder, workers, index_file, legacy=False):
+    if legacy:
+        time_differences = collect_time_differences_legacy(base_folder)
+    else:
+        time_differences = collect_time_differences(base_folder, workers, index_file)
     print(time_differences)
     results = calculate_statistics(time_differences)
     print_statistics(results)
@@ -168,5 +391,11 @@ def main(base_folder):
     plot_results(results)
 
 if __name__ == "__main__":
-    base_folder = "../data"
-    main(base_folder)
+    parser = argparse.ArgumentParser(description="Quantify the synchronization error of the aligned files in the data folder.")
+    parser.add_argument("--base_folder", default="../data", help="Folder with the user folders of the test runs.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes reading the files.")
+    parser.add_argument("--index_file", default=INDEX_FILE, help="Results of the last run, reused for unchanged files ('' to disable).")
+    parser.add_argument("--legacy", action="store_true", help="Use the original traversal (no index, one process).")
+    args = parser.parse_args()
+
+    main(args.base_folder, args.workers, args.index_file, args.legacy)
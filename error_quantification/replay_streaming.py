@@ -0,0 +1,142 @@
+# This script replays the test data through the streaming synchronization mode and compares it to the batch pipeline.
+# For every reference/align pair in test_run_configurations.json both files are fed in chunks of a given duration
+# (interleaved by time) to the StreamingSynchronizer. The accepted sync points and the corrected times of the align file
+# are then compared to the output of the batch pipeline (process_signal -> compare_events_dtw -> align_signals).
+# The recordings are shorter than --history_duration, so this replay must give the batch result exactly. Every pair is
+# replayed again with --bounded_history_duration (shorter than the recordings, 0 to skip), where samples leave the
+# buffer and events are frozen: the share of the batch sync points found, the additional sync points and the difference
+# of the corrected times to the batch result are reported for it. Both use --bounded_outlier_method: LOF only compares
+# the samples in the buffer, so with 'lof' the outliers of a bounded history differ from the batch pipeline anyway,
+# the rolling detectors only depend on the neighbouring samples.
+# The script exits with 1 if the replay with the full history differs from the batch pipeline.
+# Usage: python replay_streaming.py [--chunk_duration 5] [--history_duration 300] [--bounded_history_duration 30]
+#                                   [--bounded_outlier_method rolling_mad]
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from main import process_signal
+from streaming import StreamingSynchronizer
+from pipeline_steps.event_comparison import compare_events_dtw
+from pipeline_steps.signal_alignment import align_signals
+from utils.data_utils import load_data
+from run_tests import get_files_in_folder
+
+outlier_settings = {'cosinuss': 400, 'corsano': 200, 'vivalink': 50, 'sensomative': 20}
+diverse_settings = {
+    'min_time_event': 0.5,
+    'min_outlier_fraction_event': 0.5,
+    'max_time_gap_events': 2.0,
+    'dtw_distance_threshold_accelerator': 150,
+    'dtw_distance_threshold_sensomative': 150,
+    'normalization_window_duration': 10,
+}
+
+
+def run_batch(reference_file, file_to_align, sensor_name_reference, sensor_name_align, diverse_settings=diverse_settings):
+    df1, reference_events, _ = process_signal(reference_file, sensor_name_reference, outlier_settings[sensor_name_reference], diverse_settings)
+    df2, align_events, _ = process_signal(file_to_align, sensor_name_align, outlier_settings[sensor_name_align], diverse_settings)
+    if sensor_name_reference == 'sensomative' or sensor_name_align == 'sensomative':
+        dtw_distance_threshold = diverse_settings['dtw_distance_threshold_sensomative']
+    else:
+        dtw_distance_threshold = diverse_settings['dtw_distance_threshold_accelerator']
+    comparison_results = compare_events_dtw(reference_events, align_events, diverse_settings['max_time_gap_events'], dtw_distance_threshold)
+    _, df2_aligned = align_signals(df1, df2, comparison_results, sensor_name_reference, sensor_name_align, dtw_distance_threshold)
+    sync_times = df1['time'][df1['sync_point'] == 1].to_numpy()
+    return sync_times, df2_aligned['time'].to_numpy()
+
+
+def run_streaming(reference_file, file_to_align, sensor_name_reference, sensor_name_align, chunk_duration, history_duration,
+                  diverse_settings=diverse_settings):
+    df1 = load_data(reference_file)
+    df2 = load_data(file_to_align)
+    synchronizer = StreamingSynchronizer(sensor_name_reference, sensor_name_align, outlier_settings, diverse_settings,
+                                         history_duration=history_duration)
+    start = min(df1['time'].iloc[0], df2['time'].iloc[0])
+    end = max(df1['time'].iloc[-1], df2['time'].iloc[-1])
+    for chunk_start in np.arange(start, end + chunk_duration, chunk_duration):
+        chunk_end = chunk_start + chunk_duration
+        synchronizer.push_reference(df1[(df1['time'] >= chunk_start) & (df1['time'] < chunk_end)])
+        synchronizer.push_align(df2[(df2['time'] >= chunk_start) & (df2['time'] < chunk_end)])
+    synchronizer.finish()
+    sync_times = np.array(sorted(reference_time for _, reference_time in synchronizer.sync_points))
+    frozen_events = synchronizer.reference.number_of_frozen_events + synchronizer.align.number_of_frozen_events
+    return sync_times, synchronizer.correct_times(df2['time'].to_numpy()), frozen_events
+
+
+def compare(batch_sync_times, batch_times, streaming_sync_times, streaming_times):
+    # batch sync points also found by the streaming mode, additional streaming sync points, largest time difference
+    found = int(np.isin(batch_sync_times, streaming_sync_times).sum())
+    additional = len(streaming_sync_times) - int(np.isin(streaming_sync_times, batch_sync_times).sum())
+    return found, additional, float(np.max(np.abs(batch_times - streaming_times)))
+
+
+def main(chunk_duration, history_duration, bounded_history_duration, bounded_outlier_method):
+    with open("test_run_configurations.json", "r") as json_file:
+        data = json.load(json_file)
+    bounded_settings = dict(diverse_settings, outlier_methods={sensor_name: bounded_outlier_method for sensor_name in outlier_settings})
+
+    identical_pairs = 0
+    total_pairs = 0
+    # batch sync points, found and additional sync points, time differences and frozen events with the bounded history
+    bounded = {'identical': 0, 'batch': 0, 'found': 0, 'additional': 0, 'time_differences': [], 'frozen_events': 0}
+    for user, user_data in data.items():
+        for reference_data in user_data:
+            reference_file = reference_data["reference_file"]
+            sensor_name_reference = reference_data["sensor_name_reference"]
+            for alignment in reference_data["alignments"]:
+                for file_to_align in get_files_in_folder(alignment["files_folder"]):
+                    sensor_name_align = alignment["sensor_name_align"]
+                    batch_sync_times, batch_times = run_batch(reference_file, file_to_align, sensor_name_reference, sensor_name_align)
+                    streaming_sync_times, streaming_times, _ = run_streaming(reference_file, file_to_align, sensor_name_reference, sensor_name_align,
+                                                                             chunk_duration, history_duration)
+                    same_sync_points = np.array_equal(np.sort(batch_sync_times), streaming_sync_times)
+                    max_time_difference = np.max(np.abs(batch_times - streaming_times))
+                    total_pairs += 1
+                    identical_pairs += same_sync_points
+                    line = (f"{user} {os.path.basename(file_to_align)} -> {sensor_name_reference}: "
+                            f"sync points batch/streaming {len(batch_sync_times)}/{len(streaming_sync_times)}, "
+                            f"identical: {same_sync_points}, max time difference: {max_time_difference:.6f}s")
+
+                    if bounded_history_duration:
+                        bounded_batch_sync_times, bounded_batch_times = run_batch(reference_file, file_to_align, sensor_name_reference, sensor_name_align,
+                                                                                  bounded_settings)
+                        bounded_sync_times, bounded_times, frozen_events = run_streaming(reference_file, file_to_align, sensor_name_reference, sensor_name_align,
+                                                                                         chunk_duration, bounded_history_duration, bounded_settings)
+                        found, additional, time_difference = compare(bounded_batch_sync_times, bounded_batch_times, bounded_sync_times, bounded_times)
+                        bounded['identical'] += np.array_equal(np.sort(bounded_batch_sync_times), bounded_sync_times)
+                        bounded['batch'] += len(bounded_batch_sync_times)
+                        bounded['found'] += found
+                        bounded['additional'] += additional
+                        bounded['time_differences'].append(time_difference)
+                        bounded['frozen_events'] += frozen_events
+                        line += (f" | history {bounded_history_duration:g}s: found {found}/{len(bounded_batch_sync_times)}, additional {additional}, "
+                                 f"max time difference: {time_difference:.6f}s, frozen events: {frozen_events}")
+                    print(line)
+
+    print(f"\nIdentical sync points for {identical_pairs} of {total_pairs} pairs")
+    if bounded_history_duration and total_pairs:
+        time_differences = np.array(bounded['time_differences'])
+        print(f"History {bounded_history_duration:g}s ({bounded_outlier_method}): identical sync points for {bounded['identical']} of {total_pairs} pairs, "
+              f"{bounded['found']} of {bounded['batch']} batch sync points found ({bounded['found'] / max(bounded['batch'], 1):.1%}), "
+              f"{bounded['additional']} additional, {bounded['frozen_events'] / total_pairs:.1f} frozen events per pair")
+        print(f"Max time difference to the batch result: median {np.median(time_differences):.6f}s, "
+              f"95th percentile {np.quantile(time_differences, 0.95):.6f}s, max {time_differences.max():.6f}s")
+    return 0 if identical_pairs == total_pairs else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the test data through the streaming synchronization mode.")
+    parser.add_argument("--chunk_duration", type=float, default=5, help="Duration (in s) of the chunks fed to the synchronizer.")
+    parser.add_argument("--history_duration", type=float, default=300, help="Time (in s) of samples kept per feed.")
+    parser.add_argument("--bounded_history_duration", type=float, default=30,
+                        help="Shorter history (in s) replayed additionally to test the bounded buffer, 0 to skip.")
+    parser.add_argument("--bounded_outlier_method", default="rolling_mad", help="Outlier detection method of the bounded replay and its batch run.")
+    args = parser.parse_args()
+
+    sys.exit(main(args.chunk_duration, args.history_duration, args.bounded_history_duration, args.bounded_outlier_method))
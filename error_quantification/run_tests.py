@@ -1,17 +1,43 @@
 # this is a script to run the synchronization pipeline on the test data
 # test data is defined in the test_run_configurations.json file to be present in the same directory
 # it will run the pipeline for each user and reference file with all files in the specified align folder
+# by default the pipeline runs in this process: each reference file is processed once, handed once to every worker of a
+# process pool and the files to align are distributed over the workers. With --subprocess main.py is started once per
+# pair instead.
+# Usage: python run_tests.py [--workers N] [--subprocess] [--matching_method dtw|cca] [--event_assignment greedy|global]
+#                     [--drift_model piecewise|affine|spline] [--coarse_alignment] [--instrumentation] [--instrumentation_profiler cprofile|tracemalloc]
+#                     [--cache_folder cache]
+# With --instrumentation every pair saves its pipeline_report.json next to its outputs and the batch runner aggregates
+# the stage reports of all pairs and references into pipeline_report.json in this folder.
 
 import os
+import sys
 import json
+import time
 import yaml
+import argparse
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
 
-def generate_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align, output_dir="configs"):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from main import process_signal, run_alignment, settings_from_config
+from utils.data_utils import save_yaml
+from utils.cache import load_cache_stats, flush_cache_stats
+from utils.instrumentation import get_instrumentation, aggregate_reports, format_totals
+
+# processed reference and drifted files are cached across test runs (--cache_folder, '' to disable), the entries are
+# keyed by the pipeline sources, so they are recomputed after the code changed
+CACHE_FOLDER_PATH = "cache"
+REPORT_FILE = "pipeline_report.json"
+
+# processed reference files of a worker process, set once by init_worker
+worker_references = {}
+
+def build_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align, overrides=None):
     """
-    Generate a config.yaml file for a given reference and file to align.
+    Build the config for a given reference and file to align.
     """
-    os.makedirs(output_dir, exist_ok=True)
     config = {
         "reference_file": reference_file,
         "file_to_align": file_to_align,
@@ -21,26 +47,59 @@ def generate_config(reference_file, sensor_name_reference, file_to_align, sensor
         "outlier_neighbors_corsano": 200, # 200
         "outlier_neighbors_vivalink": 50, # 50
         "outlier_neighbors_sensomative": 20, # 20
+        "outlier_method_cosinuss": "lof",
+        "outlier_method_corsano": "lof",
+        "outlier_method_vivalink": "lof",
+        "outlier_method_sensomative": "lof",
         "min_time_event": 0.5,
         "min_outlier_fraction_event": 0.5,
         "max_time_gap_events": 2.0, # 3s
         "dtw_distance_threshold_accelerator": 150, # 150
         "dtw_distance_threshold_sensomative": 150, # 150
+        "dtw_window_fraction": 0.2,
+        "event_matching_method": "dtw",
+        "cca_distance_threshold_accelerator": 0.5,
+        "cca_distance_threshold_sensomative": 0.8,
+        "event_assignment": "global",
+        "cca_sampling_rate": 25,
+        "drift_model": "piecewise",
+        "drift_inlier_threshold": 0.25,
         "normalization_window_duration": 10,
+        "coarse_alignment": False,
+        "cache_folder_path": CACHE_FOLDER_PATH,
+        "cache_max_size_mb": 500,
+        "instrumentation": False,
+        "instrumentation_profiler": "",
         "save_output_files": True,
+        "output_format": "csv",
+        "output_content": "full",
+        "background_writes": False,
         "output_folder_path": os.path.dirname(file_to_align),
         "plotting": False,
         "scaling_factor_reference": 1.0,
         "scaling_factor_align": 1.0,
     }
+    config.update(overrides or {})
+    return config
 
-    config_file_name = f"{os.path.basename(reference_file)}_{os.path.basename(file_to_align)}.yaml"
+def save_config(config, output_dir="configs"):
+    """
+    Save a config built by build_config as a config.yaml file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    config_file_name = f"{os.path.basename(config['reference_file'])}_{os.path.basename(config['file_to_align'])}.yaml"
     config_file_path = os.path.join(output_dir, config_file_name)
     with open(config_file_path, "w") as config_file:
         yaml.dump(config, config_file)
 
     return config_file_path
 
+def generate_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align, output_dir="configs", overrides=None):
+    """
+    Generate a config.yaml file for a given reference and file to align.
+    """
+    return save_config(build_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align, overrides), output_dir)
+
 def run_program(config_file):
     """
     Run the main.py script with the given config file.
@@ -64,11 +123,12 @@ def get_files_in_folder(folder_path):
     ]
 
 
-def process_user_data(user_data, user_name):
+def process_user_data(user_data, user_name, overrides=None):
     """
-    Process the data for a single user.
+    Process the data for a single user, starting main.py for every pair.
     """
     print(f"Processing data for user: {user_name}")
+    number_of_pairs = 0
 
     for reference_data in user_data:
         reference_file = reference_data["reference_file"]
@@ -83,18 +143,139 @@ def process_user_data(user_data, user_name):
 
             for file_to_align in files_to_align:
                 print(f"Aligning {file_to_align} with {reference_file}")
-                config_file = generate_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align)
+                config_file = generate_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align, overrides=overrides)
                 run_program(config_file)
+                number_of_pairs += 1
+    return number_of_pairs
+
+
+def init_worker(processed_references):
+    """
+    Keep the processed reference files in the worker process, so they are passed once per worker instead of once per pair.
+    """
+    worker_references.update(processed_references)
+
+
+def align_pair(reference_key, config, config_file):
+    """
+    Align one file to an already processed reference file of this worker, the in-process equivalent of run_program.
+    config_file is the saved copy of config, it is only copied to the output folder.
+    Returns the stage report of the pair (empty without instrumentation).
+    """
+    outlier_settings, diverse_settings, plotting, plot_settings = settings_from_config(config)
+
+    print(f"Aligning {config['file_to_align']} with {config['reference_file']}")
+    report = {}
+    run_alignment(
+        worker_references[reference_key],
+        config["reference_file"],
+        config["file_to_align"],
+        config["sensor_name_reference"],
+        config["sensor_name_align"],
+        outlier_settings[config["sensor_name_align"]],
+        diverse_settings,
+        plotting,
+        plot_settings,
+        report=report
+        )
+    if diverse_settings["save_output_files"]:
+        save_yaml(config_file, config["file_to_align"], config["sensor_name_reference"], diverse_settings["output_folder_path"])
+    return report
+
+
+def process_user_data_batch(user_data, user_name, processed_references, overrides=None, reports=None):
+    """
+    Process the data for a single user in the batch runner: every reference file is processed once (into
+    processed_references) and the configs of all pairs are saved. Returns the (reference key, config, config file) of
+    all pairs. The stage reports of the reference files are added to reports.
+    """
+    print(f"Processing data for user: {user_name}")
+    pairs = []
+
+    for reference_data in user_data:
+        reference_file = reference_data["reference_file"]
+        sensor_name_reference = reference_data["sensor_name_reference"]
+
+        for alignment in reference_data["alignments"]:
+            sensor_name_align = alignment["sensor_name_align"]
+            files_to_align = get_files_in_folder(alignment["files_folder"])
+
+            for file_to_align in files_to_align:
+                config = build_config(reference_file, sensor_name_reference, file_to_align, sensor_name_align, overrides)
+                key = (reference_file, sensor_name_reference)
+                if key not in processed_references:
+                    outlier_settings, diverse_settings, _, _ = settings_from_config(config)
+                    print(f"Processing reference file: {reference_file}")
+                    instrumentation = get_instrumentation(diverse_settings)
+                    processed_references[key] = process_signal(reference_file, sensor_name_reference, outlier_settings[sensor_name_reference], diverse_settings,
+                                                               instrumentation)
+                    if instrumentation.enabled and reports is not None:
+                        reports.append(instrumentation.report())
+                pairs.append((key, config, save_config(config)))
+    return pairs
 
 
-def main():
+def main(workers, use_subprocess, overrides=None):
     # Load JSON input file
     input_json_path = "test_run_configurations.json"
     with open(input_json_path, "r") as json_file:
         data = json.load(json_file)
-    for user, user_data in data.items():
-        process_user_data(user_data, user)
+
+    start = time.perf_counter()
+    number_of_pairs = 0
+    reports = []
+    if use_subprocess:
+        for user, user_data in data.items():
+            number_of_pairs += process_user_data(user_data, user, overrides)
+    else:
+        processed_references = {}
+        pairs = []
+        for user, user_data in data.items():
+            pairs += process_user_data_batch(user_data, user, processed_references, overrides, reports)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(processed_references,)) as executor:
+            futures = [executor.submit(align_pair, key, config, config_file) for key, config, config_file in pairs]
+            for future in futures:
+                report = future.result()
+                if report:
+                    reports.append(report)
+        number_of_pairs = len(futures)
+
+    duration = time.perf_counter() - start
+    print(f"Aligned {number_of_pairs} pairs in {duration:.1f}s ({number_of_pairs / duration:.2f} pairs/s)")
+    cache_folder_path = (overrides or {}).get("cache_folder_path", CACHE_FOLDER_PATH)
+    if cache_folder_path:
+        flush_cache_stats()     # the worker processes flushed their counts when the executor shut down
+        cache_stats = load_cache_stats(cache_folder_path)
+        print(f"Signal cache (all runs): {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['evictions']} evictions")
+
+    if reports:
+        summary = aggregate_reports(reports)
+        print(format_totals(summary['totals']))
+        with open(REPORT_FILE, "w") as report_file:
+            json.dump(summary, report_file, indent=4)
+        print(f"Pipeline report saved to: {REPORT_FILE}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run the synchronization pipeline on the test data.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes for the batch runner.")
+    parser.add_argument("--subprocess", action="store_true", help="Start main.py once per pair instead of the batch runner.")
+    parser.add_argument("--matching_method", default="dtw", choices=["dtw", "cca"], help="Event matching method.")
+    parser.add_argument("--event_assignment", default="global", choices=["greedy", "global"], help="Conflict resolution of the event matches.")
+    parser.add_argument("--drift_model", default="piecewise", choices=["piecewise", "affine", "spline"], help="Clock model fitted to the sync points.")
+    parser.add_argument("--coarse_alignment", action="store_true", help="Pre-shift the events by the global offset of the signal envelopes.")
+    parser.add_argument("--instrumentation", action="store_true", help="Measure every pipeline stage and aggregate the reports.")
+    parser.add_argument("--instrumentation_profiler", default="", choices=["", "cprofile", "tracemalloc"], help="Optional per-stage profiler.")
+    parser.add_argument("--output_format", default="csv", choices=["csv", "csv.gz", "parquet", "feather"], help="Format of the aligned files.")
+    parser.add_argument("--output_content", default="full", choices=["full", "mapping"],
+                        help="Save the aligned files or only the time map (error_quantification.py works with both).")
+    parser.add_argument("--background_writes", action="store_true", help="Write the output files in a background thread.")
+    parser.add_argument("--cache_folder", default=CACHE_FOLDER_PATH, help="Folder for the processed signals, '' to disable the cache.")
+    args = parser.parse_args()
+
+    main(args.workers, args.subprocess, {"event_matching_method": args.matching_method, "event_assignment": args.event_assignment,
+                                         "drift_model": args.drift_model, "coarse_alignment": args.coarse_alignment,
+                                         "instrumentation": args.instrumentation,
+                                         "instrumentation_profiler": args.instrumentation_profiler, "output_format": args.output_format,
+                                         "output_content": args.output_content, "background_writes": args.background_writes,
+                                         "cache_folder_path": args.cache_folder})
@@ -0,0 +1,131 @@
+# This script stress tests the pipeline with many random drift scenarios (drift_synthesis.py) of one recording, all in
+# memory: the reference file is processed once, the recording to align (e.g. a ground truth file synched to the reference)
+# is loaded once and every scenario (offset, clock rate change, random walk, jitter, dropouts and dropout bursts) is
+# synthesized, aligned (main.align_dataframe) and compared to the true times. The error is measured at the alignment
+# points of the recording (column alignment_point, like error_quantification.py) or at all samples if it has none.
+# The scenarios are distributed over --workers processes, the errors of all scenarios are saved to --output and
+# summarized per drift component (scenarios with the component in the upper half of its range vs. the lower half).
+# Usage: python stress_test_drift.py [--reference ../data/...] [--sensor_name_reference corsano] [--recording ../data/...]
+#                                    [--sensor_name_align sensomative] [--scenarios 1000] [--seed 0] [--max_offset 2]
+#                                    [--coarse_alignment] [--workers N]
+# --max_offset sets the limit of the random offsets, offsets beyond max_time_gap_events need --coarse_alignment.
+
+import io
+import os
+import sys
+import time
+import yaml
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from main import process_signal, align_dataframe, settings_from_config
+from drift_synthesis import SCENARIO_LIMITS, sample_scenarios, synthesize_drift
+from utils.data_utils import load_data
+
+BASE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline/config.yaml')
+REFERENCE_FILE = "../data/sensei-103/corsano_wrist_acc/start_2022-11-08.csv"
+RECORDING_FILE = "../data/sensei-103/sensomative/start_sensei_103_2022-11-08_09-57-41-307_mod221207SA_synched_to_corsano.csv"
+
+# reference, recording and settings of the worker processes (set by prepare)
+_state = {}
+
+
+def prepare(reference_file, sensor_name_reference, recording_file, sensor_name_align, coarse_alignment=False):
+    # processes the reference and loads the recording once per process
+    with open(BASE_CONFIG, "r") as file:
+        config = yaml.safe_load(file)
+    config.update(plotting=False, save_output_files=False, cache_folder_path='', coarse_alignment=coarse_alignment)
+    outlier_settings, diverse_settings, _, _ = settings_from_config(config)
+    recording = load_data(recording_file)
+    if 'alignment_point' in recording.columns:
+        points = np.flatnonzero(recording['alignment_point'].to_numpy() == 1)
+    else:
+        points = np.arange(len(recording))
+    _state.update(
+        processed_reference=process_signal(reference_file, sensor_name_reference, outlier_settings[sensor_name_reference], diverse_settings),
+        recording=recording, points=points, sensor_name_reference=sensor_name_reference, sensor_name_align=sensor_name_align,
+        outlier_neighbors_align=outlier_settings[sensor_name_align], diverse_settings=diverse_settings)
+
+
+def run_scenario(scenario):
+    """Synthesizes, aligns and evaluates one DriftScenario, returns its parameters with the errors (in s) and runtime."""
+    start = time.perf_counter()
+    recording = _state['recording']
+    drifted, source_rows = synthesize_drift(recording, scenario)
+    row = scenario.to_dict()
+    try:
+        # the pipeline steps print their progress
+        with contextlib.redirect_stdout(io.StringIO()):
+            time_mapping, sync_points = align_dataframe(_state['processed_reference'], drifted, _state['sensor_name_reference'],
+                                                        _state['sensor_name_align'], _state['outlier_neighbors_align'], _state['diverse_settings'])
+    except Exception as error:
+        row.update(failed=str(error), runtime=time.perf_counter() - start)
+        return row
+
+    # the alignment points that were not lost, at their position in the drifted recording
+    positions = np.full(len(recording), -1)
+    positions[source_rows] = np.arange(len(source_rows))
+    positions = positions[_state['points']]
+    positions = positions[positions >= 0]
+    true_times = recording['time'].to_numpy(dtype=float)[source_rows[positions]]
+    errors = np.abs(time_mapping(drifted['time'].to_numpy()[positions]) - true_times)
+    row.update(failed='', sync_points=len(sync_points), points=len(errors),
+               mae=float(errors.mean()) if len(errors) else np.nan, max_error=float(errors.max()) if len(errors) else np.nan,
+               runtime=time.perf_counter() - start)
+    return row
+
+
+def summarize(results):
+    # mean error of the scenarios with the larger and with the smaller half of every drift component
+    lines = [f"{'component':<20} {'MAE lower half':>15} {'MAE upper half':>15}"]
+    for component in SCENARIO_LIMITS:
+        values = results[component].abs()
+        upper = values > values.median()
+        lines.append(f"{component:<20} {results.loc[~upper, 'mae'].mean():>14.4f}s {results.loc[upper, 'mae'].mean():>14.4f}s")
+    return '\n'.join(lines)
+
+
+def main(reference_file, sensor_name_reference, recording_file, sensor_name_align, scenarios, seed, max_offset, coarse_alignment,
+         workers, output_file):
+    drift_scenarios = sample_scenarios(scenarios, seed, {'offset': max_offset})
+    start = time.perf_counter()
+    arguments = (reference_file, sensor_name_reference, recording_file, sensor_name_align, coarse_alignment)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=prepare, initargs=arguments) as executor:
+            rows = list(executor.map(run_scenario, drift_scenarios, chunksize=max(1, scenarios // (4 * workers))))
+    else:
+        prepare(*arguments)
+        rows = [run_scenario(scenario) for scenario in drift_scenarios]
+    duration = time.perf_counter() - start
+
+    results = pd.DataFrame(rows)
+    results.to_csv(output_file, index=False)
+    failed = (results['failed'] != '').sum()
+    print(f"\n{scenarios} scenarios in {duration:.1f}s ({scenarios / duration:.1f} scenarios/s), {failed} failed, results saved to: {output_file}")
+    print(f"MAE: median {results['mae'].median():.4f}s, 95th percentile {results['mae'].quantile(0.95):.4f}s, "
+          f"max {results['mae'].max():.4f}s")
+    print(summarize(results))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress test the pipeline with random drift scenarios synthesized in memory.")
+    parser.add_argument("--reference", default=REFERENCE_FILE, help="Reference file.")
+    parser.add_argument("--sensor_name_reference", default="corsano", help="Sensor of the reference file.")
+    parser.add_argument("--recording", default=RECORDING_FILE, help="Recording to drift, on the clock of the reference (e.g. a ground truth file).")
+    parser.add_argument("--sensor_name_align", default="sensomative", help="Sensor of the recording.")
+    parser.add_argument("--scenarios", type=int, default=1000, help="Number of random drift scenarios.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the scenarios.")
+    parser.add_argument("--max_offset", type=float, default=SCENARIO_LIMITS['offset'], help="Limit (in s) of the random offsets.")
+    parser.add_argument("--coarse_alignment", action="store_true", help="Pre-shift the events by the global offset of the signal envelopes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--output", default="stress_test_drift.csv", help="CSV file with the errors of every scenario.")
+    args = parser.parse_args()
+
+    sys.exit(main(args.reference, args.sensor_name_reference, args.recording, args.sensor_name_align, args.scenarios, args.seed,
+                  args.max_offset, args.coarse_alignment, args.workers, args.output))
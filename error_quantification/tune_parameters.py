@@ -0,0 +1,395 @@
+# This script tunes the parameters of the pipeline on the drifted test data (test_run_configurations.json): every
+# configuration aligns all pairs in memory (no output files) and is scored by the error between the aligned times and
+# the ground truth at the alignment points, as in error_quantification.py.
+# Every pipeline stage is memoized on exactly the parameters it depends on (StageCache), e.g. a new DTW threshold only
+# repeats the matching and a new min_time_event starts at the event detection, the outlier detection is reused:
+#   signal (load, 1D signal)  <- file
+#   outliers                  <- signal, outlier_method_<sensor>, outlier_neighbors_<sensor>
+#   events                    <- outliers, min_time_event, min_outlier_fraction_event
+#   event_information         <- events, normalization_window_duration
+#   matching                  <- event_information of both files, event_matching_method, event_assignment,
+#                                max_time_gap_events, distance threshold of the pair, dtw_window_fraction / cca_sampling_rate,
+#                                coarse_sampling_rate, coarse_max_offset, coarse_estimate_rate, coarse_candidates (with coarse_alignment)
+#   mapping (errors)          <- matching, drift_model, drift_inlier_threshold
+# The reference groups are evaluated in --workers processes, the outputs of the stages up to the event information are
+# also cached in --cache_folder, so repeated sweeps and other processes reuse them.
+# --search grid evaluates every combination of the --grid values on all pairs, --search halving (successive halving)
+# samples --configurations combinations, evaluates them on a subset of the pairs and keeps the best 1 / --eta of them
+# for the next round on --eta times as many pairs, until the last round uses all pairs.
+# The runtime of a configuration is the sum of the computation times of its stages (also if they came from the cache).
+# All evaluations are saved to --output, the configurations of the accuracy / runtime Pareto front are printed.
+# Usage: python tune_parameters.py [--search grid|halving] [--grid min_time_event=0.3,0.5,1.0 dtw_distance_threshold_accelerator=100,150]
+#                                  [--configurations 27] [--eta 3] [--metric mae|rmse] [--workers N] [--output parameter_tuning.csv]
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import yaml
+import random
+import argparse
+import itertools
+import contextlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from main import coarse_match_events, settings_from_config
+from pipeline_steps.outlier_detection import detect_outliers
+from pipeline_steps.event_detection import identify_events
+from pipeline_steps.event_information import extract_event_information
+from pipeline_steps.signal_alignment import select_sync_points, build_time_mapping
+from utils.data_utils import load_data, required_columns, create_1D_signal, calculate_1D_signal_derivative
+from utils.cache import StageCache, file_hash
+from error_quantification import find_gt_file
+
+BASE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline/config.yaml')
+STAGE_CACHE_FOLDER = os.path.join("cache", "stages")
+# Stage outputs kept in memory per process (a few per file and configuration)
+MEMORY_ENTRIES = 4096
+# Stages stored in --cache_folder, the matching and mapping are faster to repeat than to store
+DISK_STAGES = ('signal', 'outliers', 'events', 'event_information', 'ground_truth')
+# Settings of the coarse alignment, part of the matching key with coarse_alignment
+COARSE_SETTINGS = ('coarse_sampling_rate', 'coarse_max_offset', 'coarse_estimate_rate', 'coarse_candidates')
+# Searched if no --grid is given
+DEFAULT_GRID = {
+    'min_time_event': [0.3, 0.5, 1.0],
+    'min_outlier_fraction_event': [0.3, 0.5, 0.7],
+    'max_time_gap_events': [1, 2, 3],
+    'dtw_distance_threshold_accelerator': [100, 150, 200],
+    'dtw_distance_threshold_sensomative': [100, 150, 200],
+    'normalization_window_duration': [5, 10, 20]
+}
+
+# one StageCache per process
+_stage_cache = None
+
+
+def parse_grid(specifications):
+    # ['name=1,2,3', ...] -> {'name': [1, 2, 3]}, the values are parsed as YAML (numbers, strings, null)
+    grid = {}
+    for specification in specifications:
+        name, _, values = specification.partition('=')
+        if not values:
+            raise ValueError(f"Expected name=value1,value2,... instead of '{specification}'")
+        grid[name] = [yaml.safe_load(value) for value in values.split(',')]
+    return grid
+
+
+def load_pairs(test_run_configurations="test_run_configurations.json"):
+    """
+    Returns the pairs of the test runs as dicts with the reference file and sensor, the file to align and its sensor,
+    the ground truth file, the sensor type and the drift level (as in error_quantification.py).
+    """
+    with open(test_run_configurations, "r") as json_file:
+        data = json.load(json_file)
+    pairs = []
+    ground_truth_files = {}
+    for user_data in data.values():
+        for reference_data in user_data:
+            for alignment in reference_data["alignments"]:
+                files_folder = alignment["files_folder"]
+                if not os.path.isdir(files_folder):
+                    print(f"Folder {files_folder} does not exist!")
+                    continue
+                start_or_end = "start" if "start" in os.path.basename(os.path.normpath(files_folder)).lower() else "end"
+                sensor_folder = os.path.abspath(os.path.join(files_folder, "../.."))
+                if (sensor_folder, start_or_end) not in ground_truth_files:
+                    ground_truth_files[sensor_folder, start_or_end] = find_gt_file(sensor_folder, start_or_end)
+                gt_file = ground_truth_files[sensor_folder, start_or_end]
+                if gt_file is None:
+                    print(f"No GT file found for {sensor_folder} matching '{start_or_end}'")
+                    continue
+                for file in sorted(os.listdir(files_folder)):
+                    if file.endswith(".csv"):
+                        pairs.append({
+                            'reference_file': reference_data["reference_file"],
+                            'sensor_name_reference': reference_data["sensor_name_reference"],
+                            'file_to_align': os.path.join(files_folder, file),
+                            'sensor_name_align': alignment["sensor_name_align"],
+                            'gt_file': gt_file,
+                            'sensor_type': "Pressure Mat" if "sensomative" in os.path.basename(sensor_folder).lower() else "Accelerometer",
+                            'drift_level': os.path.splitext(file)[0].split("_")[-1].replace("timedrift", "").replace("s", "")
+                        })
+    return pairs
+
+
+def get_stage_cache(cache_folder_path):
+    global _stage_cache
+    if _stage_cache is None:
+        _stage_cache = StageCache(cache_folder_path, MEMORY_ENTRIES, disk_stages=DISK_STAGES)
+    return _stage_cache
+
+
+def evaluate_group(pairs, configurations, file_hashes, cache_folder_path):
+    """
+    Evaluates the configurations (dicts of config.yaml settings) on pairs (all with the same reference file) and returns
+    per configuration the time differences per (sensor type, drift level), the number of failed pairs and the
+    computation time of every stage it used {stage key: seconds}. Also returns the process id and its stage statistics.
+    """
+    cache = get_stage_cache(cache_folder_path)
+    settings = [settings_from_config(configuration)[:2] for configuration in configurations]
+    results = [{'differences': {}, 'failed': 0, 'stage_times': {}} for _ in configurations]
+    # the pipeline steps print their progress for every pair
+    with contextlib.redirect_stdout(io.StringIO()):
+        # all configurations of a pair one after the other, so its stage outputs are still in memory
+        for pair in pairs:
+            for (outlier_settings, diverse_settings), result in zip(settings, results):
+                try:
+                    pair_differences = evaluate_pair(cache, pair, outlier_settings, diverse_settings, file_hashes, result['stage_times'])
+                except Exception:
+                    result['failed'] += 1
+                    pair_differences = unaligned_differences(cache, pair, file_hashes, result['stage_times'])
+                result['differences'].setdefault((pair['sensor_type'], pair['drift_level']), []).extend(pair_differences)
+    return results, os.getpid(), cache.stats
+
+
+def evaluate_pair(cache, pair, outlier_settings, diverse_settings, file_hashes, stage_times):
+    # time differences between the ground truth and the aligned times at the alignment points of one pair
+    sensor_reference, sensor_align = pair['sensor_name_reference'], pair['sensor_name_align']
+    reference_key, (df1, reference_events) = processed_events(cache, pair['reference_file'], sensor_reference, outlier_settings,
+                                                              diverse_settings, file_hashes, stage_times)
+    align_key, (df2, align_events) = processed_events(cache, pair['file_to_align'], sensor_align, outlier_settings,
+                                                      diverse_settings, file_hashes, stage_times)
+
+    matching_method = diverse_settings['event_matching_method']
+    pair_type = 'sensomative' if 'sensomative' in (sensor_reference, sensor_align) else 'accelerator'
+    matching_key = cache.key('matching', reference=reference_key, align=align_key, sensors=[sensor_reference, sensor_align],
+                             method=matching_method, assignment=diverse_settings['event_assignment'],
+                             max_time_gap_events=diverse_settings['max_time_gap_events'],
+                             threshold=diverse_settings[f'{matching_method}_distance_threshold_{pair_type}'],
+                             window=diverse_settings['dtw_window_fraction'] if matching_method == 'dtw' else diverse_settings['cca_sampling_rate'],
+                             **({name: diverse_settings[name] for name in COARSE_SETTINGS} if diverse_settings['coarse_alignment'] else {}))
+    # the second column of the signal DataFrames is the 1D signal (used by the coarse alignment)
+    (comparison_results, distance_threshold) = _stage(cache, stage_times, matching_key, coarse_match_events, df1, df2, df1.columns[1],
+                                                      df2.columns[1], reference_events, align_events, sensor_reference, sensor_align,
+                                                      diverse_settings)
+
+    drift_model = diverse_settings['drift_model']
+    mapping_key = cache.key('mapping', matching=matching_key, drift_model=drift_model,
+                            inlier_threshold=diverse_settings['drift_inlier_threshold'] if drift_model != 'piecewise' else None)
+    return _stage(cache, stage_times, mapping_key, aligned_differences, df1, df2, comparison_results, sensor_reference, sensor_align,
+                  distance_threshold, drift_model, diverse_settings['drift_inlier_threshold'], ground_truth(cache, pair, file_hashes))
+
+
+def processed_events(cache, input_file, sensor_name, outlier_settings, diverse_settings, file_hashes, stage_times):
+    # the stages of process_signal, returns the key of the last stage and (signal DataFrame, event information)
+    signal_key = cache.key('signal', file=file_hashes[input_file], sensor=sensor_name)
+    df, signal_column = _stage(cache, stage_times, signal_key, load_signal, input_file, sensor_name)
+
+    outlier_method = diverse_settings['outlier_methods'][sensor_name]
+    outliers_key = cache.key('outliers', signal=signal_key, method=outlier_method, neighbors=outlier_settings[sensor_name])
+    outlier_flags = _stage(cache, stage_times, outliers_key, detect_outliers, df, signal_column, outlier_settings[sensor_name], outlier_method)
+
+    events_key = cache.key('events', outliers=outliers_key, min_time_event=diverse_settings['min_time_event'],
+                           min_outlier_fraction_event=diverse_settings['min_outlier_fraction_event'])
+    events = _stage(cache, stage_times, events_key, identify_events, df, outlier_flags, 'time', diverse_settings['min_time_event'],
+                    diverse_settings['min_outlier_fraction_event'])
+
+    information_key = cache.key('event_information', events=events_key, normalization_window_duration=diverse_settings['normalization_window_duration'])
+    event_stats = _stage(cache, stage_times, information_key, extract_event_information, df, events, signal_column,
+                         diverse_settings['normalization_window_duration'])
+    return information_key, (df, event_stats)
+
+
+def load_signal(input_file, sensor_name):
+    # time and 1D signal (derivative for sensomative) as in process_dataframe
+    df = create_1D_signal(load_data(input_file, columns=required_columns(sensor_name)), sensor_name)
+    signal_column = '1d_signal'
+    if sensor_name == 'sensomative':
+        df = calculate_1D_signal_derivative(df, '1d_signal')
+        signal_column = '1d_signal_derivative'
+    return df[['time', signal_column]], signal_column
+
+
+def ground_truth(cache, pair, file_hashes):
+    # (row indices of the alignment points, ground truth times), read once per ground truth file
+    key = cache.key('ground_truth', file=file_hashes[pair['gt_file']])
+    return cache.compute(key, read_ground_truth, pair['gt_file'])[0]
+
+
+def read_ground_truth(gt_file):
+    df_gt = pd.read_csv(gt_file, usecols=['time', 'alignment_point'])
+    points = np.flatnonzero(df_gt['alignment_point'].to_numpy() == 1)
+    return points, df_gt['time'].to_numpy(dtype=float)[points]
+
+
+def aligned_differences(df1, df2, comparison_results, sensor_reference, sensor_align, distance_threshold, drift_model, inlier_threshold,
+                        gt_points):
+    # the time mapping of run_alignment, applied only to the times of the alignment points
+    sync_indices = select_sync_points(comparison_results, sensor_reference, sensor_align, distance_threshold)
+    reference_times, align_times = df1['time'].to_numpy(), df2['time'].to_numpy()
+    sync_points = [(align_times[align_index], reference_times[reference_index]) for reference_index, align_index in sync_indices]
+    time_mapping = build_time_mapping(sync_points, drift_model, inlier_threshold)
+    points, gt_times = gt_points
+    valid = points < len(align_times)
+    return np.abs(gt_times[valid] - time_mapping(align_times[points[valid]])).tolist()
+
+
+def unaligned_differences(cache, pair, file_hashes, stage_times):
+    # differences of a pair whose alignment failed: the times of the file to align are not changed
+    signal_key = cache.key('signal', file=file_hashes[pair['file_to_align']], sensor=pair['sensor_name_align'])
+    df, _ = _stage(cache, stage_times, signal_key, load_signal, pair['file_to_align'], pair['sensor_name_align'])
+    points, gt_times = ground_truth(cache, pair, file_hashes)
+    valid = points < len(df)
+    return np.abs(gt_times[valid] - df['time'].to_numpy()[points[valid]]).tolist()
+
+
+def _stage(cache, stage_times, key, function, *args):
+    output, seconds = cache.compute(key, function, *args)
+    stage_times[key] = seconds
+    return output
+
+
+def score(result, metric):
+    # accuracy over all alignment points of the evaluated pairs
+    differences = np.concatenate([np.asarray(values, dtype=float) for values in result['differences'].values()] or [np.empty(0)])
+    if not len(differences):
+        return math.inf
+    if metric == 'rmse':
+        return float(np.sqrt(np.mean(differences ** 2)))
+    return float(np.mean(differences))
+
+
+def evaluate(configurations, pairs, base_config, file_hashes, executor, cache_folder_path, stage_stats):
+    """Evaluates the configurations (parameter dicts) on pairs, returns one result per configuration."""
+    full_configurations = [dict(base_config, **configuration) for configuration in configurations]
+    groups = {}
+    for pair in pairs:
+        groups.setdefault(pair['reference_file'], []).append(pair)
+    if executor is None:
+        group_results = [evaluate_group(group, full_configurations, file_hashes, cache_folder_path) for group in groups.values()]
+    else:
+        group_results = list(executor.map(evaluate_group, groups.values(), itertools.repeat(full_configurations),
+                                          itertools.repeat(file_hashes), itertools.repeat(cache_folder_path)))
+
+    results = [{'differences': {}, 'failed': 0, 'stage_times': {}} for _ in configurations]
+    for group_result, process_id, process_stats in group_results:
+        for result, configuration_result in zip(results, group_result):
+            for key, values in configuration_result['differences'].items():
+                result['differences'].setdefault(key, []).extend(values)
+            result['failed'] += configuration_result['failed']
+            result['stage_times'].update(configuration_result['stage_times'])
+        # the statistics of a process are cumulative, the last ones of every process are kept
+        stage_stats[process_id] = dict(process_stats)
+    for result in results:
+        result['runtime'] = sum(result['stage_times'].values())
+    return results
+
+
+def grid_configurations(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_search(search, grid, pairs, base_config, file_hashes, executor, cache_folder_path, metric, configurations, eta, seed, stage_stats):
+    # returns (configuration, number of pairs, result) of every evaluation
+    candidates = grid_configurations(grid)
+    evaluations = []
+    if search == 'grid':
+        for configuration, result in zip(candidates, evaluate(candidates, pairs, base_config, file_hashes, executor, cache_folder_path, stage_stats)):
+            evaluations.append((configuration, len(pairs), result))
+        return evaluations
+
+    # successive halving: the same random order of the pairs in every round, a round evaluates the first budget pairs
+    rng = random.Random(seed)
+    candidates = rng.sample(candidates, min(configurations, len(candidates)))
+    ordered_pairs = rng.sample(pairs, len(pairs))
+    rounds = max(1, math.ceil(math.log(len(candidates), eta)))
+    for round_number in range(rounds + 1):
+        budget = len(pairs) if round_number == rounds else max(1, int(len(pairs) / eta ** (rounds - round_number)))
+        results = evaluate(candidates, ordered_pairs[:budget], base_config, file_hashes, executor, cache_folder_path, stage_stats)
+        evaluations += [(configuration, budget, result) for configuration, result in zip(candidates, results)]
+        print(f"Round {round_number + 1}: {len(candidates)} configurations on {budget} pairs, "
+              f"best {metric} {min(score(result, metric) for result in results):.4f}s")
+        if round_number == rounds:
+            break
+        ranking = sorted(range(len(candidates)), key=lambda index: score(results[index], metric))
+        candidates = [candidates[index] for index in ranking[:max(1, math.ceil(len(candidates) / eta))]]
+    return evaluations
+
+
+def pareto_front(rows, metric):
+    # rows (evaluated on all pairs) no other row is better or equal in both the metric and the runtime
+    front = []
+    for row in sorted(rows, key=lambda row: (row[metric], row['runtime'])):
+        if not front or row['runtime'] < front[-1]['runtime']:
+            front.append(row)
+    return front
+
+
+def main(search, grid, metric, configurations, eta, seed, workers, cache_folder_path, output_file):
+    with open(BASE_CONFIG, "r") as file:
+        base_config = yaml.safe_load(file)
+    base_config.update(plotting=False, save_output_files=False, cache_folder_path='', instrumentation=False)
+    unknown = [name for name in grid if name not in base_config]
+    if unknown:
+        raise ValueError(f"Unknown parameters {', '.join(unknown)}, see config.yaml")
+
+    pairs = load_pairs()
+    files = {pair[name] for pair in pairs for name in ('reference_file', 'file_to_align', 'gt_file')}
+    file_hashes = {file: file_hash(file) for file in files}
+    print(f"Tuning {', '.join(grid)} on {len(pairs)} pairs ({search} search)")
+
+    start = time.perf_counter()
+    stage_stats = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            evaluations = run_search(search, grid, pairs, base_config, file_hashes, executor, cache_folder_path, metric, configurations,
+                                     eta, seed, stage_stats)
+    else:
+        evaluations = run_search(search, grid, pairs, base_config, file_hashes, None, cache_folder_path, metric, configurations,
+                                 eta, seed, stage_stats)
+    duration = time.perf_counter() - start
+
+    rows = []
+    for configuration, budget, result in evaluations:
+        row = dict(configuration)
+        row.update(pairs=budget, failed_pairs=result['failed'], mae=score(result, 'mae'), rmse=score(result, 'rmse'),
+                   runtime=round(result['runtime'], 3))
+        for sensor_type in sorted({sensor_type for sensor_type, _ in result['differences']}):
+            row[f"mae {sensor_type}"] = float(np.mean([difference for (sensor, _), differences in result['differences'].items()
+                                                      if sensor == sensor_type for difference in differences]))
+        rows.append(row)
+    complete = [row for row in rows if row['pairs'] == len(pairs)]
+    front = pareto_front(complete, metric)
+    for row in rows:
+        row['pareto'] = any(row is front_row for front_row in front)
+    pd.DataFrame(rows).to_csv(output_file, index=False)
+
+    print(f"\nEvaluated {len(rows)} configurations in {duration:.1f}s, results saved to: {output_file}")
+    totals = {}
+    for process_stats in stage_stats.values():
+        for stage, stats in process_stats.items():
+            total = totals.setdefault(stage, {'computed': 0, 'hits': 0, 'time': 0.0})
+            for name in total:
+                total[name] += stats[name]
+    print(f"{'stage':<20} {'computed':>9} {'reused':>9} {'time':>9}")
+    for stage, total in totals.items():
+        print(f"{stage:<20} {total['computed']:>9} {total['hits']:>9} {total['time']:>8.2f}s")
+
+    print(f"\nPareto front ({metric} / runtime) on all {len(pairs)} pairs:")
+    for row in front:
+        parameters = ', '.join(f"{name}={row[name]}" for name in grid)
+        print(f"  {metric} {row[metric]:.4f}s  runtime {row['runtime']:.2f}s  failed {row['failed_pairs']}  {parameters}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the pipeline parameters on the drifted test data.")
+    parser.add_argument("--search", default="halving", choices=["grid", "halving"], help="Grid search or successive halving.")
+    parser.add_argument("--grid", nargs='*', default=[], help="Searched values as name=value1,value2,... (config.yaml names).")
+    parser.add_argument("--metric", default="mae", choices=["mae", "rmse"], help="Accuracy metric over all alignment points.")
+    parser.add_argument("--configurations", type=int, default=27, help="Configurations sampled from the grid for successive halving.")
+    parser.add_argument("--eta", type=int, default=3, help="Successive halving keeps 1 / eta of the configurations per round.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sampled configurations and pair subsets.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--cache_folder", default=STAGE_CACHE_FOLDER, help="Folder for the stage outputs, '' to keep them in memory only.")
+    parser.add_argument("--output", default="parameter_tuning.csv", help="CSV file with all evaluations.")
+    args = parser.parse_args()
+
+    main(args.search, parse_grid(args.grid) if args.grid else DEFAULT_GRID, args.metric, args.configurations, args.eta, args.seed,
+         args.workers, args.cache_folder, args.output)
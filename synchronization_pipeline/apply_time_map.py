@@ -0,0 +1,84 @@
+# This script applies the time map of an alignment (time_map.json, saved next to the outputs of the pipeline) to a
+# recording of the aligned device or to single times, without running the pipeline again.
+# The time column of the recording is mapped onto the reference clock chunk by chunk (the recording can be larger than
+# the memory), the timestamp column is recomputed from the mapped times and the result is written to --output in the
+# format of its extension (.csv, .csv.gz, .parquet or .feather). With --verify the recording must be the file the time
+# map was created from (same SHA-256 hash).
+# Usage: python apply_time_map.py <time_map.json> <recording> --output aligned.parquet [--chunk_size 1000000] [--verify]
+#        python apply_time_map.py <time_map.json> --times 1667898000.0 1667898001.5
+
+import os
+import sys
+import argparse
+import pandas as pd
+
+from pipeline_steps.time_mapping import TimeMap
+from utils.cache import file_hash
+from utils.data_utils import iter_data_chunks, write_chunks, output_format_of
+
+# Number of rows mapped at once
+CHUNK_SIZE = 1000000
+
+
+def apply_time_map(time_map, input_file, output_file, chunk_size=CHUNK_SIZE, time_column='time'):
+    """
+    Maps the time column of input_file onto the reference clock with time_map (TimeMap or path of time_map.json) and
+    writes the recording to output_file. Returns the number of rows.
+    """
+    if not isinstance(time_map, TimeMap):
+        time_map = TimeMap.load(time_map)
+    output_folder = os.path.dirname(output_file)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+
+    rows = 0
+    chunks = time_map.apply_to_chunks(iter_data_chunks(input_file, chunk_size, time_column), time_column)
+    for chunk in write_chunks((_with_timestamp(chunk, time_column) for chunk in chunks), output_file, output_format_of(output_file)):
+        rows += len(chunk)
+    return rows
+
+
+def verify_input(time_map, input_file):
+    # True if input_file is the file the time map was created from (by its hash), None if the time map has no hash
+    expected = time_map.provenance.get('file_to_align_sha256')
+    if expected is None:
+        return None
+    return file_hash(input_file) == expected
+
+
+def _with_timestamp(chunk, time_column):
+    if 'timestamp' in chunk.columns:
+        chunk['timestamp'] = pd.to_datetime(chunk[time_column], unit='s')
+    return chunk
+
+
+def main(args):
+    time_map = TimeMap.load(args.time_map)
+    if args.times:
+        for time, mapped in zip(args.times, time_map(args.times)):
+            print(f"{time:.6f} -> {mapped:.6f}")
+        return 0
+    if not args.recording or not args.output:
+        print("A recording and --output (or --times) are required")
+        return 1
+    if args.verify and verify_input(time_map, args.recording) is False:
+        print(f"{args.recording} is not the file the time map was created from ({time_map.provenance.get('file_to_align')})")
+        return 1
+
+    rows = apply_time_map(time_map, args.recording, args.output, args.chunk_size, args.time_column)
+    print(f"Mapped {rows} rows of {args.recording} to: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map a recording or single times onto the reference clock with a time map.")
+    parser.add_argument("time_map", help="time_map.json of an alignment.")
+    parser.add_argument("recording", nargs='?', help="Recording of the aligned device (CSV or converted binary file).")
+    parser.add_argument("--output", help="Output file, the format is taken from the extension (.csv, .csv.gz, .parquet, .feather).")
+    parser.add_argument("--times", nargs='*', type=float, help="Map these times instead of a recording.")
+    parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE, help="Rows mapped at once.")
+    parser.add_argument("--time_column", default='time', help="Name of the time column.")
+    parser.add_argument("--verify", action="store_true", help="Check that the recording is the file the time map was created from.")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
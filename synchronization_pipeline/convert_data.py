@@ -0,0 +1,41 @@
+# This script converts recordings from CSV to a binary format that load_data reads instead of the CSV file.
+# The converted file is stored next to the CSV file (file.npcols folder, file.parquet or file.feather) with the rows
+# already sorted by time. It is only used as long as it is not older than the CSV file.
+# npy (one memory-mapped NumPy file per column) needs no additional dependencies, parquet and feather require pyarrow.
+# Usage: python convert_data.py <file_or_folder> [<file_or_folder> ...] [--format npy|parquet|feather]
+
+import os
+import argparse
+
+from utils.data_utils import load_data, save_binary_data, BINARY_FORMATS
+
+
+def find_csv_files(paths):
+    csv_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                csv_files += [os.path.join(root, file) for file in sorted(files) if file.endswith('.csv')]
+        elif path.endswith('.csv'):
+            csv_files.append(path)
+    return csv_files
+
+
+def main(paths, binary_format):
+    for input_file in find_csv_files(paths):
+        try:
+            df = load_data(input_file)
+        except (ValueError, KeyError) as error:
+            print(f"Could not convert {input_file}: {error}")
+            continue
+        binary_file = save_binary_data(df, input_file, binary_format)
+        print(f"Converted {input_file} to {binary_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert CSV recordings to a binary format.")
+    parser.add_argument("paths", nargs='+', help="CSV files or folders containing CSV files.")
+    parser.add_argument("--format", default='npy', choices=list(BINARY_FORMATS), help="Binary format.")
+    args = parser.parse_args()
+
+    main(args.paths, args.format)
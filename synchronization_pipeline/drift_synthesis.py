@@ -0,0 +1,135 @@
+# Synthesizes drifted variants of a recording in memory with vectorized NumPy, e.g. to stress test the pipeline with
+# thousands of drift scenarios (see error_quantification/stress_test_drift.py) without writing drifted copies to disk.
+# The clock of the device is modelled as
+#   drifted time = time + offset + clock_rate_change * (time - first time) + random walk(time) + jitter
+# and samples are lost as single dropouts and as dropout bursts (gaps of burst_duration seconds). The drifted recording
+# is sorted by its drifted time with a new RangeIndex (as returned by load_data), so it can be passed to
+# main.align_dataframe directly; the source rows give the true time of every drifted sample.
+
+import numpy as np
+import pandas as pd
+
+
+class DriftScenario:
+    """
+    Clock drift and sample loss applied by synthesize_drift.
+
+    Parameters:
+        offset (float): Constant time shift (in s).
+        clock_rate_change (float): Relative clock rate error, e.g. 1e-4 for 0.1 ms per s.
+        random_walk_std (float): Standard deviation (in s) of the random walk drift after 1 s, it grows with the square
+            root of the time.
+        jitter_std (float): Standard deviation (in s) of the independent noise of every timestamp.
+        dropout_fraction (float): Fraction of single samples that are lost.
+        burst_count (int): Number of dropout bursts at random times.
+        burst_duration (float): Duration (in s) of every dropout burst.
+        seed (int): Seed of the random walk, jitter and dropouts.
+    """
+
+    def __init__(self, offset=0.0, clock_rate_change=0.0, random_walk_std=0.0, jitter_std=0.0, dropout_fraction=0.0,
+                 burst_count=0, burst_duration=0.0, seed=0):
+        self.offset = offset
+        self.clock_rate_change = clock_rate_change
+        self.random_walk_std = random_walk_std
+        self.jitter_std = jitter_std
+        self.dropout_fraction = dropout_fraction
+        self.burst_count = burst_count
+        self.burst_duration = burst_duration
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return f"DriftScenario({', '.join(f'{name}={value}' for name, value in vars(self).items())})"
+
+
+# Upper limits of the random scenarios of sample_scenarios
+SCENARIO_LIMITS = {
+    'offset': 2.0,
+    'clock_rate_change': 1e-4,
+    'random_walk_std': 1e-3,
+    'jitter_std': 0.01,
+    'dropout_fraction': 0.1,
+    'burst_count': 3,
+    'burst_duration': 5.0
+}
+
+
+def sample_scenarios(count, seed=0, limits=None):
+    """
+    Returns count random DriftScenarios: every parameter is uniform between 0 and its limit (SCENARIO_LIMITS updated by
+    limits), the offset and clock rate change have a random sign.
+    """
+    limits = dict(SCENARIO_LIMITS, **(limits or {}))
+    rng = np.random.default_rng(seed)
+    sign = lambda: rng.choice([-1.0, 1.0], count)
+    parameters = {
+        'offset': sign() * rng.uniform(0, limits['offset'], count),
+        'clock_rate_change': sign() * rng.uniform(0, limits['clock_rate_change'], count),
+        'random_walk_std': rng.uniform(0, limits['random_walk_std'], count),
+        'jitter_std': rng.uniform(0, limits['jitter_std'], count),
+        'dropout_fraction': rng.uniform(0, limits['dropout_fraction'], count),
+        'burst_count': rng.integers(0, int(limits['burst_count']) + 1, count),
+        'burst_duration': rng.uniform(0, limits['burst_duration'], count),
+        'seed': rng.integers(0, 2 ** 31, count)
+    }
+    return [DriftScenario(**{name: values[number].item() for name, values in parameters.items()}) for number in range(count)]
+
+
+def drift_times(times, scenario, rng=None):
+    """Returns the times (sorted array in s) on the drifted clock of scenario (without dropouts)."""
+    times = np.asarray(times, dtype=float)
+    rng = np.random.default_rng(scenario.seed) if rng is None else rng
+    # same operations as the per-row version of various/apply_drift.py
+    drifted = times + scenario.offset + scenario.clock_rate_change * (times - times[0]) if len(times) else times.copy()
+    if scenario.random_walk_std > 0 and len(times) > 1:
+        steps = rng.normal(0, 1, len(times) - 1) * scenario.random_walk_std * np.sqrt(np.maximum(np.diff(times), 0))
+        drifted[1:] += np.cumsum(steps)
+    if scenario.jitter_std > 0:
+        drifted += rng.normal(0, scenario.jitter_std, len(times))
+    return drifted
+
+
+def kept_samples(times, scenario, rng=None):
+    """Returns the mask of the samples (sorted times in s) that are not lost by the dropouts and bursts of scenario."""
+    times = np.asarray(times, dtype=float)
+    rng = np.random.default_rng(scenario.seed) if rng is None else rng
+    keep = np.ones(len(times), dtype=bool)
+    if scenario.dropout_fraction > 0:
+        keep &= rng.random(len(times)) >= scenario.dropout_fraction
+    if scenario.burst_count > 0 and scenario.burst_duration > 0 and len(times):
+        starts = rng.uniform(times[0], max(times[0], times[-1] - scenario.burst_duration), scenario.burst_count)
+        # +1 at the first and -1 after the last sample of every burst, the cumulative sum is > 0 inside the bursts
+        inside = np.zeros(len(times) + 1, dtype=np.int64)
+        np.add.at(inside, np.searchsorted(times, starts, side='left'), 1)
+        np.add.at(inside, np.searchsorted(times, starts + scenario.burst_duration, side='left'), -1)
+        keep &= np.cumsum(inside)[:-1] == 0
+    return keep
+
+
+def synthesize_drift(df, scenario, time_column='time'):
+    """
+    Returns the recording df (sorted by time) as recorded by a device with the clock and sample loss of scenario:
+    a new DataFrame sorted by the drifted time with a RangeIndex (the timestamp column is recomputed) and the row
+    positions in df of its samples, so df[time_column].to_numpy()[source_rows] are their true times.
+    """
+    rng = np.random.default_rng(scenario.seed)
+    times = df[time_column].to_numpy(dtype=float)
+    drifted = drift_times(times, scenario, rng)
+    source_rows = np.flatnonzero(kept_samples(times, scenario, rng))
+    # jitter can swap neighbouring samples
+    source_rows = source_rows[np.argsort(drifted[source_rows], kind='stable')]
+
+    drifted_df = df.iloc[source_rows].reset_index(drop=True)
+    drifted_df[time_column] = drifted[source_rows]
+    if 'timestamp' in drifted_df.columns:
+        drifted_df['timestamp'] = pd.to_datetime(drifted_df[time_column], unit='s')
+    return drifted_df, source_rows
+
+
+def synthesize_variants(df, scenarios, time_column='time'):
+    """Yields (scenario, drifted DataFrame, source rows) for every scenario, df is only loaded once."""
+    for scenario in scenarios:
+        drifted_df, source_rows = synthesize_drift(df, scenario, time_column)
+        yield scenario, drifted_df, source_rows
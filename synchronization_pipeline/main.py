@@ -14,94 +14,249 @@ import argparse
 from pipeline_steps.outlier_detection import detect_outliers
 from pipeline_steps.event_detection import identify_events
 from pipeline_steps.event_information import extract_event_information
-from pipeline_steps.event_comparison import compare_events_dtw, compare_events_cca
-from pipeline_steps.signal_alignment import align_signals
-from utils.data_utils import load_data, save_dataframe_to_csv, save_yaml, create_1D_signal, calculate_1D_signal_derivative, resample, annotate_events
-from utils.visualization import plot_interactive_html
+from pipeline_steps.coarse_alignment import estimate_offset_candidates, consistent_sync_points, shift_events, COARSE_SAMPLING_RATE, COARSE_CANDIDATES, COARSE_MIN_GAIN
+from pipeline_steps.event_comparison import compare_events_dtw, compare_events_cca, DTW_WINDOW_FRACTION, CCA_SAMPLING_RATE, EVENT_ASSIGNMENT
+from pipeline_steps.signal_alignment import collect_sync_points, select_sync_points, build_time_mapping
+from pipeline_steps.time_mapping import DRIFT_INLIER_THRESHOLD, TimeMap
+from utils.data_utils import load_data, required_columns, output_file_path, save_dataframe, save_time_map, time_map_provenance, save_pipeline_report, save_yaml, save_in_background, wait_for_writes, OUTPUT_FORMATS, create_1D_signal, calculate_1D_signal_derivative, resample, annotate_events
+from utils.cache import get_signal_cache
+from utils.instrumentation import DISABLED, PROFILERS, get_instrumentation, format_totals
 
 
-def process_signal(input_file, sensor_name, outlier_neighbors, diverse_settings):
+def process_signal(input_file, sensor_name, outlier_neighbors, diverse_settings, instrumentation=DISABLED):
+    cache = get_signal_cache(diverse_settings)
+    if cache is not None:
+        outlier_method = diverse_settings.get('outlier_methods', {}).get(sensor_name, 'lof')
+        with instrumentation.stage('signal_cache', file=input_file) as record:
+            cache_key = cache.key(input_file, sensor_name, outlier_neighbors, outlier_method, diverse_settings)
+            cached = cache.get(cache_key)
+            record['hit'] = cached is not None
+        if cached is not None:
+            return cached
+
+    columns = required_columns(sensor_name) if diverse_settings.get('load_sensor_columns_only') else None
+    with instrumentation.stage('load_data', file=input_file) as record:
+        df = load_data(input_file, columns=columns, time_range=diverse_settings.get('time_range'))
+        record['samples'] = len(df)
+        record['columns'] = len(df.columns)
+    df, _, event_stats, signal_column = process_dataframe(df, sensor_name, outlier_neighbors, diverse_settings, instrumentation, input_file)
+
+    if cache is not None:
+        cache.put(cache_key, (df, event_stats, signal_column))
+    return df, event_stats, signal_column
+
+
+def process_dataframe(df, sensor_name, outlier_neighbors, diverse_settings, instrumentation=DISABLED, input_file=None):
     #assert time column
     threshold = diverse_settings['min_time_event']
     min_outlier_percentage = diverse_settings['min_outlier_fraction_event']
     normalization_window_duration = diverse_settings['normalization_window_duration']
     signal_column = '1d_signal'
+    samples = len(df)
 
-    df = load_data(input_file)
-    df = create_1D_signal(df, sensor_name)
+    with instrumentation.stage('create_1D_signal', file=input_file, samples=samples):
+        df = create_1D_signal(df, sensor_name)
 
-    if sensor_name == 'sensomative':
-        df = calculate_1D_signal_derivative(df, '1d_signal')
-        signal_column = '1d_signal_derivative'
+        if sensor_name == 'sensomative':
+            df = calculate_1D_signal_derivative(df, '1d_signal')
+            signal_column = '1d_signal_derivative'
 
-    outlier_flags = detect_outliers(df, signal_column, n_neighbors=outlier_neighbors)
-    
-    events = identify_events(df, outlier_flags, time_column='time', threshold=threshold, min_outlier_percentage=min_outlier_percentage)
+    outlier_method = diverse_settings.get('outlier_methods', {}).get(sensor_name, 'lof')
+    with instrumentation.stage('detect_outliers', file=input_file, samples=samples, method=outlier_method) as record:
+        outlier_flags = detect_outliers(df, signal_column, n_neighbors=outlier_neighbors, method=outlier_method)
+        record['outliers'] = int(outlier_flags.sum())
 
-    event_stats = extract_event_information(df, events, signal_column, normalization_window_duration, time_column='time')
-    df = annotate_events(df, events)
-    return df, event_stats, signal_column
+    with instrumentation.stage('identify_events', file=input_file, samples=samples) as record:
+        events = identify_events(df, outlier_flags, time_column='time', threshold=threshold, min_outlier_percentage=min_outlier_percentage)
+        record['events'] = len(events)
 
+    with instrumentation.stage('extract_event_information', file=input_file, events=len(events)):
+        event_stats = extract_event_information(df, events, signal_column, normalization_window_duration, time_column='time')
+    with instrumentation.stage('annotate_events', file=input_file, samples=samples, events=len(events)):
+        df = annotate_events(df, events)
+    return df, events, event_stats, signal_column
 
-def run_synchronization_pipeline(reference_file, file_to_align, sensor_name_reference, sensor_name_align, outlier_neighbors_reference, outlier_neighbors_align, diverse_settings, plotting, plot_settings):
-    df1, reference_event, reference_signal = process_signal(reference_file, sensor_name_reference, outlier_neighbors_reference, diverse_settings)
-    df2, align_events, align_signal = process_signal(file_to_align, sensor_name_align, outlier_neighbors_align, diverse_settings)
-    
+
+def run_synchronization_pipeline(reference_file, file_to_align, sensor_name_reference, sensor_name_align, outlier_neighbors_reference, outlier_neighbors_align, diverse_settings, plotting, plot_settings, report=None):
+    # With instrumentation enabled in diverse_settings, the stage report of the run is added to report (if given)
+    instrumentation = get_instrumentation(diverse_settings)
+    processed_reference = process_signal(reference_file, sensor_name_reference, outlier_neighbors_reference, diverse_settings, instrumentation)
+    return run_alignment(processed_reference, reference_file, file_to_align, sensor_name_reference, sensor_name_align, outlier_neighbors_align, diverse_settings, plotting, plot_settings,
+                         instrumentation, report)
+
+
+def match_events(reference_events, align_events, sensor_name_reference, sensor_name_align, diverse_settings, statistics=None):
+    # Compares the events with the configured matching method, returns the matches and the distance threshold for sync points.
+    # The counts of candidate pairs and evaluated comparisons are added to statistics (if given).
     max_time_gap_events = diverse_settings["max_time_gap_events"]
+    matching_method = diverse_settings.get('event_matching_method', 'dtw')
     if sensor_name_reference == 'sensomative' or sensor_name_align == 'sensomative':
-        comparison_results = compare_events_dtw(reference_event, align_events, max_time_gap_events) # could be replaced by better method
-        dtw_distance_threshold = diverse_settings['dtw_distance_threshold_sensomative']
+        dtw_distance_threshold = diverse_settings[f'{matching_method}_distance_threshold_sensomative']
     else:
-        comparison_results = compare_events_dtw(reference_event, align_events, max_time_gap_events)
-        dtw_distance_threshold = diverse_settings['dtw_distance_threshold_accelerator']
+        dtw_distance_threshold = diverse_settings[f'{matching_method}_distance_threshold_accelerator']
+    assignment = diverse_settings.get('event_assignment', EVENT_ASSIGNMENT)
+    statistics = {} if statistics is None else statistics
+    if matching_method == 'cca':
+        comparison_results = compare_events_cca(reference_events, align_events, max_time_gap_events,
+                                                diverse_settings.get('cca_sampling_rate', CCA_SAMPLING_RATE), dtw_distance_threshold,
+                                                statistics, assignment)
+    else:
+        comparison_results = compare_events_dtw(reference_events, align_events, max_time_gap_events, dtw_distance_threshold,
+                                                diverse_settings.get('dtw_window_fraction', DTW_WINDOW_FRACTION), statistics, assignment)
+    print(f"Compared {statistics['evaluated']} of {statistics['candidates']} candidate event pairs "
+          f"({len(reference_events)} x {len(align_events)} events)")
+    return comparison_results, dtw_distance_threshold
+
+
+def coarse_match_events(df1, df2, reference_signal, align_signal, reference_events, align_events, sensor_name_reference, sensor_name_align,
+                        diverse_settings, statistics=None):
+    # match_events with coarse_alignment: the global offset candidates (and optionally the clock rate) between the
+    # recordings are estimated from the cross-correlation of their envelopes, the events to align are pre-shifted by each
+    # of them and matched, so the matching only has to cover the remaining difference within max_time_gap_events.
+    # The matches with the most sync points that agree on one offset are kept (on ties the unshifted events, then the
+    # candidate with the higher correlation). The sync points use the original times.
+    if not diverse_settings.get('coarse_alignment'):
+        return match_events(reference_events, align_events, sensor_name_reference, sensor_name_align, diverse_settings, statistics)
+    candidates = estimate_offset_candidates(df1['time'].to_numpy(), df1[reference_signal].to_numpy(), df2['time'].to_numpy(),
+                                            df2[align_signal].to_numpy(), diverse_settings.get('coarse_sampling_rate', COARSE_SAMPLING_RATE),
+                                            diverse_settings.get('coarse_max_offset'), diverse_settings.get('coarse_estimate_rate', False),
+                                            diverse_settings.get('coarse_candidates', COARSE_CANDIDATES))
+    best = None
+    reference_times, align_times = df1['time'].to_numpy(), df2['time'].to_numpy()
+    for coarse_mapping in [None] + candidates:
+        events = align_events if coarse_mapping is None else shift_events(align_events, coarse_mapping)
+        counts = {}
+        comparison_results, dtw_distance_threshold = match_events(reference_events, events, sensor_name_reference, sensor_name_align,
+                                                                  diverse_settings, counts)
+        sync_indices = select_sync_points(comparison_results, sensor_name_reference, sensor_name_align, dtw_distance_threshold)
+        score = consistent_sync_points(reference_times[[index1 for index1, _ in sync_indices]], align_times[[index2 for _, index2 in sync_indices]],
+                                       diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD))
+        if best is None or score > best[0] + (COARSE_MIN_GAIN - 1 if best[1] is None else 0):
+            best = (score, coarse_mapping, comparison_results, dtw_distance_threshold, counts)
+
+    sync_points, coarse_mapping, comparison_results, dtw_distance_threshold, counts = best
+    if coarse_mapping is None:
+        print(f"Coarse alignment: none of {len(candidates)} offset candidates has more consistent sync points, the events are not pre-shifted")
+    else:
+        print(f"Coarse alignment: offset {coarse_mapping.time_shift:.3f} s, clock rate {coarse_mapping.rate:.6f}, "
+              f"correlation {coarse_mapping.confidence['correlation']:.3f} ({sync_points} consistent sync points)")
+    if statistics is not None:
+        statistics.update(counts, coarse_candidates=len(candidates),
+                          coarse_offset=coarse_mapping.time_shift if coarse_mapping is not None else 0.0,
+                          coarse_rate=coarse_mapping.rate if coarse_mapping is not None else 1.0)
+    return comparison_results, dtw_distance_threshold
+
+
+def run_alignment(processed_reference, reference_file, file_to_align, sensor_name_reference, sensor_name_align, outlier_neighbors_align, diverse_settings, plotting, plot_settings,
+                  instrumentation=None, report=None):
+    # processed_reference is the output of process_signal for the reference file, it can be reused for several files to align
+    if instrumentation is None:
+        instrumentation = get_instrumentation(diverse_settings)
+    df1, reference_event, reference_signal = processed_reference
+    df1 = df1.copy()
+    df2, align_events, align_signal = process_signal(file_to_align, sensor_name_align, outlier_neighbors_align, diverse_settings, instrumentation)
+    
+    with instrumentation.stage('match_events', file=file_to_align, reference_events=len(reference_event), align_events=len(align_events)) as record:
+        comparison_results, dtw_distance_threshold = coarse_match_events(df1, df2, reference_signal, align_signal, reference_event, align_events,
+                                                                         sensor_name_reference, sensor_name_align, diverse_settings, record)
+        record['matches'] = len(comparison_results)
     
     for result in comparison_results:
         print(f"Reference File Event ID: {result['event1_id']} best matches with File to Align Event ID: {result['best_match_event2_id']}, dtw_distance: {result['dtw_distance']}")
 
     # Align the signals
-    original_df2, df2_aligned = align_signals(df1, df2, comparison_results, sensor_name_reference, sensor_name_align, dtw_distance_threshold)
+    with instrumentation.stage('create_time_mapping', file=file_to_align, matches=len(comparison_results)) as record:
+        sync_points = collect_sync_points(df1, df2, comparison_results, sensor_name_reference, sensor_name_align, dtw_distance_threshold)
+        time_mapping = build_time_mapping(sync_points, diverse_settings.get('drift_model', 'piecewise'),
+                                          diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD))
+        record['sync_points'] = int(df2['sync_point'].notna().sum())
+    print_drift_model(time_mapping, diverse_settings)
+    original_df2 = df2
+    with instrumentation.stage('apply_alignment', file=file_to_align, samples=len(df2), reference_samples=len(df1)):
+        df2_aligned, resampled_df2 = apply_alignment(time_mapping, df1, df2, align_signal)
+    
+    if diverse_settings['save_output_files']:
+        with instrumentation.stage('save_alignment', file=file_to_align, rows=len(df1) + len(df2_aligned) + len(resampled_df2)):
+            time_map = TimeMap(time_mapping, sync_points, time_map_provenance(reference_file, file_to_align, sensor_name_reference,
+                                                                             sensor_name_align, diverse_settings))
+            save_alignment(df1, df2_aligned, resampled_df2, time_map, file_to_align, sensor_name_reference, diverse_settings['output_folder_path'],
+                           diverse_settings)
+    
+    if plotting:
+        # Plot combined figures interactively using visualization module (plotly is only imported for plotting)
+        from utils.visualization import plot_interactive_html
+        with instrumentation.stage('plot', file=file_to_align):
+            plot_interactive_html(
+                df1,
+                original_df2, 
+                resampled_df2, 
+                reference_signal,
+                align_signal,  
+                reference_file, 
+                file_to_align, 
+                plot_settings,
+                output_file_path("interactive_plot.html", file_to_align, sensor_name_reference, diverse_settings['output_folder_path'])
+                )
+
+    if instrumentation.enabled:
+        run_report = instrumentation.report()
+        if report is not None:
+            report.update(run_report)
+        if diverse_settings['save_output_files']:
+            save_pipeline_report(run_report, file_to_align, sensor_name_reference, diverse_settings['output_folder_path'])
+    return comparison_results
+
+
+def align_dataframe(processed_reference, df2, sensor_name_reference, sensor_name_align, outlier_neighbors_align, diverse_settings):
+    # In-memory counterpart of run_alignment for a recording that is already loaded (sorted by time with a RangeIndex,
+    # e.g. synthesized by drift_synthesis.py): returns the time mapping and the (align time, reference time) sync
+    # points, nothing is saved or plotted and processed_reference is not changed
+    df1, reference_events, reference_signal = processed_reference
+    df2, _, align_events, align_signal = process_dataframe(df2.copy(), sensor_name_align, outlier_neighbors_align, diverse_settings)
+    comparison_results, dtw_distance_threshold = coarse_match_events(df1, df2, reference_signal, align_signal, reference_events, align_events,
+                                                                    sensor_name_reference, sensor_name_align, diverse_settings)
+    sync_indices = select_sync_points(comparison_results, sensor_name_reference, sensor_name_align, dtw_distance_threshold)
+    reference_times, align_times = df1['time'].to_numpy(), df2['time'].to_numpy()
+    sync_points = [(align_times[align_index], reference_times[reference_index]) for reference_index, align_index in sync_indices]
+    time_mapping = build_time_mapping(sync_points, diverse_settings.get('drift_model', 'piecewise'),
+                                      diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD))
+    return time_mapping, sync_points
+
+
+def print_drift_model(time_mapping, diverse_settings):
+    if diverse_settings.get('drift_model', 'piecewise') != 'piecewise':
+        confidence = time_mapping.confidence
+        print(f"Drift model ({time_mapping.model}): time shift {time_mapping.time_shift:.3f} s, clock rate {time_mapping.rate:.6f}, "
+              f"{confidence['inliers']} of {len(time_mapping.residuals)} sync points within {diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD)} s, "
+              f"residual RMS {confidence['residual_rms']}, rate std {confidence['rate_std']}")
+
+
+def apply_alignment(time_mapping, df1, df2, align_signal):
+    # Maps the time column of df2 onto the reference clock and resamples the aligned signal onto the times of df1
+    df2_aligned = time_mapping.apply_to_dataframe(df2)
     df2_aligned['timestamp'] = pd.to_datetime(df2_aligned['time'], unit='s')
 
     #align_signal = '1d_signal' # comment out if you want the derivative (for sensomative) in the plot and saved files
     # Resample the aligned signal to match the reference frequency and timestamps
     resampled_df2 = resample(df2_aligned, df1, signal_column=align_signal)
     resampled_df2['timestamp'] = pd.to_datetime(resampled_df2['time'], unit='s')
-    
-    if diverse_settings['save_output_files']:
-        output_folder_path = diverse_settings['output_folder_path']
-        # Save updated versions of the dataframes to output_folder_path
-        save_dataframe_to_csv(df1, file_to_align, sensor_name_reference, "updated", output_folder_path)
-        save_dataframe_to_csv(df2_aligned, file_to_align, sensor_name_reference, "aligned", output_folder_path)
-        save_dataframe_to_csv(resampled_df2, file_to_align, sensor_name_reference, "resampled", output_folder_path)
-    
-    if plotting:
-        # Plot combined figures interactively using visualization module
-        plot_interactive_html(
-            df1,
-            original_df2, 
-            resampled_df2, 
-            reference_signal,
-            align_signal,  
-            reference_file, 
-            file_to_align, 
-            plot_settings
-            )
+    return df2_aligned, resampled_df2
 
-def main():
-    parser = argparse.ArgumentParser(description="Run event detection and signal alignment.")
-    parser.add_argument("--config", required=True, help="Path to the configuration YAML file.")
-    args = parser.parse_args()
 
-    # Load configuration from the specified config file
-    with open(args.config, 'r') as config_file:
-        config = yaml.safe_load(config_file)
+def save_alignment(df1, df2_aligned, resampled_df2, time_map, file_to_align, sensor_name_reference, output_folder_path, diverse_settings=None):
+    # Save updated versions of the dataframes and the time map (TimeMap) to output_folder_path in output_format, with
+    # output_content 'mapping' only the time map, with background_writes the files are written in a background thread
+    diverse_settings = diverse_settings or {}
+    output_format = diverse_settings.get('output_format', 'csv')
+    save = save_in_background if diverse_settings.get('background_writes') else (lambda function, *args: function(*args))
+    if diverse_settings.get('output_content', 'full') != 'mapping':
+        save(save_dataframe, df1, file_to_align, sensor_name_reference, "updated", output_folder_path, output_format)
+        save(save_dataframe, df2_aligned, file_to_align, sensor_name_reference, "aligned", output_folder_path, output_format)
+        save(save_dataframe, resampled_df2, file_to_align, sensor_name_reference, "resampled", output_folder_path, output_format)
+    save(save_time_map, time_map, file_to_align, sensor_name_reference, output_folder_path)
 
-    # Dynamic settings
-    reference_file = config['reference_file']
-    file_to_align = config['file_to_align']
-    sensor_name_reference = config['sensor_name_reference']
-    sensor_name_align = config['sensor_name_align']
- 
+
+def settings_from_config(config):
     # Static settings
     outlier_settings = {
         'cosinuss': config['outlier_neighbors_cosinuss'],
@@ -110,8 +265,25 @@ def main():
         'sensomative': config['outlier_neighbors_sensomative']
     }
 
-    outlier_neighbors_reference = outlier_settings[sensor_name_reference]
-    outlier_neighbors_align = outlier_settings[sensor_name_align]
+    outlier_methods = {
+        'cosinuss': config.get('outlier_method_cosinuss', 'lof'),
+        'corsano': config.get('outlier_method_corsano', 'lof'),
+        'vivalink': config.get('outlier_method_vivalink', 'lof'),
+        'sensomative': config.get('outlier_method_sensomative', 'lof')
+    }
+
+    if config.get('event_matching_method', 'dtw') not in ('dtw', 'cca'):
+        raise ValueError(f"Unknown event_matching_method '{config['event_matching_method']}', supported: dtw, cca")
+    if config.get('drift_model', 'piecewise') not in ('piecewise', 'affine', 'spline'):
+        raise ValueError(f"Unknown drift_model '{config['drift_model']}', supported: piecewise, affine, spline")
+    if config.get('output_format', 'csv') not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format '{config['output_format']}', supported: {', '.join(OUTPUT_FORMATS)}")
+    if config.get('output_content', 'full') not in ('full', 'mapping'):
+        raise ValueError(f"Unknown output_content '{config['output_content']}', supported: full, mapping")
+    if (config.get('instrumentation_profiler') or '') not in PROFILERS:
+        raise ValueError(f"Unknown instrumentation_profiler '{config['instrumentation_profiler']}', supported: cprofile, tracemalloc")
+    if config.get('coarse_alignment') and config.get('out_of_core'):
+        raise ValueError("coarse_alignment is not supported in out-of-core mode (out_of_core: True)")
 
     diverse_settings = {
         'min_time_event': config['min_time_event'],
@@ -119,8 +291,31 @@ def main():
         'max_time_gap_events': config['max_time_gap_events'],
         'dtw_distance_threshold_accelerator': config['dtw_distance_threshold_accelerator'],
         'dtw_distance_threshold_sensomative': config['dtw_distance_threshold_sensomative'],
+        'dtw_window_fraction': config.get('dtw_window_fraction', DTW_WINDOW_FRACTION),
+        'event_matching_method': config.get('event_matching_method', 'dtw'),
+        'event_assignment': config.get('event_assignment', EVENT_ASSIGNMENT),
+        'cca_distance_threshold_accelerator': config.get('cca_distance_threshold_accelerator', 0.5),
+        'cca_distance_threshold_sensomative': config.get('cca_distance_threshold_sensomative', 0.8),
+        'cca_sampling_rate': config.get('cca_sampling_rate', CCA_SAMPLING_RATE),
+        'drift_model': config.get('drift_model', 'piecewise'),
+        'drift_inlier_threshold': config.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD),
         'normalization_window_duration': config['normalization_window_duration'],
+        'coarse_alignment': config.get('coarse_alignment', False),
+        'coarse_sampling_rate': config.get('coarse_sampling_rate', COARSE_SAMPLING_RATE),
+        'coarse_max_offset': config.get('coarse_max_offset'),
+        'coarse_estimate_rate': config.get('coarse_estimate_rate', False),
+        'coarse_candidates': config.get('coarse_candidates', COARSE_CANDIDATES),
+        'outlier_methods': outlier_methods,
+        'load_sensor_columns_only': config.get('load_sensor_columns_only', False),
+        'time_range': config.get('time_range'),
+        'cache_folder_path': config.get('cache_folder_path'),
+        'cache_max_size_mb': config.get('cache_max_size_mb', 500),
+        'instrumentation': config.get('instrumentation', False),
+        'instrumentation_profiler': config.get('instrumentation_profiler') or '',
         'save_output_files': config['save_output_files'],
+        'output_format': config.get('output_format', 'csv'),
+        'output_content': config.get('output_content', 'full'),
+        'background_writes': config.get('background_writes', False),
         'output_folder_path': config['output_folder_path']
     }
 
@@ -128,11 +323,44 @@ def main():
     plotting = config['plotting']
     plot_settings = {
         'scaling_factor_reference': config['scaling_factor_reference'],
-        'scaling_factor_align': config['scaling_factor_align']
+        'scaling_factor_align': config['scaling_factor_align'],
+        'decimation': config.get('plot_decimation', True),
+        'max_points': config.get('plot_max_points', 10000),
+        'event_panels': config.get('plot_event_panels', False),
+        'auto_open': config.get('plot_auto_open', True)
     }
+    return outlier_settings, diverse_settings, plotting, plot_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run event detection and signal alignment.")
+    parser.add_argument("--config", required=True, help="Path to the configuration YAML file.")
+    args = parser.parse_args()
+
+    # Load configuration from the specified config file
+    with open(args.config, 'r') as config_file:
+        config = yaml.safe_load(config_file)
+
+    if config.get('files_to_align'):
+        run_multi_device(config, args.config)
+        return
+    if config.get('out_of_core'):
+        run_out_of_core(config, args.config)
+        return
+
+    # Dynamic settings
+    reference_file = config['reference_file']
+    file_to_align = config['file_to_align']
+    sensor_name_reference = config['sensor_name_reference']
+    sensor_name_align = config['sensor_name_align']
+ 
+    outlier_settings, diverse_settings, plotting, plot_settings = settings_from_config(config)
+    outlier_neighbors_reference = outlier_settings[sensor_name_reference]
+    outlier_neighbors_align = outlier_settings[sensor_name_align]
 
     print(f"Processing files: {reference_file} (Sensor: {sensor_name_reference}) and {file_to_align} (Sensor: {sensor_name_align})")
 
+    report = {}
     run_synchronization_pipeline(
         reference_file, 
         file_to_align, 
@@ -142,12 +370,53 @@ def main():
         outlier_neighbors_align,
         diverse_settings,
         plotting,
-        plot_settings
+        plot_settings,
+        report=report
         )
 
+    wait_for_writes()
+    if report:
+        print(format_totals(report['totals']))
+
+    cache = get_signal_cache(diverse_settings)
+    if cache is not None:
+        print(f"Signal cache: {cache.stats['hits']} hits, {cache.stats['misses']} misses, {cache.stats['evictions']} evictions")
+        cache.flush_stats()
+
     if diverse_settings['save_output_files']:
         # copy config yaml to output folder
         save_yaml(args.config, file_to_align, sensor_name_reference, diverse_settings["output_folder_path"])
 
+def run_multi_device(config, config_file_path):
+    # Aligns all files_to_align to the reference file in one run (see multi_device.py)
+    from multi_device import run_multi_device_synchronization
+
+    reference_file = config['reference_file']
+    sensor_name_reference = config['sensor_name_reference']
+    files_to_align = [(entry['file'], entry['sensor']) for entry in config['files_to_align']]
+    outlier_settings, diverse_settings, _, _ = settings_from_config(config)
+
+    run_multi_device_synchronization(reference_file, sensor_name_reference, files_to_align, outlier_settings, diverse_settings,
+                                     config.get('transitive_alignment', False), config.get('multi_device_workers') or None)
+
+    if diverse_settings['save_output_files']:
+        for file_to_align, _ in files_to_align:
+            save_yaml(config_file_path, file_to_align, sensor_name_reference, diverse_settings["output_folder_path"])
+
+
+def run_out_of_core(config, config_file_path):
+    # Aligns file_to_align to the reference file in chunks of chunk_size rows (see out_of_core.py)
+    from out_of_core import run_out_of_core_alignment, CHUNK_SIZE
+
+    outlier_settings, diverse_settings, plotting, _ = settings_from_config(config)
+    if plotting:
+        print("Plotting is not supported in out-of-core mode")
+    run_out_of_core_alignment(config['reference_file'], config['file_to_align'], config['sensor_name_reference'], config['sensor_name_align'],
+                              outlier_settings, diverse_settings, config.get('chunk_size', CHUNK_SIZE))
+
+    if diverse_settings['save_output_files']:
+        save_yaml(config_file_path, config['file_to_align'], config['sensor_name_reference'], diverse_settings["output_folder_path"])
+
+
 if __name__ == "__main__":
     main()
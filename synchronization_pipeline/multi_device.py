@@ -0,0 +1,146 @@
+# Multi-device mode of the synchronization pipeline: several files recorded at the same time (e.g. corsano, cosinuss,
+# vivalink and sensomative of one session) are aligned to one reference file in one run.
+# The reference file is processed once and every device is processed, matched and aligned in a pool of worker
+# processes. The outputs of every device are saved as in the pairwise mode (aligned_to_<reference sensor>/<file>/) and
+# all signals are additionally resampled onto the timeline of the reference in one table
+# (aligned_to_<reference sensor>/<reference file>/synchronized_<reference file>.csv).
+# With transitive_alignment, a device without any sync point with the reference is aligned through the device with the
+# most sync points to it, whose time mapping to the reference is then applied on top.
+#
+# Config (instead of file_to_align and sensor_name_align):
+#   files_to_align:
+#     - file: 'path/to/corsano.csv'
+#       sensor: 'corsano'
+#     - file: 'path/to/sensomative.csv'
+#       sensor: 'sensomative'
+
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from main import process_signal, coarse_match_events, apply_alignment, save_alignment, print_drift_model
+from pipeline_steps.signal_alignment import collect_sync_points, build_time_mapping
+from pipeline_steps.time_mapping import DRIFT_INLIER_THRESHOLD, TimeMap
+from utils.data_utils import save_dataframe, time_map_provenance
+
+
+def align_device(processed_reference, sensor_name_reference, file_to_align, sensor_name_align, outlier_neighbors_align, diverse_settings,
+                 transitive_alignment=False, reference_file=None):
+    """
+    Processes one device, matches its events with the reference and aligns it (run in a worker process). Returns the
+    processed device with its sync points, time mapping and resampled signal. A device without sync points is not
+    aligned yet (resampled_signal None) if it may still be aligned transitively.
+    """
+    df1, reference_events, reference_signal = processed_reference
+    df1 = df1.copy()
+    df2, align_events, align_signal = process_signal(file_to_align, sensor_name_align, outlier_neighbors_align, diverse_settings)
+
+    print(f"Aligning {file_to_align} (Sensor: {sensor_name_align})")
+    comparison_results, dtw_distance_threshold = coarse_match_events(df1, df2, reference_signal, align_signal, reference_events, align_events,
+                                                                    sensor_name_reference, sensor_name_align, diverse_settings)
+    sync_points = collect_sync_points(df1, df2, comparison_results, sensor_name_reference, sensor_name_align, dtw_distance_threshold)
+    device = {
+        'file': file_to_align,
+        'sensor': sensor_name_align,
+        'reference_file': reference_file,
+        'df': df2,
+        'events': align_events,
+        'signal_column': align_signal,
+        'reference_df': df1,        # reference with the sync points of this device marked
+        'sync_points': sync_points,
+        'time_mapping': _time_mapping(sync_points, diverse_settings),
+        'aligned_via': 'reference',
+        'resampled_signal': None
+    }
+    if sync_points or not transitive_alignment:
+        device = finish_device(device, sensor_name_reference, diverse_settings)
+    return device
+
+
+def finish_device(device, sensor_name_reference, diverse_settings):
+    """Applies the time mapping of the device, resamples its signal onto the reference times and saves the outputs."""
+    df2_aligned, resampled_df2 = apply_alignment(device['time_mapping'], device['reference_df'], device['df'], device['signal_column'])
+    if diverse_settings['save_output_files']:
+        provenance = time_map_provenance(device['reference_file'], device['file'], sensor_name_reference, device['sensor'], diverse_settings)
+        provenance['aligned_via'] = device['aligned_via']
+        time_map = TimeMap(device['time_mapping'], device['sync_points'], provenance)
+        save_alignment(device['reference_df'], df2_aligned, resampled_df2, time_map, device['file'], sensor_name_reference,
+                       diverse_settings['output_folder_path'], diverse_settings)
+    # only what the shared table and a transitive alignment need is sent back to the main process
+    return dict(device, reference_df=None, resampled_signal=resampled_df2[device['signal_column']].to_numpy())
+
+
+def align_transitively(device, intermediates, diverse_settings):
+    """
+    Aligns a device without sync points to the reference through the intermediate device with the most sync points to
+    it: the sync points with the intermediate device are mapped onto the reference clock with its time mapping.
+    Returns the updated device or None if no intermediate device has sync points with it.
+    """
+    best = None
+    for intermediate in intermediates:
+        comparison_results, dtw_distance_threshold = coarse_match_events(intermediate['df'], device['df'], intermediate['signal_column'],
+                                                                        device['signal_column'], intermediate['events'], device['events'],
+                                                                        intermediate['sensor'], device['sensor'], diverse_settings)
+        df2 = device['df'].copy(deep=False)    # sync points with this intermediate device are marked on the copy
+        sync_points = collect_sync_points(intermediate['df'].copy(deep=False), df2, comparison_results,
+                                          intermediate['sensor'], device['sensor'], dtw_distance_threshold)
+        if sync_points and (best is None or len(sync_points) > len(best[2])):
+            best = (intermediate, df2, sync_points)
+    if best is None:
+        return None
+
+    intermediate, df2, sync_points = best
+    align_times = [align_time for align_time, _ in sync_points]
+    reference_times = intermediate['time_mapping']([intermediate_time for _, intermediate_time in sync_points])
+    sync_points = list(zip(align_times, reference_times))
+    return dict(device, df=df2, sync_points=sync_points, time_mapping=_time_mapping(sync_points, diverse_settings),
+                aligned_via=intermediate['file'])
+
+
+def run_multi_device_synchronization(reference_file, sensor_name_reference, files_to_align, outlier_settings, diverse_settings,
+                                     transitive_alignment=False, workers=None):
+    """
+    Aligns several devices to one reference file and returns the table of all signals on the reference timeline.
+
+    Parameters:
+        files_to_align (list): (file, sensor name) of every device.
+        transitive_alignment (bool): Align devices without sync points with the reference through another device.
+        workers (int): Number of worker processes, None for the number of CPUs.
+    """
+    print(f"Processing reference file: {reference_file} (Sensor: {sensor_name_reference})")
+    processed_reference = process_signal(reference_file, sensor_name_reference, outlier_settings[sensor_name_reference], diverse_settings)
+    df1, _, reference_signal = processed_reference
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(align_device, processed_reference, sensor_name_reference, file_to_align, sensor_name_align,
+                                   outlier_settings[sensor_name_align], diverse_settings, transitive_alignment, reference_file)
+                   for file_to_align, sensor_name_align in files_to_align]
+        devices = [future.result() for future in futures]
+
+    if transitive_alignment:
+        intermediates = [device for device in devices if device['sync_points']]
+        for index, device in enumerate(devices):
+            if device['resampled_signal'] is None:
+                device = (align_transitively(device, intermediates, diverse_settings) if intermediates else None) or device
+                devices[index] = finish_device(device, sensor_name_reference, diverse_settings)
+
+    # shared timeline: the times of the reference
+    synchronized = pd.DataFrame({'time': df1['time'], 'timestamp': pd.to_datetime(df1['time'], unit='s')})
+    synchronized[f"{sensor_name_reference}_{reference_signal}"] = df1[reference_signal].to_numpy()
+    for device in devices:
+        column = f"{device['sensor']}_{device['signal_column']}"
+        if column in synchronized.columns:
+            column = f"{column}_{os.path.splitext(os.path.basename(device['file']))[0]}"
+        synchronized[column] = device['resampled_signal']
+        print(f"{device['file']} (Sensor: {device['sensor']}): {len(device['sync_points'])} sync points, aligned via {device['aligned_via']}")
+        print_drift_model(device['time_mapping'], diverse_settings)
+
+    if diverse_settings['save_output_files']:
+        save_dataframe(synchronized, reference_file, sensor_name_reference, "synchronized", diverse_settings['output_folder_path'],
+                       diverse_settings.get('output_format', 'csv'))
+    return synchronized
+
+
+def _time_mapping(sync_points, diverse_settings):
+    return build_time_mapping(sync_points, diverse_settings.get('drift_model', 'piecewise'),
+                              diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD))
@@ -0,0 +1,244 @@
+# Out-of-core (chunked) version of the synchronization pipeline for recordings larger than the memory.
+# Each recording is read twice in chunks of chunk_size rows (see iter_data_chunks):
+# 1. The 1D signal, the outlier flags and the events are computed chunk by chunk. The outlier detection sees
+#    2 * outlier_neighbors samples of the neighbouring chunks, the event scan is resumed where an event could still grow
+#    and the event information keeps the normalization window before the next event. Only the event information and
+#    the event ranges are kept.
+# 2. After matching the events and creating the time mapping, the updated, aligned and resampled files are written
+#    chunk by chunk (in output_format) while both recordings are read again. With output_content: 'mapping' only the
+#    time mapping and the time map (time_map.json) are saved and the recordings are not read again.
+# The result is the same as processing the recordings in memory. LOF ('lof', 'lof_1d') compares every sample with the
+# whole recording, so for LOF the 1D signal of the whole recording (8 bytes per sample) is collected in an additional
+# pass first and the flags are computed on it at once ('lof' with lof_sklearn_batched, the same flags as sklearn without
+# its neighbour matrices). The rolling detectors (rolling_mad, rolling_zscore) only need the neighbouring chunks.
+#
+# Usage (config.yaml): out_of_core: True, chunk_size: 1000000
+
+import os
+import numpy as np
+import pandas as pd
+
+from main import match_events, print_drift_model
+from pipeline_steps.outlier_detection import detect_outliers, lof_sklearn_batched, lof_1d
+from pipeline_steps.event_detection import scan_events
+from pipeline_steps.event_information import extract_event_information
+from pipeline_steps.signal_alignment import select_sync_indices, event_value_time, build_time_mapping
+from pipeline_steps.time_mapping import DRIFT_INLIER_THRESHOLD, TimeMap
+from utils.data_utils import iter_data_chunks, required_columns, create_1D_signal, save_time_map, time_map_provenance, write_chunks, OUTPUT_FORMATS
+
+# Number of rows read at once
+CHUNK_SIZE = 1000000
+# Outlier detectors that compare every sample with the whole recording and run on the whole 1D signal
+GLOBAL_OUTLIER_DETECTORS = {'lof': lof_sklearn_batched, 'lof_1d': lof_1d}
+
+
+def process_signal_out_of_core(input_file, sensor_name, outlier_neighbors, diverse_settings, chunk_size=CHUNK_SIZE, time_column='time'):
+    """
+    Chunked equivalent of process_signal. Returns the event information (as process_signal, with the global sample
+    indices and additionally min_value_time and max_value_time), the (event_id, first, last + 1) sample ranges of the
+    events and the signal column.
+    """
+    outlier_method = diverse_settings.get('outlier_methods', {}).get(sensor_name, 'lof')
+    threshold = diverse_settings['min_time_event']
+    min_outlier_percentage = diverse_settings['min_outlier_fraction_event']
+    normalization_window_duration = diverse_settings['normalization_window_duration']
+    signal_column = '1d_signal_derivative' if sensor_name == 'sensomative' else '1d_signal'
+    context = 2 * outlier_neighbors     # samples on each side that change the outlier flags of a sample (rolling detectors)
+    global_flags = None
+    if outlier_method in GLOBAL_OUTLIER_DETECTORS:
+        global_flags = GLOBAL_OUTLIER_DETECTORS[outlier_method](_signal_values(input_file, sensor_name, chunk_size, time_column), outlier_neighbors)
+        context = 0
+
+    # samples waiting for their outlier flags, the first `flagged` ones are left context, signal_offset is the index
+    # of the first one in the recording
+    signal_times, signal_values, flagged, signal_offset = np.empty(0), np.empty(0), 0, 0
+    # flagged samples for the event scan, starting at the normalization window of the next event
+    scan_times, scan_values, scan_flags, scan_offset = np.empty(0), np.empty(0), np.empty(0, dtype=bool), 0
+    scan_position = 0
+    previous_value = None
+    event_stats, event_ranges = [], []
+
+    chunks = iter_data_chunks(input_file, chunk_size, time_column, [time_column] + required_columns(sensor_name, time_column)[2:])
+    chunk = next(chunks, None)
+    while chunk is not None:
+        next_chunk = next(chunks, None)
+        final = next_chunk is None
+
+        times, values, previous_value = _signal(chunk, sensor_name, previous_value, time_column)
+        signal_times = np.concatenate((signal_times, times))
+        signal_values = np.concatenate((signal_values, values))
+
+        # outlier flags are final once `context` samples after them are known
+        flag_end = len(signal_values) if final else max(flagged, len(signal_values) - context)
+        if flag_end > flagged:
+            if global_flags is None:
+                flags = detect_outliers(pd.DataFrame({signal_column: signal_values}), signal_column, n_neighbors=outlier_neighbors,
+                                        method=outlier_method)[flagged:flag_end]
+            else:
+                flags = global_flags[signal_offset + flagged:signal_offset + flag_end]
+            scan_times = np.concatenate((scan_times, signal_times[flagged:flag_end]))
+            scan_values = np.concatenate((scan_values, signal_values[flagged:flag_end]))
+            scan_flags = np.concatenate((scan_flags, flags))
+            keep_from = max(0, flag_end - context)
+            signal_times, signal_values, flagged = signal_times[keep_from:], signal_values[keep_from:], flag_end - keep_from
+            signal_offset += keep_from
+
+        # events that cannot grow anymore
+        ranges, resume = scan_events(scan_times, scan_flags, threshold, min_outlier_percentage, scan_position - scan_offset, final)
+        if ranges:
+            data = pd.DataFrame({time_column: scan_times, signal_column: scan_values}, index=pd.RangeIndex(scan_offset, scan_offset + len(scan_times)))
+            events = [{'event_id': len(event_ranges) + number, 'indices': list(range(first, end))} for number, (first, end) in enumerate(ranges, start=1)]
+            for stats in extract_event_information(data, events, signal_column, normalization_window_duration, time_column):
+                stats['start_index'] += scan_offset
+                stats['min_value_time'] = scan_times[stats['min_value_index'] - scan_offset]
+                stats['max_value_time'] = scan_times[stats['max_value_index'] - scan_offset]
+                event_stats.append(stats)
+            event_ranges += [(event['event_id'], first + scan_offset, end + scan_offset) for event, (first, end) in zip(events, ranges)]
+        scan_position = scan_offset + resume
+
+        # keep the normalization window of the next event
+        if len(scan_times) > 0:
+            reference_time = scan_times[min(resume, len(scan_times) - 1)]
+            keep_from = min(resume, int(np.searchsorted(scan_times, reference_time - normalization_window_duration, side='left')))
+            scan_times, scan_values, scan_flags = scan_times[keep_from:], scan_values[keep_from:], scan_flags[keep_from:]
+            scan_offset += keep_from
+        chunk = next_chunk
+
+    return event_stats, event_ranges, signal_column
+
+
+def run_out_of_core_alignment(reference_file, file_to_align, sensor_name_reference, sensor_name_align, outlier_settings, diverse_settings,
+                              chunk_size=CHUNK_SIZE):
+    """
+    Aligns file_to_align to reference_file with bounded memory and writes the same outputs as run_alignment.
+    Returns the time mapping.
+    """
+    print(f"Processing {reference_file} in chunks of {chunk_size} rows")
+    reference_events, reference_ranges, reference_signal = process_signal_out_of_core(
+        reference_file, sensor_name_reference, outlier_settings[sensor_name_reference], diverse_settings, chunk_size)
+    print(f"Processing {file_to_align} in chunks of {chunk_size} rows")
+    align_events, align_ranges, align_signal = process_signal_out_of_core(
+        file_to_align, sensor_name_align, outlier_settings[sensor_name_align], diverse_settings, chunk_size)
+
+    comparison_results, dtw_distance_threshold = match_events(reference_events, align_events, sensor_name_reference, sensor_name_align, diverse_settings)
+    reference_by_id = {event['event_id']: event for event in reference_events}
+    align_by_id = {event['event_id']: event for event in align_events}
+    sync_points, reference_sync_indices, align_sync_indices = [], [], []
+    for result in comparison_results:
+        if result['dtw_distance'] is not None and result['dtw_distance'] < dtw_distance_threshold:
+            event1_synch_index, event2_synch_index = select_sync_indices(result, sensor_name_reference, sensor_name_align)
+            reference_sync_indices.append(event1_synch_index)
+            align_sync_indices.append(event2_synch_index)
+            sync_points.append((event_value_time(align_by_id[result['best_match_event2_id']], event2_synch_index),
+                                event_value_time(reference_by_id[result['event1_id']], event1_synch_index)))
+    time_mapping = build_time_mapping(sync_points, diverse_settings.get('drift_model', 'piecewise'),
+                                      diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD))
+    print(f"{len(sync_points)} sync points")
+    print_drift_model(time_mapping, diverse_settings)
+
+    if diverse_settings['save_output_files']:
+        time_map = TimeMap(time_mapping, sync_points, time_map_provenance(reference_file, file_to_align, sensor_name_reference, sensor_name_align,
+                                                                         dict(diverse_settings, chunk_size=chunk_size)))
+        save_time_map(time_map, file_to_align, sensor_name_reference, diverse_settings['output_folder_path'])
+    if diverse_settings['save_output_files'] and diverse_settings.get('output_content', 'full') != 'mapping':
+        output_folder_path = diverse_settings['output_folder_path']
+        output_format = diverse_settings.get('output_format', 'csv')
+        target_dir = os.path.join(output_folder_path, f"aligned_to_{sensor_name_reference}", os.path.splitext(os.path.basename(file_to_align))[0])
+        os.makedirs(target_dir, exist_ok=True)
+        file_name = os.path.basename(file_to_align)
+        if output_format != 'csv':
+            file_name = os.path.splitext(file_name)[0] + OUTPUT_FORMATS[output_format]
+        output_files = {prefix: os.path.join(target_dir, f"{prefix}_{file_name}") for prefix in ('updated', 'aligned', 'resampled')}
+        columns = None
+        if diverse_settings.get('load_sensor_columns_only'):
+            columns = (required_columns(sensor_name_reference), required_columns(sensor_name_align))
+
+        reference_chunks = _annotated_chunks(reference_file, sensor_name_reference, reference_ranges, set(reference_sync_indices), chunk_size,
+                                             columns and columns[0])
+        align_chunks = _annotated_chunks(file_to_align, sensor_name_align, align_ranges, set(align_sync_indices), chunk_size,
+                                         columns and columns[1])
+        aligned_chunks = write_chunks((time_mapping.apply_to_dataframe(chunk).assign(timestamp=lambda df: pd.to_datetime(df['time'], unit='s'))
+                                        for chunk in align_chunks), output_files['aligned'], output_format)
+        reference_chunks = write_chunks(reference_chunks, output_files['updated'], output_format)
+        for _ in write_chunks(_resampled_chunks(reference_chunks, aligned_chunks, align_signal), output_files['resampled'], output_format):
+            pass
+        for _ in aligned_chunks:    # rest of the aligned file after the last reference time
+            pass
+        for output_file in output_files.values():
+            print(f"Data saved to: {output_file}")
+    return time_mapping
+
+
+def _signal(chunk, sensor_name, previous_value, time_column):
+    # 1D signal (and derivative for sensomative) of a chunk, previous_value is the last 1D signal value before it
+    df = create_1D_signal(chunk.copy(), sensor_name)
+    _add_derivative(df, sensor_name, previous_value)
+    signal_column = '1d_signal_derivative' if sensor_name == 'sensomative' else '1d_signal'
+    last_value = df['1d_signal'].iloc[-1] if len(df) else previous_value
+    return df[time_column].to_numpy(dtype=float), df[signal_column].to_numpy(dtype=float), last_value
+
+
+def _signal_values(input_file, sensor_name, chunk_size, time_column):
+    # 1D signal (derivative for sensomative) of the whole recording, read chunk by chunk
+    values, previous_value = [], None
+    for chunk in iter_data_chunks(input_file, chunk_size, time_column, [time_column] + required_columns(sensor_name, time_column)[2:]):
+        _, chunk_values, previous_value = _signal(chunk, sensor_name, previous_value, time_column)
+        values.append(chunk_values)
+    return np.concatenate(values) if values else np.empty(0)
+
+
+def _add_derivative(df, sensor_name, previous_value):
+    # same as calculate_1D_signal_derivative, continued over the chunk boundary
+    if sensor_name == 'sensomative':
+        values = df['1d_signal']
+        derivative = values.diff()
+        if previous_value is not None and len(values):
+            derivative.iloc[0] = values.iloc[0] - previous_value
+        df['1d_signal_derivative'] = derivative.fillna(0)
+    return df
+
+
+def _annotated_chunks(input_file, sensor_name, event_ranges, sync_indices, chunk_size, columns=None):
+    # chunks of the recording with the columns added by process_signal and create_time_mapping
+    previous_value = None
+    event_number = 0
+    for chunk in iter_data_chunks(input_file, chunk_size, columns=columns):
+        start, stop = chunk.index[0], chunk.index[-1] + 1
+        df = create_1D_signal(chunk, sensor_name)
+        _add_derivative(df, sensor_name, previous_value)
+        previous_value = df['1d_signal'].iloc[-1]
+
+        df['event_id'] = pd.NA
+        while event_number < len(event_ranges) and event_ranges[event_number][2] <= start:
+            event_number += 1
+        number = event_number
+        while number < len(event_ranges) and event_ranges[number][1] < stop:
+            event_id, first, end = event_ranges[number]
+            df.loc[max(first, start):min(end, stop) - 1, 'event_id'] = event_id
+            number += 1
+        df['sync_point'] = pd.NA
+        df.loc[[index for index in sync_indices if start <= index < stop], 'sync_point'] = 1
+        yield df
+
+
+def _resampled_chunks(reference_chunks, aligned_chunks, signal_column, time_column='time'):
+    # resample of the aligned signal onto the reference times, the aligned samples are read as far as needed
+    aligned_times, aligned_values = np.empty(0), np.empty(0)
+    exhausted = False
+    for reference_chunk in reference_chunks:
+        reference_times = reference_chunk[time_column]
+        while not exhausted and (len(aligned_times) == 0 or aligned_times[-1] < reference_times.iloc[-1]):
+            aligned_chunk = next(aligned_chunks, None)
+            if aligned_chunk is None:
+                exhausted = True
+                break
+            aligned_times = np.concatenate((aligned_times, aligned_chunk[time_column].to_numpy(dtype=float)))
+            aligned_values = np.concatenate((aligned_values, aligned_chunk[signal_column].to_numpy(dtype=float)))
+        resampled_signal = np.interp(reference_times, aligned_times, aligned_values)
+        resampled_df = pd.DataFrame({time_column: reference_times, signal_column: resampled_signal})
+        resampled_df['timestamp'] = pd.to_datetime(resampled_df[time_column], unit='s')
+        yield resampled_df
+
+        # keep the last aligned sample before the next reference time
+        keep_from = max(0, int(np.searchsorted(aligned_times, reference_times.iloc[-1], side='right')) - 1)
+        aligned_times, aligned_values = aligned_times[keep_from:], aligned_values[keep_from:]
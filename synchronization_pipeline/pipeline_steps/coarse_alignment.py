@@ -0,0 +1,161 @@
+import numpy as np
+
+from pipeline_steps.time_mapping import DriftModel
+
+# Sampling rate (Hz) of the decimated envelopes
+COARSE_SAMPLING_RATE = 4.0
+# An offset candidate is only used if the normalized cross-correlation at its peak is at least this large
+COARSE_MIN_CORRELATION = 0.1
+# Number of parts of the align recording whose offsets are fitted for the clock rate (estimate_rate)
+COARSE_RATE_SEGMENTS = 4
+# Estimated clock rates further than this from 1 are implausible (wrong segment peaks), the rate is then kept at 1
+COARSE_MAX_RATE_CHANGE = 1e-2
+# Number of cross-correlation peaks (offset candidates) verified by the event matching
+COARSE_CANDIDATES = 3
+# Further offset candidates need at least this fraction of the correlation of the highest peak
+COARSE_PEAK_RATIO = 0.8
+# The events are only pre-shifted if this gives at least this many more consistent sync points than without pre-shift
+COARSE_MIN_GAIN = 2
+# Offset candidates are at least this far apart (in s)
+COARSE_PEAK_SEPARATION = 2.0
+
+
+def signal_envelope(times, values, sampling_rate=COARSE_SAMPLING_RATE):
+    """
+    Returns the start time and the envelope of a signal decimated to sampling_rate: the largest absolute deviation from
+    the median in every bin of 1 / sampling_rate seconds, standardized (0 for bins without samples, so dropouts do not
+    correlate). Events are short bursts of the deviation, so the envelopes of different sensors recording the same
+    movements are similar.
+    The times must be sorted.
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    times, values = times[valid], values[valid]
+    if len(times) == 0:
+        return 0.0, np.zeros(0)
+    deviation = np.abs(values - np.median(values))
+    bins = ((times - times[0]) * sampling_rate).astype(np.int64)
+    starts = np.flatnonzero(np.diff(bins, prepend=-1))
+    filled = np.maximum.reduceat(deviation, starts)
+    std = filled.std()
+    envelope = np.zeros(bins[-1] + 1)
+    envelope[bins[starts]] = (filled - filled.mean()) / std if std > 0 else filled - filled.mean()
+    return times[0], envelope
+
+
+def cross_correlation_peaks(reference_envelope, align_envelope, sampling_rate, time_difference, max_offset=None, center=0.0,
+                            count=1, separation=COARSE_PEAK_SEPARATION):
+    """
+    Cross-correlates two envelopes (starting time_difference = reference start - align start apart) with the FFT and
+    returns the (offset, normalized correlation) of up to count peaks (local maxima at least separation seconds apart,
+    highest first), offset = reference time - align time of the same sample. Only offsets within center +- max_offset
+    are searched (all if max_offset is None).
+    """
+    peaks = []
+    n1, n2 = len(reference_envelope), len(align_envelope)
+    if n1 and n2:
+        size = 1 << int(np.ceil(np.log2(n1 + n2 - 1)))
+        spectrum = np.fft.rfft(reference_envelope, size) * np.conj(np.fft.rfft(align_envelope, size))
+        correlation = np.fft.irfft(spectrum, size)
+        # lag k (reference bin = align bin + k) for k in [-(n2 - 1), n1 - 1]
+        correlation = np.concatenate((correlation[size - (n2 - 1):], correlation[:n1])) if n2 > 1 else correlation[:n1]
+        offsets = time_difference + np.arange(-(n2 - 1), n1) / sampling_rate
+        if max_offset is not None:
+            inside = np.abs(offsets - center) <= max_offset
+            correlation, offsets = correlation[inside], offsets[inside]
+        norm = np.sqrt(np.sum(reference_envelope ** 2) * np.sum(align_envelope ** 2))
+
+        # local maxima, highest first, skipping those within separation of a higher one
+        padded = np.concatenate(([-np.inf], correlation, [-np.inf]))
+        maxima = np.flatnonzero((padded[1:-1] >= padded[:-2]) & (padded[1:-1] > padded[2:]))
+        for peak in maxima[np.argsort(-correlation[maxima], kind='stable')]:
+            if len(peaks) == count:
+                break
+            if any(abs(offsets[peak] - offset) < separation for offset, _ in peaks):
+                continue
+            shift = 0.0
+            if 0 < peak < len(correlation) - 1:
+                # parabola through the peak and its neighbours for an offset between two bins
+                left, middle, right = correlation[peak - 1:peak + 2]
+                denominator = left - 2 * middle + right
+                if denominator < 0:
+                    shift = 0.5 * (left - right) / denominator
+            peaks.append((offsets[peak] + shift / sampling_rate, float(correlation[peak] / norm) if norm > 0 else 0.0))
+    return peaks
+
+
+def cross_correlation_offset(reference_envelope, align_envelope, sampling_rate, time_difference, max_offset=None, center=0.0):
+    """Returns the (offset, normalized correlation) of the highest peak of cross_correlation_peaks, (None, 0) if none."""
+    peaks = cross_correlation_peaks(reference_envelope, align_envelope, sampling_rate, time_difference, max_offset, center)
+    return peaks[0] if peaks else (None, 0.0)
+
+
+def estimate_offset_candidates(reference_times, reference_values, align_times, align_values, sampling_rate=COARSE_SAMPLING_RATE,
+                               max_offset=None, estimate_rate=False, candidates=COARSE_CANDIDATES, segments=COARSE_RATE_SEGMENTS,
+                               segment_max_offset=10.0, min_correlation=COARSE_MIN_CORRELATION, max_rate_change=COARSE_MAX_RATE_CHANGE,
+                               peak_ratio=COARSE_PEAK_RATIO):
+    """
+    Estimates the global offset (and optionally the clock rate) between two recordings from the FFT cross-correlation of
+    their decimated envelopes over the whole recordings, O(n log n). Returns a DriftModel (model 'coarse', reference
+    time = intercept + rate * (time - center), the peak correlation in its confidence) for each of the highest
+    candidates peaks with a correlation of at least min_correlation and peak_ratio times the highest one, highest first.
+    Envelopes of short recordings or of different sensor types can have their highest peak at a wrong offset, so the
+    candidates are meant to be verified by the event matching (main.coarse_match_events).
+
+    Parameters:
+        sampling_rate (float): Sampling rate (Hz) of the envelopes, the resolution of the offset.
+        max_offset (float): Largest offset (in s) searched, None for any overlap of the recordings.
+        estimate_rate (bool): Also estimate the clock rate from the offsets of segments parts of the align recording
+            (each searched within segment_max_offset seconds of the global offset). Only segments with a correlation of
+            at least min_correlation are used, the rate is kept at 1 if it differs from 1 by more than max_rate_change.
+    """
+    reference_start, reference_envelope = signal_envelope(reference_times, reference_values, sampling_rate)
+    align_start, align_envelope = signal_envelope(align_times, align_values, sampling_rate)
+    peaks = cross_correlation_peaks(reference_envelope, align_envelope, sampling_rate, reference_start - align_start, max_offset,
+                                    count=candidates)
+    center = align_start + len(align_envelope) / (2 * sampling_rate)
+
+    models = []
+    for offset, correlation in peaks:
+        if correlation < max(min_correlation, peak_ratio * peaks[0][1]):
+            continue
+        rate = 1.0
+        if estimate_rate and segments > 1:
+            # offset of every part of the align recording, the slope of the offsets over time is the rate error
+            centers, offsets = [], []
+            for part in np.array_split(np.arange(len(align_envelope)), segments):
+                if len(part) < 2:
+                    continue
+                part_start = align_start + part[0] / sampling_rate
+                part_offset, part_correlation = cross_correlation_offset(reference_envelope, align_envelope[part], sampling_rate,
+                                                                         reference_start - part_start, segment_max_offset, offset)
+                if part_offset is not None and part_correlation >= min_correlation:
+                    centers.append(part_start + len(part) / (2 * sampling_rate))
+                    offsets.append(part_offset)
+            if len(centers) >= 2:
+                slope, intercept = np.polyfit(np.array(centers) - center, offsets, 1)
+                if abs(slope) <= max_rate_change:
+                    rate, offset = 1.0 + slope, intercept
+        models.append(DriftModel('coarse', center, center + offset, rate, confidence={'correlation': correlation}))
+    return models
+
+
+def consistent_sync_points(reference_times, align_times, tolerance):
+    """
+    Returns the number of sync points whose offset (reference time - align time) is within tolerance of the median
+    offset. Matches of the right global offset agree on it, spurious matches within max_time_gap_events do not.
+    """
+    if len(reference_times) == 0:
+        return 0
+    offsets = np.asarray(reference_times, dtype=float) - np.asarray(align_times, dtype=float)
+    return int(np.sum(np.abs(offsets - np.median(offsets)) <= tolerance))
+
+
+def shift_events(events, coarse_mapping):
+    """Returns copies of the event information with the start and end times mapped onto the reference clock."""
+    if not events:
+        return []
+    start_times = coarse_mapping(np.array([event['start_time'] for event in events], dtype=float))
+    end_times = coarse_mapping(np.array([event['end_time'] for event in events], dtype=float))
+    return [dict(event, start_time=start_time, end_time=end_time) for event, start_time, end_time in zip(events, start_times, end_times)]
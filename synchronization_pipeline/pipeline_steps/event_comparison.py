@@ -1,57 +1,336 @@
 import numpy as np
-from scipy.signal import correlate
-from fastdtw import fastdtw
-from scipy.spatial.distance import euclidean
 
+# Half width of the Sakoe-Chiba band as fraction of the longer event, None for unconstrained DTW
+DTW_WINDOW_FRACTION = 0.2
+# Common sampling rate (in Hz) of the events for the cross-correlation matcher
+CCA_SAMPLING_RATE = 25
+# 'greedy': every event1 takes its best candidate, if several take the same event2 the smaller distance wins
+# 'global': one assignment of all events maximizing the total of (threshold - distance) over the matched pairs
+EVENT_ASSIGNMENT = 'global'
 
-def compare_events_dtw(event_stats1, event_stats2, max_time_difference):
-    comparison_results = []
-    matched_event2_ids = {}
 
-    for event1 in event_stats1:
-        best_match = None
-        best_distance = np.inf
-        
-        for event2 in event_stats2:
-            if abs(event1['start_time'] - event2['start_time']) <= max_time_difference:
-                data1 = event1['normalized_event_data'].values.reshape(-1, 1)
-                data2 = event2['normalized_event_data'].values.reshape(-1, 1)
-                distance, _ = fastdtw(data1, data2, dist=euclidean)
-
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = event2
-
-        if best_match:
-            event2_id = best_match['event_id']
-
-            # Check if the event2_id is already matched
-            if event2_id not in matched_event2_ids or best_distance < matched_event2_ids[event2_id]['dtw_distance']:
-                # Update the best match for this event2_id
-                matched_event2_ids[event2_id] = {
-                    'event1_id': event1['event_id'],
-                    'dtw_distance': best_distance,
-                    'event1_min_value_index': event1['min_value_index'],
-                    'event1_max_value_index': event1['max_value_index'],
-                    'event2_min_value_index': best_match['min_value_index'],
-                    'event2_max_value_index': best_match['max_value_index']
-                }
-
-    # Prepare final results by iterating over the matched events
-    for event2_id, result in matched_event2_ids.items():
-        comparison_results.append({
-            'event1_id': result['event1_id'],
-            'best_match_event2_id': event2_id,
-            'dtw_distance': result['dtw_distance'],
-            'event1_min_value_index': result['event1_min_value_index'],
-            'event1_max_value_index': result['event1_max_value_index'],
-            'event2_min_value_index': result['event2_min_value_index'],
-            'event2_max_value_index': result['event2_max_value_index']
-        })
+def compare_events_dtw(event_stats1, event_stats2, max_time_difference, dtw_distance_threshold=np.inf, window_fraction=DTW_WINDOW_FRACTION, statistics=None, assignment=EVENT_ASSIGNMENT):
+    """
+    Matches the events of event_stats1 with the events of event_stats2 starting at most max_time_difference apart by
+    their banded DTW distance. Conflicts (several events of event_stats1 matching the same event2) are resolved
+    as given by assignment, see EVENT_ASSIGNMENT.
+
+    With the greedy assignment, candidates are visited in order of their lower bound (LB_Kim, LB_Keogh) and skipped once
+    the bound exceeds the best distance so far. The DTW itself is abandoned as soon as its cost exceeds the best distance
+    or dtw_distance_threshold. Matches at or above dtw_distance_threshold are therefore not part of the results
+    (align_signals ignores them anyway).
+
+    Parameters:
+        dtw_distance_threshold (float): Only matches below this distance are returned.
+        window_fraction (float): Half width of the Sakoe-Chiba band as fraction of the longer event, None for no band.
+        statistics (dict): If given, the counts of candidates, pruned, abandoned and evaluated DTWs are added to it.
+        assignment (str): 'greedy' or 'global'.
+    """
+    counts = {'candidates': 0, 'pruned_lower_bound': 0, 'abandoned': 0, 'evaluated': 0}
+    data1 = [np.asarray(event1['normalized_event_data'], dtype=float) for event1 in event_stats1]
+    data2 = [np.asarray(event2['normalized_event_data'], dtype=float) for event2 in event_stats2]
+    candidates = find_candidates(event_stats1, event_stats2, max_time_difference)
+    counts['candidates'] = sum(len(positions) for positions in candidates)
+
+    if assignment == 'global':
+        edges = []
+        for position1, positions2 in enumerate(candidates):
+            for position2 in positions2:
+                if dtw_lower_bound(data1[position1], data2[position2], window_fraction) >= dtw_distance_threshold:
+                    counts['pruned_lower_bound'] += 1
+                    continue
+                distance = banded_dtw(data1[position1], data2[position2], window_fraction, max_distance=dtw_distance_threshold)
+                if distance == np.inf:
+                    counts['abandoned'] += 1
+                    continue
+                counts['evaluated'] += 1
+                if distance < dtw_distance_threshold:
+                    edges.append((position1, position2, distance))
+        comparison_results = _global_assignment(event_stats1, event_stats2, edges, dtw_distance_threshold)
+    elif assignment == 'greedy':
+        comparison_results = _greedy_assignment_dtw(event_stats1, event_stats2, data1, data2, candidates, dtw_distance_threshold, window_fraction, counts)
+    else:
+        raise ValueError(f"Unknown event assignment '{assignment}', supported: greedy, global")
+
+    if statistics is not None:
+        for name, count in counts.items():
+            statistics[name] = statistics.get(name, 0) + count
     return comparison_results
 
 
-def compare_events_cca(event_stats1, event_stats2):
-    # signals must be same frequency
-    # resample must be done before event extraction already
-    pass
+def find_candidates(event_stats1, event_stats2, max_time_difference):
+    """
+    Returns for every event of event_stats1 the positions (in list order) of the events of event_stats2 that start at
+    most max_time_difference apart. The start times of event_stats2 are sorted once and every range is found with
+    searchsorted, so the work grows with the number of candidates instead of all pairs.
+    """
+    start_times1 = np.array([event1['start_time'] for event1 in event_stats1], dtype=float)
+    start_times2 = np.array([event2['start_time'] for event2 in event_stats2], dtype=float)
+    order = np.argsort(start_times2, kind='stable')
+    sorted_start_times2 = start_times2[order]
+    # one more event on each side, the exact condition is checked below (rounding of start_time -+ max_time_difference)
+    lo = np.maximum(np.searchsorted(sorted_start_times2, start_times1 - max_time_difference, side='left') - 1, 0)
+    hi = np.searchsorted(sorted_start_times2, start_times1 + max_time_difference, side='right') + 1
+
+    candidates = []
+    for start_time1, a, b in zip(start_times1, lo, hi):
+        positions = np.sort(order[a:b])
+        candidates.append(positions[np.abs(start_time1 - start_times2[positions]) <= max_time_difference])
+    return candidates
+
+
+def _greedy_assignment_dtw(event_stats1, event_stats2, data1, data2, candidates, dtw_distance_threshold, window_fraction, counts):
+    matched_event2_ids = {}
+    first_claims = {}       # turn of the first event1 claiming an event2, defines the order of the results
+    unresolved = []         # events1 whose candidates all exceeded the threshold
+
+    for turn, event1 in enumerate(event_stats1):
+        if len(candidates[turn]) == 0:
+            continue
+        best_position, best_distance = _best_candidate(data1[turn], data2, candidates[turn], dtw_distance_threshold, window_fraction, counts)
+        if best_position is None:
+            unresolved.append(turn)
+            continue
+        _claim(matched_event2_ids, first_claims, turn, event1, event_stats2[best_position], best_distance)
+
+    # An event1 above the threshold still claims its closest event2 first, which decides the position of that event2
+    # in the results. Only resolve it if one of its candidates is matched by a later event1.
+    for turn in unresolved:
+        if not any(event_stats2[position]['event_id'] in first_claims and first_claims[event_stats2[position]['event_id']] > turn
+                   for position in candidates[turn]):
+            continue
+        best_position, _ = _best_candidate(data1[turn], data2, candidates[turn], np.inf, window_fraction, counts)
+        event2_id = event_stats2[best_position]['event_id']
+        if event2_id in first_claims:
+            first_claims[event2_id] = min(first_claims[event2_id], turn)
+
+    return _comparison_results(matched_event2_ids, first_claims)
+
+
+def _best_candidate(data1, data2, candidates, dtw_distance_threshold, window_fraction, counts):
+    # Returns the position and distance of the candidate with the smallest DTW distance below the threshold (the first
+    # one in event_stats2 order on ties) or (None, inf).
+    lower_bounds = [dtw_lower_bound(data1, data2[position], window_fraction) for position in candidates]
+    best_position = None
+    best_distance = np.inf
+    for k in np.argsort(lower_bounds, kind='stable'):
+        position = candidates[k]
+        if lower_bounds[k] > best_distance or lower_bounds[k] >= dtw_distance_threshold:
+            counts['pruned_lower_bound'] += 1
+            continue
+        distance = banded_dtw(data1, data2[position], window_fraction, max_distance=min(best_distance, dtw_distance_threshold))
+        if distance == np.inf:
+            counts['abandoned'] += 1
+            continue
+        counts['evaluated'] += 1
+        if distance < dtw_distance_threshold and (distance < best_distance or (distance == best_distance and position < best_position)):
+            best_distance = distance
+            best_position = position
+    return best_position, best_distance
+
+
+def _band(n, m, window_fraction):
+    # Column range [lo, hi) of every row of the Sakoe-Chiba band around the diagonal from (0, 0) to (n - 1, m - 1).
+    # The band is at least as wide as the slope of the diagonal so that consecutive rows stay connected.
+    slope = (m - 1) / max(n - 1, 1)
+    if window_fraction is None:
+        width = m
+    else:
+        width = max(window_fraction * max(n, m), slope, 1)
+    centers = np.arange(n) * slope
+    lo = np.clip(np.floor(centers - width), 0, m - 1).astype(int)
+    hi = np.clip(np.ceil(centers + width), 0, m - 1).astype(int) + 1
+    return lo, hi
+
+
+def banded_dtw(x, y, window_fraction=DTW_WINDOW_FRACTION, max_distance=np.inf):
+    """
+    DTW distance (absolute difference as cost) of two 1D sequences inside a Sakoe-Chiba band, computed row by row.
+    Only the costs inside the band are computed and only two rows are kept, so the time grows with the band and the
+    memory with m instead of n * m. The dependency on the left neighbour within a row is resolved with a cumulative
+    minimum, so every row is a few vectorized operations. Returns inf as soon as every cell of a row exceeds
+    max_distance (early abandoning).
+    """
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        return np.inf
+    lo, hi = _band(n, m, window_fraction)
+    # rows[i % 2, j + 1] is the cost of the best path to (i, j), rows[1, 0] the start before the first row
+    rows = np.full((2, m + 1), np.inf)
+    rows[1, 0] = 0.0
+    written_from = [1, 0]    # first column written to each row buffer, the band only moves to the right
+    for i in range(n):
+        a, b = lo[i], hi[i]
+        previous, current = rows[(i + 1) % 2], rows[i % 2]
+        current[written_from[i % 2]:a + 1] = np.inf   # cells of row i - 2 left of the band
+        written_from[i % 2] = a + 1
+        cost = np.abs(x[i] - y[a:b])
+        cost_sum = np.cumsum(cost)
+        from_above = cost + np.minimum(previous[a:b], previous[a + 1:b + 1])
+        # row[j] = min(from_above[j], cost[j] + row[j - 1]) = cost_sum[j] + min_{k <= j}(from_above[k] - cost_sum[k])
+        row = cost_sum + np.minimum.accumulate(from_above - cost_sum)
+        # every warping path crosses every row, so the row minimum is a lower bound of the distance
+        if row.min() > max_distance:
+            return np.inf
+        current[a + 1:b + 1] = row
+    return float(rows[(n - 1) % 2, m])
+
+
+def dtw_lower_bound(x, y, window_fraction=DTW_WINDOW_FRACTION):
+    """
+    Lower bound of banded_dtw(x, y): the maximum of LB_Kim (first and last points are always matched) and LB_Keogh
+    (every point of x is matched with at least one point of y inside its band).
+    """
+    n, m = len(x), len(y)
+    if n == 0 or m == 0:
+        return np.inf
+    lb_kim = abs(x[0] - y[0])
+    if n > 1 or m > 1:
+        lb_kim += abs(x[-1] - y[-1])
+
+    lo, hi = _band(n, m, window_fraction)
+    widths = hi - lo
+    window = np.lib.stride_tricks.sliding_window_view(np.concatenate((y, np.zeros(widths.max()))), widths.max())[lo]
+    inside = np.arange(widths.max()) < widths[:, None]
+    upper = np.where(inside, window, -np.inf).max(axis=1)
+    lower = np.where(inside, window, np.inf).min(axis=1)
+    lb_keogh = np.sum(np.maximum(x - upper, 0) + np.maximum(lower - x, 0))
+    return max(lb_kim, lb_keogh)
+
+
+def compare_events_cca(event_stats1, event_stats2, max_time_difference, sampling_rate=CCA_SAMPLING_RATE, distance_threshold=np.inf, statistics=None, assignment=EVENT_ASSIGNMENT):
+    """
+    Matches the events of event_stats1 with the events of event_stats2 starting at most max_time_difference apart by
+    their normalized cross-correlation. Both event sets are resampled to sampling_rate first, so sensors with different
+    frequencies can be compared. The result has the same format as compare_events_dtw, with
+    'dtw_distance' = 1 - maximum correlation coefficient (0 for identical shapes, up to 2).
+
+    Parameters:
+        distance_threshold (float): Upper limit of the distance for the global assignment.
+        statistics (dict): If given, the counts of candidates and evaluated pairs are added to it.
+        assignment (str): 'greedy' or 'global', see EVENT_ASSIGNMENT.
+    """
+    if assignment not in ('greedy', 'global'):
+        raise ValueError(f"Unknown event assignment '{assignment}', supported: greedy, global")
+    data1 = [_resample_event(event1, sampling_rate) for event1 in event_stats1]
+    data2 = [_resample_event(event2, sampling_rate) for event2 in event_stats2]
+    candidates = find_candidates(event_stats1, event_stats2, max_time_difference)
+
+    matched_event2_ids = {}
+    first_claims = {}
+    edges = []
+    for turn, event1 in enumerate(event_stats1):
+        if len(candidates[turn]) == 0:
+            continue
+        distances = 1.0 - max_cross_correlation(data1[turn], [data2[position] for position in candidates[turn]])
+        if assignment == 'global':
+            edges += [(turn, position, distance) for position, distance in zip(candidates[turn], distances) if distance < distance_threshold]
+        else:
+            best = int(np.argmin(distances))
+            _claim(matched_event2_ids, first_claims, turn, event1, event_stats2[candidates[turn][best]], float(distances[best]))
+
+    if statistics is not None:
+        number_of_candidates = sum(len(positions) for positions in candidates)
+        statistics['candidates'] = statistics.get('candidates', 0) + number_of_candidates
+        statistics['evaluated'] = statistics.get('evaluated', 0) + number_of_candidates
+    if assignment == 'global':
+        return _global_assignment(event_stats1, event_stats2, edges, distance_threshold)
+    return _comparison_results(matched_event2_ids, first_claims)
+
+
+def max_cross_correlation(x, candidates):
+    """
+    Maximum over all lags of the normalized cross-correlation of x with every candidate (mean removed, divided by
+    the norms, so in [-1, 1]). All candidates are zero padded to the same length and correlated with one FFT.
+    """
+    from scipy.signal import fftconvolve
+
+    x = x - x.mean()
+    length = max(len(candidate) for candidate in candidates)
+    stacked = np.zeros((len(candidates), length))
+    norms = np.empty(len(candidates))
+    for k, candidate in enumerate(candidates):
+        candidate = candidate - candidate.mean()
+        stacked[k, :len(candidate)] = candidate
+        norms[k] = np.linalg.norm(candidate)
+    correlation = fftconvolve(stacked, x[None, ::-1], mode='full', axes=1)
+    norms *= np.linalg.norm(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coefficients = np.where(norms > 0, correlation.max(axis=1) / norms, 0.0)
+    return coefficients
+
+
+def _resample_event(event, sampling_rate):
+    # the samples of an event are assumed to be equally spaced between its start and end time
+    values = np.asarray(event['normalized_event_data'], dtype=float)
+    if len(values) < 2 or event['end_time'] <= event['start_time']:
+        return values
+    times = np.linspace(event['start_time'], event['end_time'], len(values))
+    new_times = np.arange(event['start_time'], event['end_time'], 1.0 / sampling_rate)
+    return np.interp(new_times, times, values)
+
+
+def _claim(matched_event2_ids, first_claims, turn, event1, event2, distance):
+    # Greedy conflict resolution: event1 claims event2, the claim with the smaller distance is kept
+    event2_id = event2['event_id']
+    if event2_id not in first_claims:
+        first_claims[event2_id] = turn
+    if event2_id not in matched_event2_ids or distance < matched_event2_ids[event2_id]['dtw_distance']:
+        matched_event2_ids[event2_id] = _comparison_result(event1, event2, distance)
+
+
+def _global_assignment(event_stats1, event_stats2, edges, distance_threshold):
+    # Maximum weight matching of the candidate pairs (position1, position2, distance) with weight
+    # distance_threshold - distance, so a good match is only given up for a better total. Events only compete with
+    # events close in time, so the candidate graph falls apart into small groups that are solved one by one with
+    # linear_sum_assignment on their dense matrix. The results are ordered by event_stats1.
+    if not edges:
+        return []
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    positions1 = np.array([edge[0] for edge in edges], dtype=int)
+    positions2 = np.array([edge[1] for edge in edges], dtype=int)
+    distances = np.array([edge[2] for edge in edges], dtype=float)
+    if not np.isfinite(distance_threshold):
+        distance_threshold = distances.max() + 1.0
+
+    n1 = len(event_stats1)
+    size = n1 + len(event_stats2)
+    graph = coo_matrix((np.ones(len(edges)), (positions1, n1 + positions2)), shape=(size, size))
+    _, labels = connected_components(graph, directed=False)
+    edge_labels = labels[positions1]
+    order = np.argsort(edge_labels, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(edge_labels[order])) + 1)
+
+    matches = []
+    for group in groups:
+        rows, row_index = np.unique(positions1[group], return_inverse=True)
+        columns, column_index = np.unique(positions2[group], return_inverse=True)
+        group_distances = np.full((len(rows), len(columns)), np.inf)
+        group_distances[row_index, column_index] = distances[group]
+        weights = np.where(np.isfinite(group_distances), distance_threshold - group_distances, 0.0)
+        for row, column in zip(*linear_sum_assignment(weights, maximize=True)):
+            if weights[row, column] > 0:
+                matches.append((rows[row], columns[column], group_distances[row, column]))
+
+    matches.sort()
+    return [_comparison_result(event_stats1[position1], event_stats2[position2], distance) for position1, position2, distance in matches]
+
+
+def _comparison_result(event1, event2, distance):
+    return {
+        'event1_id': event1['event_id'],
+        'best_match_event2_id': event2['event_id'],
+        'dtw_distance': distance,
+        'event1_min_value_index': event1['min_value_index'],
+        'event1_max_value_index': event1['max_value_index'],
+        'event2_min_value_index': event2['min_value_index'],
+        'event2_max_value_index': event2['max_value_index']
+    }
+
+
+def _comparison_results(matched_event2_ids, first_claims):
+    # Prepare final results by iterating over the matched events in the order they were first claimed
+    return [matched_event2_ids[event2_id] for event2_id in sorted(matched_event2_ids, key=lambda event2_id: first_claims[event2_id])]
@@ -1,4 +1,91 @@
+import numpy as np
+
+
 def identify_events(data, outlier_flags, time_column, threshold=0.5, min_outlier_percentage=0.6):
+    # Same scan as identify_events_legacy, but every window (start_time, t[i] + threshold] is resolved with
+    # searchsorted on the sorted time column and its outlier count with a cumulative sum of the flags.
+    # Requires the time column to be sorted and the index to be a RangeIndex (as returned by load_data).
+    event_ranges, _ = scan_events(data[time_column].to_numpy(), outlier_flags, threshold, min_outlier_percentage)
+    return [{'event_id': event_id, 'indices': list(range(first, end))} for event_id, (first, end) in enumerate(event_ranges, start=1)]
+
+
+def scan_events(times, outlier_flags, threshold=0.5, min_outlier_percentage=0.6, start=0, final=True):
+    """
+    Event scan of identify_events on sorted times. Returns the (first, last + 1) positions of the events and the position
+    where the scan stopped.
+
+    With final=False more samples may follow the given ones: the scan stops before the first decision that depends on a
+    window reaching the end of the samples, and it can be resumed at the returned position (start) once more samples
+    are appended. Windows only look forward, so the samples before start are not needed (chunked processing).
+    """
+    flags = np.asarray(outlier_flags, dtype=bool)
+    n = len(times)
+
+    outlier_cumsum = np.concatenate(([0], np.cumsum(flags, dtype=np.int64)))
+    window_starts = np.searchsorted(times, times, side='right')              # first index with time > times[i]
+    window_ends = np.searchsorted(times, times + threshold, side='right')    # first index with time > times[i] + threshold
+    outlier_positions = np.flatnonzero(flags)
+    # windows from this position on reach the end and may still grow if more samples follow
+    limit = n if final else int(np.searchsorted(window_ends, n, side='left'))
+
+    event_ranges = []
+
+    i = start
+    while i < n:
+        # jump straight to the next outlier
+        next_outlier = np.searchsorted(outlier_positions, i)
+        if next_outlier == len(outlier_positions):
+            return event_ranges, n
+        i = int(outlier_positions[next_outlier])
+        if i >= limit:
+            return event_ranges, i
+
+        lo = int(window_starts[i])
+        last_ok = _last_satisfied_window(window_ends, outlier_cumsum, lo, i, min_outlier_percentage)
+        if not final and last_ok + 1 >= limit:
+            # the end of the event is not known yet
+            return event_ranges, i
+
+        if last_ok < i:
+            # window at i already fails, skip over its points
+            i = i + max(1, int(window_ends[i]) - lo)
+            continue
+
+        hi = int(window_ends[last_ok])
+        i = last_ok + 1
+        if i < n:
+            i = i + max(1, int(window_ends[i]) - lo)
+
+        if times[hi - 1] - times[lo] >= threshold:
+            event_ranges.append((lo, hi))
+        i += 1
+
+    return event_ranges, i
+
+
+def _last_satisfied_window(window_ends, outlier_cumsum, lo, i, min_outlier_percentage):
+    # Returns the last index j >= i such that all windows (lo, window_ends[k]) for k in [i, j] hold enough outliers,
+    # or i - 1 if the window at i already fails. Blocks grow geometrically so that the work stays proportional
+    # to the event length.
+    n = len(window_ends)
+    block = 64
+    start = i
+    while start < n:
+        stop = min(n, start + block)
+        ends = window_ends[start:stop]
+        lengths = ends - lo
+        counts = outlier_cumsum[ends] - outlier_cumsum[lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ok = (lengths > 0) & (counts / np.where(lengths > 0, lengths, 1) >= min_outlier_percentage)
+        if not ok.all():
+            return start + int(np.argmin(ok)) - 1
+        start = stop
+        block *= 2
+    return n - 1
+
+
+def identify_events_legacy(data, outlier_flags, time_column, threshold=0.5, min_outlier_percentage=0.6):
+    # Original per-sample window scan, kept as reference for identify_events (O(n^2))
     events = []
     event_id = 1
     n = len(data)
@@ -1,11 +1,87 @@
+import numpy as np
+
+
 def extract_event_information(data, events, signal_column, normalization_window_duration, time_column='time'):
+    # Same event information as extract_event_information_legacy, computed for all events at once: the normalization
+    # window [start time - normalization_window_duration, end time] of every event is resolved with searchsorted on the
+    # sorted time column and its mean and standard deviation come from prefix sums of the signal and its square.
+    # The normalized data of all events is kept in one array, every event holds a NumPy view of its part.
+    # Requires the time column to be sorted (as returned by load_data).
+    if not events:
+        return []
+    times = data[time_column].to_numpy(dtype=float)
+    values = data[signal_column].to_numpy(dtype=float)
+
+    positions = [np.asarray(event['indices'], dtype=np.int64) for event in events]
+    lengths = np.array([len(event_positions) for event_positions in positions])
+    first = np.array([event_positions[0] for event_positions in positions])
+    last = np.array([event_positions[-1] for event_positions in positions])
+    start_times, end_times = times[first], times[last]
+
+    window_start = np.searchsorted(times, start_times - normalization_window_duration, side='left')
+    window_end = np.searchsorted(times, end_times, side='right')
+    mean, std = _window_mean_std(values, window_start, window_end)
+    empty = window_end == window_start
+    if empty.any():
+        # (only with unsorted times) the statistics of the whole signal as in the legacy version
+        mean[empty], std[empty] = data[signal_column].mean(), data[signal_column].std()
+
+    all_positions = np.concatenate(positions)
+    event_numbers = np.repeat(np.arange(len(events)), lengths)
+    event_values = values[all_positions]
+    normalized_event_data = np.split((event_values - mean[event_numbers]) / std[event_numbers], np.cumsum(lengths)[:-1])
+
+    # first minimum and maximum of every event (stable sort per event, NaN last as skipped by idxmin/idxmax)
+    group_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    min_positions = all_positions[np.lexsort((event_values, event_numbers))[group_starts]]
+    max_positions = all_positions[np.lexsort((-event_values, event_numbers))[group_starts]]
+    min_value_indices = data.index[min_positions].tolist()
+    max_value_indices = data.index[max_positions].tolist()
+
+    return [{
+        'event_id': event['event_id'],
+        'normalized_event_data': normalized_event_data[number],
+        'start_index': int(first[number]),
+        'start_time': start_times[number],
+        'end_time': end_times[number],
+        'min_value_index': min_value_indices[number],
+        'max_value_index': max_value_indices[number]
+    } for number, event in enumerate(events)]
+
+
+def _window_mean_std(values, window_start, window_end):
+    # mean and sample standard deviation (ddof 1) of values[window_start:window_end] for every window, NaN are skipped
+    # like in pandas. The values are shifted by their mean first, which keeps the prefix sums small and the variance
+    # (sum of squares - squared sum / n) free of cancellation. The prefix sums are accumulated in extended precision
+    # (long double, where the platform has it) so the result matches the pairwise sums of pandas to a few ulp.
+    valid = ~np.isnan(values)
+    shift = values[valid].mean() if valid.any() else 0.0
+    shifted = np.where(valid, values - shift, 0.0).astype(np.longdouble)
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    sums = np.concatenate(([0.0], np.cumsum(shifted)))
+    squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    n = counts[window_end] - counts[window_start]
+    window_sum = sums[window_end] - sums[window_start]
+    window_squares = squares[window_end] - squares[window_start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shifted_mean = window_sum / n
+        variance = np.maximum(window_squares - window_sum * shifted_mean, 0) / (n - 1)
+    # NaN for less than two values like pandas (the rounding residue of a single value would give inf)
+    variance[n < 2] = np.nan
+    return (shifted_mean + shift).astype(float), np.sqrt(variance).astype(float)
+
+
+def extract_event_information_legacy(data, events, signal_column, normalization_window_duration, time_column='time'):
+    # Original implementation with a mask over the whole recording per event, kept as reference for
+    # extract_event_information (O(n * events)), tests/test_event_information.py compares both
     event_stats = []
     for event in events:
         indices = event['indices']
         start_time = data[time_column].iloc[indices[0]]
         normalization_window_start = start_time - normalization_window_duration
 
-        normalization_window_data = data[(data[time_column] >= normalization_window_start) & 
+        normalization_window_data = data[(data[time_column] >= normalization_window_start) &
                                     (data[time_column] <= data[time_column].iloc[indices[-1]])][signal_column]
 
         if len(normalization_window_data) > 0:
@@ -25,6 +101,7 @@ def extract_event_information(data, events, signal_column, normalization_window_
             'normalized_event_data': normalized_event_data,
             'start_index': indices[0],
             'start_time': start_time,
+            'end_time': data[time_column].iloc[indices[-1]],
             'min_value_index': min_value_idx,
             'max_value_index': max_value_idx
         })
@@ -1,7 +1,161 @@
-from sklearn.neighbors import LocalOutlierFactor
+import numpy as np
+import pandas as pd
 
-def detect_outliers(data, signal_column, n_neighbors=200):
-    X = data[signal_column].values.reshape(-1, 1)
+# LOF scores above this value are outliers (sklearn threshold for contamination='auto')
+LOF_THRESHOLD = 1.5
+ROBUST_Z_THRESHOLD = 3.5
+Z_THRESHOLD = 3.0
+# Samples whose neighbours are queried at once by lof_sklearn_batched
+LOF_BATCH_SIZE = 10000
+
+
+def detect_outliers(data, signal_column, n_neighbors=200, method='lof'):
+    if method not in OUTLIER_DETECTORS:
+        raise ValueError(f"Unknown outlier detection method '{method}', supported: {', '.join(OUTLIER_DETECTORS)}")
+    values = data[signal_column].to_numpy(dtype=float)
+    return OUTLIER_DETECTORS[method](values, n_neighbors)
+
+
+def lof_sklearn(values, n_neighbors):
+    # sklearn is imported here, it takes longer to import than the rest of the pipeline
+    from sklearn.neighbors import LocalOutlierFactor
+
+    X = values.reshape(-1, 1)
     lof = LocalOutlierFactor(n_neighbors=n_neighbors)
     outliers = lof.fit_predict(X)
     return outliers == -1  # Convert outlier flags: -1 means outlier
+
+
+def lof_sklearn_batched(values, n_neighbors, batch_size=LOF_BATCH_SIZE):
+    # The same flags as lof_sklearn with O(n) instead of O(n * n_neighbors) memory (out-of-core mode): the neighbours
+    # are queried from the same tree in batches of batch_size samples, three times (k-distances, local reachability
+    # densities, LOF), and only one value per sample is kept between the passes.
+    from sklearn.neighbors import NearestNeighbors
+
+    X = values.reshape(-1, 1)
+    n = len(X)
+    if n_neighbors >= n // 2:
+        # short recordings, sklearn compares all pairs instead of using a tree
+        return lof_sklearn(values, n_neighbors)
+    k = min(n_neighbors, n - 1)
+    search = NearestNeighbors(n_neighbors=n_neighbors).fit(X)
+
+    def neighbors(start):
+        # neighbours of the samples start:start + batch_size without the sample itself (as LocalOutlierFactor.fit)
+        distances, indices = search.kneighbors(X[start:start + batch_size], k + 1)
+        mask = indices != np.arange(start, start + len(indices))[:, None]
+        mask[:, 0][np.all(mask, axis=1)] = False    # more duplicates than neighbours
+        return distances[mask].reshape(len(indices), k), indices[mask].reshape(len(indices), k)
+
+    starts = range(0, n, batch_size)
+    k_distance = np.concatenate([neighbors(start)[0][:, k - 1] for start in starts])
+    lrd = np.empty(n)
+    for start in starts:
+        distances, indices = neighbors(start)
+        lrd[start:start + len(indices)] = 1.0 / (np.mean(np.maximum(distances, k_distance[indices]), axis=1) + 1e-10)
+    lof = np.empty(n)
+    for start in starts:
+        _, indices = neighbors(start)
+        lof[start:start + len(indices)] = np.mean(lrd[indices] / lrd[start:start + len(indices), np.newaxis], axis=1)
+    return lof > LOF_THRESHOLD
+
+
+def lof_1d(values, n_neighbors):
+    # Local outlier factor for 1D signals with the neighbourhood of Breunig et al. (2000): N_k(p) holds every other
+    # sample within the k-distance of p, so all samples tied at the k-distance are neighbours and the score does not
+    # depend on a tie-breaking order. Without ties N_k(p) holds exactly k samples and the flags are those of sklearn,
+    # which keeps the k tied neighbours its tree visits first.
+    # In 1D N_k(p) is a contiguous range of the sorted values. All samples with the same value have the same k-distance
+    # and neighbourhood, so the densities are computed once per distinct value: at most k + 2 distinct values lie within
+    # the k-distance, which keeps the time at O(n log n + n_distinct * k) and the memory at O(n).
+    n = len(values)
+    if n < 2:
+        return np.zeros(n, dtype=bool)
+    k = min(n_neighbors, n - 1)
+    order = np.argsort(values, kind='stable')
+    x = values[order]
+
+    # distinct values u with their number of samples
+    first = np.concatenate(([0], np.flatnonzero(np.diff(x)) + 1))
+    u = x[first]
+    counts = np.diff(np.append(first, n))
+
+    # k-distance: of the windows x[l:l + k + 1] around the first sample p of a value the best one is at the first l
+    # with x[l + k] - x[p] >= x[p] - x[l] (or just before it). The binary search compares the distances themselves, a
+    # comparison of sums (x[l] + x[l + k] >= 2 * x[p]) can pick the wrong window when the distances differ by one ulp.
+    lowest_start = np.maximum(first - k, 0)
+    highest_start = np.minimum(first, n - 1 - k)
+    low, high = lowest_start.copy(), highest_start.copy()
+    while np.any(low < high):
+        middle = (low + high) // 2
+        right_is_farther = x[middle + k] - u >= u - x[middle]
+        high = np.where(right_is_farther, middle, high)
+        low = np.where(right_is_farther, low, np.minimum(middle + 1, high))
+    previous = np.maximum(low - 1, lowest_start)
+    k_distance = np.minimum(np.maximum(u - x[low], x[low + k] - u), np.maximum(u - x[previous], x[previous + k] - u))
+    m = len(u)
+    distinct = np.arange(m)
+
+    # N_k of u[a] is u[lowest[a]:highest[a] + 1] without the sample itself; the searches are corrected so that the
+    # bounds follow the computed distances exactly (u - (u - k_distance) is not always k_distance in floating point)
+    lowest = np.searchsorted(u, u - k_distance, side='left')
+    highest = np.searchsorted(u, u + k_distance, side='right') - 1
+    while True:
+        extend = (lowest > 0) & (u - u[np.maximum(lowest - 1, 0)] <= k_distance)
+        shrink = u - u[lowest] > k_distance
+        if not (extend.any() or shrink.any()):
+            break
+        lowest = lowest - extend + shrink
+    while True:
+        extend = (highest < m - 1) & (u[np.minimum(highest + 1, m - 1)] - u <= k_distance)
+        shrink = u[highest] - u > k_distance
+        if not (extend.any() or shrink.any()):
+            break
+        highest = highest + extend - shrink
+    count_cumsum = np.concatenate(([0], np.cumsum(counts)))
+    neighborhood_size = count_cumsum[highest + 1] - count_cumsum[lowest] - 1
+
+    # local reachability density, one pass per distinct value offset keeps the memory at O(n)
+    reach_distance_sum = np.zeros(m)
+    for offset in range(int(np.max(highest - lowest)) + 1):
+        neighbors = np.minimum(lowest + offset, highest)
+        reach_distance = np.maximum(k_distance[neighbors], np.abs(u[neighbors] - u))
+        samples = np.where(lowest + offset <= highest, counts[neighbors] - (neighbors == distinct), 0)
+        reach_distance_sum += samples * reach_distance
+    lrd = 1.0 / (reach_distance_sum / neighborhood_size + 1e-10)
+
+    lrd_cumsum = np.concatenate(([0.0], np.cumsum(counts * lrd)))
+    lof = (lrd_cumsum[highest + 1] - lrd_cumsum[lowest] - lrd) / neighborhood_size / lrd
+
+    outliers = np.empty(n, dtype=bool)
+    outliers[order] = np.repeat(lof > LOF_THRESHOLD, counts)
+    return outliers
+
+
+def rolling_mad(values, n_neighbors):
+    # Robust z-score with rolling median and median absolute deviation over n_neighbors samples on each side
+    window = 2 * n_neighbors + 1
+    signal = pd.Series(values)
+    deviation = (signal - signal.rolling(window, center=True, min_periods=1).median()).abs()
+    mad = deviation.rolling(window, center=True, min_periods=1).median()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        robust_z = (deviation / (1.4826 * mad)).to_numpy()
+    return np.nan_to_num(robust_z, nan=0.0, posinf=np.inf) > ROBUST_Z_THRESHOLD
+
+
+def rolling_zscore(values, n_neighbors):
+    # z-score with rolling mean and standard deviation over n_neighbors samples on each side
+    window = 2 * n_neighbors + 1
+    signal = pd.Series(values)
+    rolling = signal.rolling(window, center=True, min_periods=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = ((signal - rolling.mean()).abs() / rolling.std()).to_numpy()
+    return np.nan_to_num(z, nan=0.0, posinf=np.inf) > Z_THRESHOLD
+
+
+OUTLIER_DETECTORS = {
+    'lof': lof_sklearn,
+    'lof_1d': lof_1d,
+    'rolling_mad': rolling_mad,
+    'rolling_zscore': rolling_zscore,
+}
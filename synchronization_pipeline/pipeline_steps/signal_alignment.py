@@ -1,61 +1,92 @@
 import pandas as pd
 
+from pipeline_steps.time_mapping import TimeMapping, fit_drift_model, DRIFT_INLIER_THRESHOLD
+
+
 def align_signals(df1, df2, comparison_results, sensor1, sensor2, dtw_distance_threshold, time_column='time'):
+    # All sync points are collected first and the time column of df2 is mapped with one piecewise-linear TimeMapping
+    # (same result as shifting at the first and stretching at every further sync point)
+    time_mapping = create_time_mapping(df1, df2, comparison_results, sensor1, sensor2, dtw_distance_threshold, time_column)
+    original_df2 = df2.copy(deep=False)
+    df2 = time_mapping.apply_to_dataframe(df2, time_column)
+    return original_df2, df2
+
+
+def create_time_mapping(df1, df2, comparison_results, sensor1, sensor2, dtw_distance_threshold, time_column='time',
+                        drift_model='piecewise', inlier_threshold=DRIFT_INLIER_THRESHOLD):
+    """
+    Marks the sync points of the accepted matches (distance below dtw_distance_threshold) in the 'sync_point' column of
+    df1 and df2 and returns the mapping from the clock of df2 to the clock of df1: the piecewise-linear TimeMapping
+    through these sync points or, with drift_model 'affine' or 'spline', the DriftModel fitted to all of them.
+    """
+    sync_points = collect_sync_points(df1, df2, comparison_results, sensor1, sensor2, dtw_distance_threshold, time_column)
+    return build_time_mapping(sync_points, drift_model, inlier_threshold)
+
+
+def collect_sync_points(df1, df2, comparison_results, sensor1, sensor2, dtw_distance_threshold, time_column='time'):
+    """
+    Marks the sync points of the accepted matches in the 'sync_point' column of df1 and df2 and returns them as
+    (time in df2, time in df1) pairs in the order of the matches.
+    """
     df1['sync_point'] = pd.NA
     df2['sync_point'] = pd.NA
 
-    previous_match = None
-    original_df2 = df2.copy()
+    sync_points = select_sync_points(comparison_results, sensor1, sensor2, dtw_distance_threshold)
+    event1_synch_indices = [event1_synch_index for event1_synch_index, _ in sync_points]
+    event2_synch_indices = [event2_synch_index for _, event2_synch_index in sync_points]
+    df1.loc[event1_synch_indices, 'sync_point'] = 1
+    df2.loc[event2_synch_indices, 'sync_point'] = 1
+
+    align_times = df2[time_column].to_numpy()[event2_synch_indices]
+    reference_times = df1[time_column].to_numpy()[event1_synch_indices]
+    return list(zip(align_times, reference_times))
+
+
+def select_sync_points(comparison_results, sensor1, sensor2, dtw_distance_threshold):
+    """Returns the (index in df1, index in df2) of the sync point of every accepted match, in the order of the matches."""
+    sync_points = []
     for result in comparison_results:
         if result['dtw_distance'] is not None and result['dtw_distance'] < dtw_distance_threshold:
-            
-            # for sensomative, if min index before max idx on accelereometer, match with max idx senso, with min idx accelero
-            # else match with min idx from senso with max? idx from accelero
-            # if sensor1 == 'accelerometer' and sensor2 == 'sensomative':
-            if sensor2 == 'sensomative':
-                if result['event1_min_value_index'] < result['event1_max_value_index']:
-                    event1_synch_index = result['event1_min_value_index']
-                    event2_synch_index = result['event2_max_value_index']
-                else:
-                    event1_synch_index = result['event1_max_value_index']
-                    event2_synch_index = result['event2_min_value_index']
-
-            # elif (sensor1 == 'sensomative' and sensor2 == 'accelerometer'):
-            elif sensor1 == 'sensomative':
-                if result['event2_min_value_index'] < result['event2_max_value_index']:
-                    event1_synch_index = result['event1_max_value_index']
-                    event2_synch_index = result['event2_min_value_index']
-                else:
-                    event1_synch_index = result['event1_min_value_index']
-                    event2_synch_index = result['event2_max_value_index']
-            else:
-                event1_synch_index = result['event1_min_value_index']
-                event2_synch_index = result['event2_min_value_index']
-           
-            df1.at[event1_synch_index, 'sync_point'] = 1
-            df2.at[event2_synch_index, 'sync_point'] = 1
-
-            event1_synch_time = df1[time_column].iloc[event1_synch_index]
-            event2_synch_time = df2[time_column].iloc[event2_synch_index]
-            
-            if previous_match is None:
-                time_shift = event1_synch_time - event2_synch_time
-                df2[time_column] += time_shift
-            else:
-                prev_event1_index = previous_match['event1_synch_index']
-                prev_event2_index = previous_match['event2_synch_index']
-                prev_event1_time = df1[time_column].iloc[prev_event1_index] # fetch anew because df2 has been changed
-                prev_event2_time = df2[time_column].iloc[prev_event2_index]
-                curr_event1_time = event1_synch_time
-                curr_event2_time = event2_synch_time
-
-                stretch_factor = (curr_event1_time - prev_event1_time) / (curr_event2_time - prev_event2_time)
-                
-                df2.loc[(df2[time_column] > prev_event2_time), time_column] = \
-                    prev_event2_time + (df2[time_column] - prev_event2_time) * stretch_factor
-                
-            previous_match = {
-                'event1_synch_index': event1_synch_index,
-                'event2_synch_index': event2_synch_index             
-            }    
-    return original_df2, df2
+            sync_points.append(select_sync_indices(result, sensor1, sensor2))
+    return sync_points
+
+
+def event_value_time(event, index):
+    """Returns the time of the sync index (min_value_index or max_value_index) of an event that holds min_value_time
+    and max_value_time, for the modes that keep the event times instead of the recording (out-of-core, streaming)."""
+    if index == event['min_value_index']:
+        return event['min_value_time']
+    return event['max_value_time']
+
+
+def build_time_mapping(sync_points, drift_model='piecewise', inlier_threshold=DRIFT_INLIER_THRESHOLD):
+    """Returns the TimeMapping through the (align time, reference time) sync points or the fitted DriftModel."""
+    if drift_model == 'piecewise':
+        return TimeMapping.from_sync_points(sync_points)
+    return fit_drift_model(sync_points, drift_model, inlier_threshold)
+
+
+def select_sync_indices(result, sensor1, sensor2):
+    # for sensomative, if min index before max idx on accelereometer, match with max idx senso, with min idx accelero
+    # else match with min idx from senso with max? idx from accelero
+    # if sensor1 == 'accelerometer' and sensor2 == 'sensomative':
+    if sensor2 == 'sensomative':
+        if result['event1_min_value_index'] < result['event1_max_value_index']:
+            event1_synch_index = result['event1_min_value_index']
+            event2_synch_index = result['event2_max_value_index']
+        else:
+            event1_synch_index = result['event1_max_value_index']
+            event2_synch_index = result['event2_min_value_index']
+
+    # elif (sensor1 == 'sensomative' and sensor2 == 'accelerometer'):
+    elif sensor1 == 'sensomative':
+        if result['event2_min_value_index'] < result['event2_max_value_index']:
+            event1_synch_index = result['event1_max_value_index']
+            event2_synch_index = result['event2_min_value_index']
+        else:
+            event1_synch_index = result['event1_min_value_index']
+            event2_synch_index = result['event2_max_value_index']
+    else:
+        event1_synch_index = result['event1_min_value_index']
+        event2_synch_index = result['event2_min_value_index']
+    return event1_synch_index, event2_synch_index
@@ -0,0 +1,381 @@
+import json
+import numpy as np
+
+# Sync points further than this (in s) from the drift model are outliers
+DRIFT_INLIER_THRESHOLD = 0.25
+# Largest deviation of the clock rate from 1 considered by the drift model (0.05 = 5%)
+MAX_CLOCK_RATE_CHANGE = 0.05
+# Above this number of single sync points or pairs of sync points the RANSAC hypotheses are a random sample of them
+MAX_RANSAC_HYPOTHESES = 5000
+# Hypotheses scored at once, the memory of the scoring is O(number of sync points * RANSAC_BATCH_SIZE)
+RANSAC_BATCH_SIZE = 256
+# Increase when the format of time_map.json changes
+TIME_MAP_VERSION = 1
+
+
+class TimeMapping:
+    """
+    Monotonic piecewise-linear mapping from the clock of a device to the reference clock.
+
+    Between the sync points the times are interpolated linearly. Before the first sync point only the time shift is
+    applied (slope 1) and after the last one the slope of the last segment is continued, as the chained stretch factors
+    of align_signals did. Without sync points the mapping is the identity.
+
+    Parameters:
+        align_times (array): Times of the sync points on the clock of the device, strictly increasing.
+        reference_times (array): Times of the same sync points on the reference clock, strictly increasing.
+    """
+
+    def __init__(self, align_times=(), reference_times=()):
+        self.align_times = np.asarray(align_times, dtype=float)
+        self.reference_times = np.asarray(reference_times, dtype=float)
+        if len(self.align_times) != len(self.reference_times):
+            raise ValueError("align_times and reference_times must have the same length")
+        if np.any(np.diff(self.align_times) <= 0) or np.any(np.diff(self.reference_times) <= 0):
+            raise ValueError("The sync points of a TimeMapping must be strictly increasing")
+
+    @classmethod
+    def from_sync_points(cls, sync_points):
+        """
+        Creates the mapping from (align time, reference time) pairs in the order of the matches. A pair that is not
+        later than the previously kept pair on both clocks would fold the time axis and is skipped.
+        """
+        align_times, reference_times = [], []
+        for align_time, reference_time in sync_points:
+            if align_times and (align_time <= align_times[-1] or reference_time <= reference_times[-1]):
+                continue
+            align_times.append(align_time)
+            reference_times.append(reference_time)
+        return cls(align_times, reference_times)
+
+    @property
+    def slopes(self):
+        """Slope (stretch factor) of every segment between two consecutive sync points."""
+        return np.diff(self.reference_times) / np.diff(self.align_times)
+
+    @property
+    def time_shift(self):
+        return self.reference_times[0] - self.align_times[0] if len(self.align_times) else 0.0
+
+    def __call__(self, times):
+        """Maps an array of times of the device onto the reference clock."""
+        times = np.asarray(times, dtype=float)
+        if len(self.align_times) < 2:
+            return times + self.time_shift
+        mapped = np.interp(times, self.align_times, self.reference_times)
+        before = times < self.align_times[0]
+        mapped[before] = self.reference_times[0] + (times[before] - self.align_times[0])
+        after = times > self.align_times[-1]
+        mapped[after] = self.reference_times[-1] + (times[after] - self.align_times[-1]) * self.slopes[-1]
+        return mapped
+
+    def apply_to_dataframe(self, df, time_column='time'):
+        """Returns a (shallow) copy of df with the time column mapped onto the reference clock."""
+        df = df.copy(deep=False)
+        df[time_column] = self(df[time_column].to_numpy())
+        return df
+
+    def to_dict(self):
+        return {'type': 'piecewise', 'align_times': self.align_times.tolist(), 'reference_times': self.reference_times.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['align_times'], data['reference_times'])
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+
+class DriftModel:
+    """
+    Clock model fitted over all sync points at once: reference time = intercept + rate * (time - center), optionally
+    plus a smoothing spline of the remaining deviation ('spline'). Unlike the piecewise mapping a single bad sync point
+    does not bend the later segments, and the drift is extrapolated beyond the last sync point.
+
+    Use fit_drift_model to create it. residuals, inliers and confidence describe the fit, see fit_drift_model.
+    """
+
+    def __init__(self, model, center, intercept, rate, spline=None, residuals=(), inliers=(), confidence=None):
+        self.model = model
+        self.center = float(center)
+        self.intercept = float(intercept)
+        self.rate = float(rate)
+        self.spline = spline                # BSpline of the deviation from the affine part or None
+        self.residuals = np.asarray(residuals, dtype=float)
+        self.inliers = np.asarray(inliers, dtype=bool)
+        self.confidence = confidence or {}
+
+    @property
+    def time_shift(self):
+        # shift at the center of the sync points
+        return self(np.array([self.center]))[0] - self.center
+
+    def __call__(self, times):
+        """Maps an array of times of the device onto the reference clock (O(n))."""
+        times = np.asarray(times, dtype=float)
+        mapped = self.intercept + self.rate * (times - self.center)
+        if self.spline is not None:
+            # the deviation is kept constant outside the sync points
+            knots = self.spline.t
+            mapped += self.spline(np.clip(times, knots[0], knots[-1]))
+        return mapped
+
+    def apply_to_dataframe(self, df, time_column='time'):
+        """Returns a (shallow) copy of df with the time column mapped onto the reference clock."""
+        df = df.copy(deep=False)
+        df[time_column] = self(df[time_column].to_numpy())
+        return df
+
+    def to_dict(self):
+        data = {
+            'type': self.model,
+            'center': self.center,
+            'intercept': self.intercept,
+            'rate': self.rate,
+            'residuals': self.residuals.tolist(),
+            'inliers': self.inliers.tolist(),
+            'confidence': self.confidence
+        }
+        if self.spline is not None:
+            data['spline'] = {'knots': self.spline.t.tolist(), 'coefficients': self.spline.c.tolist(), 'degree': int(self.spline.k)}
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        spline = None
+        if data.get('spline') is not None:
+            from scipy.interpolate import BSpline
+            spline = BSpline(np.array(data['spline']['knots']), np.array(data['spline']['coefficients']), data['spline']['degree'])
+        return cls(data['type'], data['center'], data['intercept'], data['rate'], spline,
+                   data.get('residuals', ()), data.get('inliers', ()), data.get('confidence'))
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+
+class TimeMap:
+    """
+    Sparse artifact of an alignment (time_map.json): the mapping from the clock of the aligned file to the reference
+    clock together with everything needed to check and reuse it, so that the aligned data never has to be written.
+
+    It holds the time mapping (TimeMapping or DriftModel), all sync points found (align time, reference time), the
+    linear segments of the mapping between the sync points (see segments) and the provenance of the alignment (input
+    files with their sizes and SHA-256 hashes, sensors, settings). Calling it maps any array of times of the aligned
+    file onto the reference clock, exactly as the aligned file of the pipeline.
+
+    Parameters:
+        mapping (TimeMapping or DriftModel): Mapping of the alignment.
+        sync_points (list): (align time, reference time) pairs of the accepted matches.
+        provenance (dict): Inputs and settings of the alignment.
+    """
+
+    def __init__(self, mapping, sync_points=(), provenance=None):
+        self.mapping = mapping
+        self.sync_points = np.asarray(list(sync_points), dtype=float).reshape(-1, 2)
+        self.provenance = provenance or {}
+
+    def __call__(self, times):
+        """Maps an array of times of the aligned file onto the reference clock (vectorized)."""
+        return self.mapping(times)
+
+    @property
+    def segments(self):
+        """
+        Linear pieces of the mapping from align_start to align_end: reference time = anchor + offset + slope *
+        (time - anchor), offset is the time shift at the anchor (a sync point). Beyond the first and the last sync
+        point the pieces are open (start -inf, end inf). The spline of a drift model is approximated linearly between
+        the sync points.
+        """
+        mapping = self.mapping
+        if isinstance(mapping, TimeMapping):
+            if len(mapping.align_times) < 2:
+                return _segments(mapping.align_times, mapping.reference_times, 1.0, 1.0)
+            return _segments(mapping.align_times, mapping.reference_times, 1.0, mapping.slopes[-1])
+        knots = np.unique(self.sync_points[:, 0]) if mapping.spline is not None else np.empty(0)
+        if len(knots) < 2:
+            return _segments([mapping.center], [mapping.intercept], mapping.rate, mapping.rate)
+        return _segments(knots, mapping(knots), mapping.rate, mapping.rate)
+
+    def apply_to_dataframe(self, df, time_column='time'):
+        """Returns a (shallow) copy of df with the time column mapped onto the reference clock."""
+        return self.mapping.apply_to_dataframe(df, time_column)
+
+    def apply_to_chunks(self, chunks, time_column='time'):
+        """Maps the time column of every DataFrame of a chunk stream (e.g. iter_data_chunks) onto the reference clock."""
+        for chunk in chunks:
+            yield self.apply_to_dataframe(chunk, time_column)
+
+    def to_dict(self):
+        return {
+            'type': 'time_map',
+            'version': TIME_MAP_VERSION,
+            'mapping': self.mapping.to_dict(),
+            'sync_points': self.sync_points.tolist(),
+            'segments': self.segments,
+            'drift': {'time_shift': float(self.mapping.time_shift), 'rate': _rate(self.mapping)},
+            'provenance': self.provenance
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(_mapping_from_dict(data['mapping']), data.get('sync_points', ()), data.get('provenance'))
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            # json cannot hold inf, the open ends of the segments are written as null
+            json.dump(_replace_infinity(self.to_dict()), file, indent=4, default=str)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+
+def _segments(knots, reference_times, slope_before, slope_after):
+    knots = np.asarray(knots, dtype=float)
+    reference_times = np.asarray(reference_times, dtype=float)
+    if len(knots) == 0:
+        # identity
+        return {'align_start': [-np.inf], 'align_end': [np.inf], 'anchor': [0.0], 'offset': [0.0], 'slope': [1.0]}
+    anchors = np.concatenate((knots[:1], knots))
+    return {
+        'align_start': [-np.inf] + knots.tolist(),
+        'align_end': knots.tolist() + [np.inf],
+        'anchor': anchors.tolist(),
+        'offset': (np.concatenate((reference_times[:1], reference_times)) - anchors).tolist(),
+        'slope': [float(slope_before)] + (np.diff(reference_times) / np.diff(knots)).tolist() + [float(slope_after)]
+    }
+
+
+def _rate(mapping):
+    # mean clock rate of a mapping (slope from the first to the last sync point of a TimeMapping)
+    if isinstance(mapping, DriftModel):
+        return mapping.rate
+    if len(mapping.align_times) < 2:
+        return 1.0
+    return float((mapping.reference_times[-1] - mapping.reference_times[0]) / (mapping.align_times[-1] - mapping.align_times[0]))
+
+
+def _replace_infinity(value):
+    if isinstance(value, dict):
+        return {key: _replace_infinity(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_replace_infinity(item) for item in value]
+    if isinstance(value, float) and np.isinf(value):
+        return None
+    return value
+
+
+def _mapping_from_dict(data):
+    if data.get('type', 'piecewise') == 'piecewise':
+        return TimeMapping.from_dict(data)
+    return DriftModel.from_dict(data)
+
+
+def load_time_mapping(path):
+    """
+    Loads the mapping of a TimeMap (time_map.json) or a TimeMapping or DriftModel saved with save() (also the
+    time_mapping.json of outputs written before the time map replaced it).
+    """
+    with open(path, 'r') as file:
+        data = json.load(file)
+    if data.get('type') == 'time_map':
+        return TimeMap.from_dict(data).mapping
+    return _mapping_from_dict(data)
+
+
+def fit_drift_model(sync_points, model='affine', inlier_threshold=DRIFT_INLIER_THRESHOLD, max_clock_rate_change=MAX_CLOCK_RATE_CHANGE, seed=0):
+    """
+    Fits a DriftModel to (align time, reference time) sync points in one vectorized solve.
+
+    'affine': RANSAC over all hypotheses from one sync point (pure offset) and two sync points (offset and clock rate
+    within 1 +- max_clock_rate_change). The hypothesis with the most sync points within inlier_threshold (then the
+    smallest squared error) wins and offset and rate are refitted by least squares on its inliers.
+    'spline': the affine model plus a smoothing spline through the residuals of the inliers (of degree up to 3 and
+    only if it can smooth them, which needs at least 3 inliers).
+
+    The confidence holds the number of inliers, the RMS of the inlier residuals and the standard errors of the
+    intercept and the rate (None if there are too few inliers).
+    """
+    if model not in ('affine', 'spline'):
+        raise ValueError(f"Unknown drift model '{model}', supported: affine, spline")
+    sync_points = np.asarray(list(sync_points), dtype=float).reshape(-1, 2)
+    align_times, reference_times = sync_points[:, 0], sync_points[:, 1]
+    n = len(align_times)
+    if n == 0:
+        return DriftModel(model, 0.0, 0.0, 1.0, confidence={'inliers': 0, 'residual_rms': None, 'intercept_std': None, 'rate_std': None})
+
+    # hypotheses (offset at the center, rate) from single sync points and pairs of sync points, drawn at random when
+    # there are more than MAX_RANSAC_HYPOTHESES of them
+    center = align_times.mean()
+    x = align_times - center
+    rng = np.random.default_rng(seed)
+    singles = np.arange(n) if n <= MAX_RANSAC_HYPOTHESES else rng.choice(n, MAX_RANSAC_HYPOTHESES, replace=False)
+    if n * (n - 1) // 2 <= MAX_RANSAC_HYPOTHESES:
+        first, second = np.triu_indices(n, k=1)
+    else:
+        first, second = rng.integers(0, n, size=(2, MAX_RANSAC_HYPOTHESES))
+        first, second = first[first != second], second[first != second]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pair_rates = (reference_times[second] - reference_times[first]) / (align_times[second] - align_times[first])
+    valid = np.abs(pair_rates - 1) <= max_clock_rate_change
+    rates = np.concatenate((np.ones(len(singles)), pair_rates[valid]))
+    intercepts = np.concatenate((reference_times[singles] - x[singles], reference_times[first[valid]] - pair_rates[valid] * x[first[valid]]))
+
+    # the hypothesis with the most inliers, then the smallest squared error (the first one if tied)
+    best, best_score = 0, None
+    for start in range(0, len(rates), RANSAC_BATCH_SIZE):
+        batch = slice(start, start + RANSAC_BATCH_SIZE)
+        residuals = reference_times[None, :] - (intercepts[batch, None] + rates[batch, None] * x[None, :])
+        is_inlier = np.abs(residuals) <= inlier_threshold
+        squared_error = np.where(is_inlier, residuals ** 2, 0).sum(axis=1)
+        batch_best = np.lexsort((squared_error, -is_inlier.sum(axis=1)))[0]
+        score = (-is_inlier[batch_best].sum(), squared_error[batch_best])
+        if best_score is None or score < best_score:
+            best, best_score = start + batch_best, score
+    inliers = np.abs(reference_times - (intercepts[best] + rates[best] * x)) <= inlier_threshold
+
+    # least squares refit on the inliers, the rate only if it stays within the allowed clock rate change
+    intercept, rate = intercepts[best], rates[best]
+    m = int(inliers.sum())
+    design = np.column_stack((np.ones(m), x[inliers]))
+    if m >= 2 and np.ptp(x[inliers]) > 0:
+        (refit_intercept, refit_rate), *_ = np.linalg.lstsq(design, reference_times[inliers], rcond=None)
+        if abs(refit_rate - 1) <= max_clock_rate_change:
+            intercept, rate = refit_intercept, refit_rate
+    else:
+        intercept = np.mean(reference_times[inliers] - x[inliers])
+
+    residuals = reference_times - (intercept + rate * x)
+    confidence = {'inliers': m, 'residual_rms': float(np.sqrt(np.mean(residuals[inliers] ** 2))), 'intercept_std': None, 'rate_std': None}
+    if m > 2 and np.ptp(x[inliers]) > 0:
+        variance = np.sum(residuals[inliers] ** 2) / (m - 2)
+        covariance = variance * np.linalg.inv(design.T @ design)
+        confidence['intercept_std'] = float(np.sqrt(covariance[0, 0]))
+        confidence['rate_std'] = float(np.sqrt(covariance[1, 1]))
+
+    # the spline needs more inliers than its degree + 1, otherwise it interpolates the residuals and the residual RMS
+    # would be 0; a spline that still interpolates (no smoothing possible) is dropped
+    spline = None
+    if model == 'spline' and m >= 3:
+        order = np.argsort(align_times[inliers], kind='stable')
+        spline_x = align_times[inliers][order]
+        if np.all(np.diff(spline_x) > 0):
+            from scipy.interpolate import make_splrep
+            spline_residuals = residuals[inliers][order]
+            smoothing = m * (1.4826 * np.median(np.abs(spline_residuals))) ** 2  # m * variance of the noise (MAD)
+            spline = make_splrep(spline_x, spline_residuals, k=min(3, m - 2), s=smoothing)
+            if len(spline.t) - spline.k - 1 >= m:
+                spline = None
+            else:
+                residuals = reference_times - (intercept + rate * x + spline(np.clip(align_times, spline_x[0], spline_x[-1])))
+                confidence['residual_rms'] = float(np.sqrt(np.mean(residuals[inliers] ** 2)))
+
+    return DriftModel(model, center, intercept, rate, spline, residuals, inliers, confidence)
@@ -0,0 +1,74 @@
+# This script builds the sparse time indexes of CSV recordings and reads time ranges of a recording through them.
+# The index of file.csv (file.timeindex.json next to it or in --index_folder) holds the byte offset and the smallest and
+# largest time of every block of rows, so a range query only reads and parses the blocks that overlap the range instead
+# of the whole file. Indexes are built on first use and rebuilt when the CSV file changes, "index" builds them ahead
+# for whole folders in --workers processes. Converted binary files (convert_data.py) are searched directly.
+# The pipeline uses the same index to load only a part of the recordings (time_range in config.yaml).
+# Usage: python query_time_range.py index <file_or_folder> [<file_or_folder> ...] [--workers N] [--index_folder folder]
+#        python query_time_range.py query <file> <start> <end> [--columns time accX ...] [--output snippet.csv] [--index_folder folder]
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from convert_data import find_csv_files
+from utils.data_utils import load_time_range
+from utils.time_index import load_time_index
+
+
+def index_file(input_file, time_column='time', index_folder=None):
+    # builds the index of one file if it is missing or stale, returns an error message or None
+    try:
+        load_time_index(input_file, time_column, index_folder)
+    except (ValueError, OSError) as error:
+        return str(error)
+    return None
+
+
+def build_indexes(paths, time_column, index_folder, workers):
+    csv_files = find_csv_files(paths)
+    start = time.perf_counter()
+    arguments = ([time_column] * len(csv_files), [index_folder] * len(csv_files))
+    if workers > 1 and len(csv_files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            errors = list(executor.map(index_file, csv_files, *arguments))
+    else:
+        errors = list(map(index_file, csv_files, *arguments))
+    for input_file, error in zip(csv_files, errors):
+        if error is not None:
+            print(f"Could not index {input_file}: {error}")
+    print(f"Indexed {errors.count(None)} of {len(csv_files)} files in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+def query(input_file, start, end, time_column, columns, index_folder, output_file):
+    df = load_time_range(input_file, start, end, time_column, columns, index_folder)
+    if output_file:
+        df.to_csv(output_file, index=False)
+        print(f"{len(df)} rows saved to: {output_file}")
+    else:
+        df.to_csv(sys.stdout, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build sparse time indexes of CSV recordings and read time ranges through them.")
+    parser.add_argument("--time_column", default="time", help="Name of the time column.")
+    parser.add_argument("--index_folder", default=None, help="Folder of the indexes, default: next to the CSV files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="Build the indexes of CSV files.")
+    index_parser.add_argument("paths", nargs='+', help="CSV files or folders containing CSV files.")
+    index_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    query_parser = commands.add_parser("query", help="Read the rows of a recording with start <= time <= end.")
+    query_parser.add_argument("file", help="Recording (CSV file, a converted binary file is used if it exists).")
+    query_parser.add_argument("start", type=float, help="Start of the range (in s).")
+    query_parser.add_argument("end", type=float, help="End of the range (in s).")
+    query_parser.add_argument("--columns", nargs='+', default=None, help="Columns to read, default: all.")
+    query_parser.add_argument("--output", default=None, help="CSV file for the rows, default: standard output.")
+    args = parser.parse_args()
+
+    if args.command == "index":
+        sys.exit(build_indexes(args.paths, args.time_column, args.index_folder, args.workers))
+    sys.exit(query(args.file, args.start, args.end, args.time_column, args.columns, args.index_folder, args.output))
@@ -0,0 +1,233 @@
+# Incremental (online) version of the synchronization pipeline for live sensor feeds.
+# Samples of the reference and the align sensor are pushed in chunks. Each feed keeps a bounded buffer of the most recent
+# samples on which the batch steps (1D signal, outlier detection, event detection, event information) are re-run, so
+# events inside the buffer are revised as more data arrives. Events whose normalization window is about to leave the
+# buffer are frozen and only their compact event information is kept. After every chunk the events are matched with
+# compare_events_dtw and the sync points are derived with the same rules as align_signals. Whenever the sync points
+# change, an update with the current time shift and stretch factor (slope of the last segment of the TimeMapping or the
+# clock rate of the drift model) is emitted.
+# As long as a whole session fits into history_duration, the result after finish() is identical to the batch pipeline.
+# With a shorter history it is approximate: LOF only compares the samples in the buffer (use rolling_mad or
+# rolling_zscore) and events or matches close to where they are frozen can differ. Replaying the test data with a history
+# of 30 s and rolling_mad finds 99.5% of the batch sync points (error_quantification/replay_streaming.py).
+#
+# Usage:
+#   synchronizer = StreamingSynchronizer('cosinuss', 'corsano', outlier_settings, diverse_settings)
+#   updates = synchronizer.push_reference(reference_chunk_df)
+#   updates = synchronizer.push_align(align_chunk_df)
+#   ...
+#   updates = synchronizer.finish()
+#   corrected_times = synchronizer.correct_times(align_times)
+
+import numpy as np
+import pandas as pd
+
+from main import process_dataframe
+from pipeline_steps.event_comparison import compare_events_dtw, DTW_WINDOW_FRACTION, EVENT_ASSIGNMENT
+from pipeline_steps.signal_alignment import select_sync_indices, event_value_time
+from pipeline_steps.time_mapping import TimeMapping, fit_drift_model, DRIFT_INLIER_THRESHOLD
+
+
+class StreamingSignal:
+    """
+    Bounded buffer of one sensor feed and the events detected on it.
+
+    Parameters:
+        sensor_name (str): Name of the sensor (cosinuss, corsano, vivalink, sensomative).
+        outlier_neighbors (int): LOF number of neighbors for this sensor.
+        diverse_settings (dict): Pipeline settings as built in main.py.
+        history_duration (float): Time (in s) of samples kept in the buffer.
+    """
+
+    def __init__(self, sensor_name, outlier_neighbors, diverse_settings, history_duration, time_column='time'):
+        self.sensor_name = sensor_name
+        self.outlier_neighbors = outlier_neighbors
+        self.diverse_settings = diverse_settings
+        self.history_duration = history_duration
+        self.time_column = time_column
+
+        self.buffer = None              # raw samples of the last history_duration seconds
+        self.buffer_offset = 0          # global sample index of the first row in the buffer
+        self.frozen_events = []         # event information of events that left the buffer (global indices)
+        self.live_events = []           # event information of events in the buffer, revised on every push
+        self.number_of_frozen_events = 0
+        self.last_frozen_end_time = -np.inf
+        self.frozen_until = -np.inf     # events starting before this time are frozen
+
+    @property
+    def events(self):
+        return self.frozen_events + self.live_events
+
+    def push(self, chunk):
+        """Appends a chunk of raw samples, re-detects the events in the buffer and trims it to history_duration."""
+        if chunk is not None and len(chunk) > 0:
+            if self.buffer is None:
+                self.buffer = chunk
+            else:
+                self.buffer = pd.concat([self.buffer, chunk], ignore_index=True)
+            self.buffer = self.buffer.sort_values(by=self.time_column).reset_index(drop=True)
+
+        if self.buffer is None or len(self.buffer) < 2:
+            return
+
+        self._detect_events()
+        self._trim()
+
+    def _detect_events(self):
+        df, events, event_stats, _ = process_dataframe(self.buffer.copy(), self.sensor_name, self.outlier_neighbors, self.diverse_settings)
+        times = df[self.time_column].to_numpy()
+
+        self.live_events = []
+        for event, stats in zip(events, event_stats):
+            if stats['start_time'] < self.frozen_until or stats['start_time'] <= self.last_frozen_end_time:
+                continue
+            stats = dict(stats)
+            stats['event_id'] = self.number_of_frozen_events + len(self.live_events) + 1
+            stats['min_value_time'] = times[stats['min_value_index']]
+            stats['max_value_time'] = times[stats['max_value_index']]
+            stats['start_index'] += self.buffer_offset
+            stats['min_value_index'] += self.buffer_offset
+            stats['max_value_index'] += self.buffer_offset
+            self.live_events.append(stats)
+
+    def _trim(self):
+        times = self.buffer[self.time_column].to_numpy()
+        keep_from = int(np.searchsorted(times, times[-1] - self.history_duration, side='left'))
+        if keep_from == 0:
+            return
+
+        # events whose normalization window would be cut off cannot be recomputed anymore
+        self.frozen_until = times[keep_from] + self.diverse_settings['normalization_window_duration']
+        while self.live_events and self.live_events[0]['start_time'] < self.frozen_until:
+            event = self.live_events.pop(0)
+            self.frozen_events.append(event)
+            self.number_of_frozen_events += 1
+            self.last_frozen_end_time = event['end_time']
+
+        self.buffer = self.buffer.iloc[keep_from:].reset_index(drop=True)
+        self.buffer_offset += keep_from
+
+    def drop_frozen_events(self, keep):
+        self.frozen_events = [event for event in self.frozen_events if keep(event)]
+
+
+class StreamingSynchronizer:
+    """
+    Online synchronization of a feed to align against a reference feed.
+
+    Parameters:
+        sensor_name_reference (str): Sensor of the reference feed.
+        sensor_name_align (str): Sensor of the feed to align.
+        outlier_settings (dict): LOF number of neighbors per sensor (see main.py).
+        diverse_settings (dict): Pipeline settings as built in main.py.
+        history_duration (float): Time (in s) of raw samples kept per feed. Must exceed the normalization window.
+    """
+
+    def __init__(self, sensor_name_reference, sensor_name_align, outlier_settings, diverse_settings, history_duration=300, time_column='time'):
+        if history_duration <= diverse_settings['normalization_window_duration']:
+            raise ValueError("history_duration must be larger than normalization_window_duration")
+        if diverse_settings.get('coarse_alignment'):
+            raise ValueError("coarse_alignment is not supported in streaming mode")
+
+        self.sensor_name_reference = sensor_name_reference
+        self.sensor_name_align = sensor_name_align
+        self.max_time_gap_events = diverse_settings['max_time_gap_events']
+        self.dtw_window_fraction = diverse_settings.get('dtw_window_fraction', DTW_WINDOW_FRACTION)
+        self.event_assignment = diverse_settings.get('event_assignment', EVENT_ASSIGNMENT)
+        self.drift_model = diverse_settings.get('drift_model', 'piecewise')
+        self.drift_inlier_threshold = diverse_settings.get('drift_inlier_threshold', DRIFT_INLIER_THRESHOLD)
+        if sensor_name_reference == 'sensomative' or sensor_name_align == 'sensomative':
+            self.dtw_distance_threshold = diverse_settings['dtw_distance_threshold_sensomative']
+        else:
+            self.dtw_distance_threshold = diverse_settings['dtw_distance_threshold_accelerator']
+
+        self.reference = StreamingSignal(sensor_name_reference, outlier_settings[sensor_name_reference], diverse_settings, history_duration, time_column)
+        self.align = StreamingSignal(sensor_name_align, outlier_settings[sensor_name_align], diverse_settings, history_duration, time_column)
+
+        self.frozen_comparison_results = []     # matches between frozen events that no new event can change anymore
+        self.frozen_sync_points = []
+        self.comparison_results = []            # all current matches, same format as compare_events_dtw
+        self.sync_points = []                   # (align time, reference time) of accepted matches, in align_signals order
+
+    def push_reference(self, chunk):
+        self.reference.push(chunk)
+        return self._update()
+
+    def push_align(self, chunk):
+        self.align.push(chunk)
+        return self._update()
+
+    def finish(self):
+        """Returns the final update at the end of the session."""
+        return self._update()
+
+    def _update(self):
+        gap = self.max_time_gap_events
+        results = []
+        if self.reference.events and self.align.events:
+            results = compare_events_dtw(self.reference.events, self.align.events, gap, self.dtw_distance_threshold,
+                                         self.dtw_window_fraction, assignment=self.event_assignment)
+        reference_by_id = {event['event_id']: event for event in self.reference.events}
+        align_by_id = {event['event_id']: event for event in self.align.events}
+
+        # matches of frozen events further than 2 gaps away from any live event can no longer change
+        frozen_until = min(self.reference.frozen_until, self.align.frozen_until) - 2 * gap
+        comparison_results = list(self.frozen_comparison_results)
+        sync_points = list(self.frozen_sync_points)
+        freeze = True
+        for result in results:
+            event1 = reference_by_id[result['event1_id']]
+            event2 = align_by_id[result['best_match_event2_id']]
+            comparison_results.append(result)
+
+            sync_point = None
+            if result['dtw_distance'] is not None and result['dtw_distance'] < self.dtw_distance_threshold:
+                event1_synch_index, event2_synch_index = select_sync_indices(result, self.sensor_name_reference, self.sensor_name_align)
+                sync_point = (event_value_time(event2, event2_synch_index), event_value_time(event1, event1_synch_index))
+                sync_points.append(sync_point)
+
+            # keep the order of the matches by only freezing a leading run of them
+            freeze = freeze and max(event1['start_time'], event2['start_time']) < frozen_until
+            if freeze:
+                self.frozen_comparison_results.append(result)
+                if sync_point is not None:
+                    self.frozen_sync_points.append(sync_point)
+                self.reference.drop_frozen_events(lambda event: event['event_id'] != event1['event_id'])
+                self.align.drop_frozen_events(lambda event: event['event_id'] != event2['event_id'])
+
+        # unmatched frozen events cannot be matched by any live event anymore
+        self.reference.drop_frozen_events(lambda event: event['start_time'] >= frozen_until - gap)
+        self.align.drop_frozen_events(lambda event: event['start_time'] >= frozen_until - gap)
+
+        self.comparison_results = comparison_results
+        if sync_points == self.sync_points:
+            return []
+        self.sync_points = sync_points
+
+        time_mapping = self.time_mapping
+        return [{
+            'sync_points': list(sync_points),
+            'time_shift': time_mapping.time_shift,
+            'stretch_factor': self._stretch_factor(time_mapping),
+            'number_of_sync_points': len(sync_points)
+        }]
+
+    @property
+    def time_mapping(self):
+        """
+        Mapping from the clock of the align feed to the reference clock through the current sync points (TimeMapping or,
+        with drift_model 'affine' or 'spline', the DriftModel fitted to them).
+        """
+        if self.drift_model == 'piecewise':
+            return TimeMapping.from_sync_points(self.sync_points)
+        return fit_drift_model(self.sync_points, self.drift_model, self.drift_inlier_threshold)
+
+    @staticmethod
+    def _stretch_factor(time_mapping):
+        if isinstance(time_mapping, TimeMapping):
+            return time_mapping.slopes[-1] if len(time_mapping.slopes) else 1.0
+        return time_mapping.rate
+
+    def correct_times(self, times):
+        """Maps times of the align feed onto the reference clock with the current sync points."""
+        return self.time_mapping(times)
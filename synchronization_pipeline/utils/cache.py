@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import multiprocessing.util
+from collections import OrderedDict
+
+# Increase when the format of the cached entries changes
+CACHE_VERSION = 3
+# Sources of process_signal and the pipeline stages (relative to synchronization_pipeline): their hash is part of every
+# key, so entries computed by an older version of the code are never returned
+CODE_PATHS = ['main.py', 'pipeline_steps', os.path.join('utils', 'data_utils.py')]
+# Settings that change the output of process_signal
+CACHED_SETTINGS = ['min_time_event', 'min_outlier_fraction_event', 'normalization_window_duration', 'load_sensor_columns_only', 'time_range']
+# Hit, miss and eviction counts of all runs using a cache folder, one line per process and flush
+STATS_FILE = 'stats.jsonl'
+
+
+class SignalCache:
+    """
+    On-disk cache of process_signal outputs (annotated DataFrame, event information and signal column).
+
+    Entries are keyed by the content hash of the input file, the sensor name, the outlier detection settings, the event
+    settings and the hash of the pipeline sources (code_hash). When the cache grows beyond max_size_mb, the least
+    recently used entries are removed.
+    Hit and miss counts are kept in memory for this instance (stats). flush_stats appends the counts since the last
+    flush as one line to stats.jsonl, so processes sharing the folder never overwrite each other's counts; it is called
+    when the process exits (also in worker processes) and can be called at the end of a run.
+
+    Parameters:
+        cache_folder_path (str): Folder where the entries are stored.
+        max_size_mb (float): Maximum total size of the entries.
+    """
+
+    def __init__(self, cache_folder_path, max_size_mb=500):
+        self.cache_folder_path = cache_folder_path
+        self.max_size_bytes = max_size_mb * 1e6
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._start_counting()
+        os.makedirs(cache_folder_path, exist_ok=True)
+
+    def key(self, input_file, sensor_name, outlier_neighbors, outlier_method, diverse_settings):
+        settings = {name: diverse_settings.get(name) for name in CACHED_SETTINGS}
+        settings.update({
+            'file_hash': file_hash(input_file),
+            'sensor_name': sensor_name,
+            'outlier_neighbors': outlier_neighbors,
+            'outlier_method': outlier_method,
+            'cache_version': CACHE_VERSION,
+            'code_hash': code_hash()
+        })
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                entry = pickle.load(entry_file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self._count('misses')
+            return None
+        os.utime(path)  # access time for the LRU eviction
+        self._count('hits')
+        return entry
+
+    def put(self, key, entry):
+        path = self._entry_path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as entry_file:
+            pickle.dump(entry, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)  # atomic, parallel runs never read half written entries
+        self._evict()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_folder_path, f"{key}.pkl")
+
+    def _evict(self):
+        entries = []
+        for file in os.listdir(self.cache_folder_path):
+            if file.endswith('.pkl'):
+                path = os.path.join(self.cache_folder_path, file)
+                try:
+                    entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+                except FileNotFoundError:
+                    continue
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            self._count('evictions')
+
+    def flush_stats(self):
+        """Appends the counts since the last flush to stats.jsonl."""
+        if os.getpid() != self._pid or not any(self._unflushed.values()):
+            return
+        line = json.dumps(dict(self._unflushed, pid=self._pid, time=time.strftime('%Y-%m-%d %H:%M:%S'))) + '\n'
+        # one write with O_APPEND, lines of parallel processes are not interleaved
+        file = os.open(os.path.join(self.cache_folder_path, STATS_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            os.write(file, line.encode())
+        finally:
+            os.close(file)
+        self._unflushed = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _start_counting(self):
+        self._pid = os.getpid()
+        self._unflushed = {'hits': 0, 'misses': 0, 'evictions': 0}
+        # multiprocessing runs its finalizers when the process exits, unlike atexit also in worker processes
+        multiprocessing.util.Finalize(None, self.flush_stats, exitpriority=10)
+
+    def _count(self, name):
+        if os.getpid() != self._pid:
+            # copy of the instance in a forked worker process, the counts before the fork belong to the parent
+            self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+            self._start_counting()
+        self.stats[name] += 1
+        self._unflushed[name] += 1
+
+
+class StageCache:
+    """
+    Memoizes the outputs of single pipeline stages, e.g. for a parameter sweep. Every entry is keyed by the stage name
+    and exactly the parameters the stage depends on, including the keys of the stages it builds on (key()), so changing
+    a parameter only recomputes the stages after it.
+
+    The max_entries most recently used entries are kept in memory, with cache_folder_path the entries of disk_stages (all
+    stages if None) are also stored in a SignalCache folder shared by processes and runs. Every entry keeps the time its
+    computation took, so the runtime of a configuration can be summed up even if its stages came from the cache.
+    Computations and hits are counted per stage.
+
+    Parameters:
+        cache_folder_path (str): Folder for the on-disk entries, '' or None to keep them in memory only.
+        max_entries (int): Number of entries kept in memory.
+        max_size_mb (float): Maximum total size of the on-disk entries.
+        disk_stages (list): Stages stored on disk, e.g. only the expensive ones.
+    """
+
+    def __init__(self, cache_folder_path=None, max_entries=256, max_size_mb=2000, disk_stages=None):
+        self.disk = SignalCache(cache_folder_path, max_size_mb) if cache_folder_path else None
+        self.disk_stages = disk_stages
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.stats = {}
+
+    @staticmethod
+    def key(stage, **parameters):
+        parameters.update(stage=stage, cache_version=CACHE_VERSION, code_hash=code_hash())
+        return f"{stage}-" + hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode()).hexdigest()
+
+    def compute(self, key, function, *args):
+        """Returns (output, seconds) of function(*args) for key, computed only if it is not cached."""
+        stage = key.split('-')[0]
+        stats = self.stats.setdefault(stage, {'computed': 0, 'hits': 0, 'time': 0.0})
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            stats['hits'] += 1
+            return self.memory[key]
+        on_disk = self.disk is not None and (self.disk_stages is None or stage in self.disk_stages)
+        entry = self.disk.get(key) if on_disk else None
+        if entry is None:
+            start = time.perf_counter()
+            entry = (function(*args), time.perf_counter() - start)
+            stats['computed'] += 1
+            stats['time'] += entry[1]
+            if on_disk:
+                self.disk.put(key, entry)
+        else:
+            stats['hits'] += 1
+        self.memory[key] = entry
+        if len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+        return entry
+
+
+def file_hash(input_file, block_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(input_file, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def code_hash():
+    """Returns the hash of the sources in CODE_PATHS (computed once per process)."""
+    global _code_hash
+    if _code_hash is None:
+        pipeline_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        sha256 = hashlib.sha256()
+        for code_path in CODE_PATHS:
+            path = os.path.join(pipeline_folder, code_path)
+            if os.path.isfile(path):
+                files = [path]
+            else:
+                files = sorted(os.path.join(path, file) for file in os.listdir(path) if file.endswith('.py'))
+            for file in files:
+                sha256.update(os.path.relpath(file, pipeline_folder).encode())
+                with open(file, 'rb') as source:
+                    sha256.update(source.read())
+        _code_hash = sha256.hexdigest()
+    return _code_hash
+
+
+_code_hash = None
+_signal_caches = {}
+
+
+def get_signal_cache(diverse_settings):
+    """Returns the SignalCache configured in diverse_settings (one instance per folder and process) or None."""
+    cache_folder_path = diverse_settings.get('cache_folder_path')
+    if not cache_folder_path:
+        return None
+    if cache_folder_path not in _signal_caches:
+        _signal_caches[cache_folder_path] = SignalCache(cache_folder_path, diverse_settings.get('cache_max_size_mb', 500))
+    return _signal_caches[cache_folder_path]
+
+
+def flush_cache_stats():
+    """Flushes the counts of the signal caches of this process (SignalCache.flush_stats)."""
+    for cache in _signal_caches.values():
+        cache.flush_stats()
+
+
+def load_cache_stats(cache_folder_path):
+    """
+    Returns the hit, miss and eviction counts accumulated over all runs using the cache folder (flushed counts only, see
+    SignalCache.flush_stats).
+    """
+    total_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    try:
+        with open(os.path.join(cache_folder_path, STATS_FILE), 'r') as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return total_stats
+    for line in lines:
+        try:
+            stats = json.loads(line)
+        except json.JSONDecodeError:
+            continue    # line of a process that was killed while writing
+        for name in ('hits', 'misses', 'evictions'):
+            total_stats[name] += stats.get(name, 0)
+        total_stats['last_update'] = stats.get('time')
+    return total_stats
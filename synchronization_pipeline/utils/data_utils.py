@@ -1,16 +1,214 @@
 import os
+import json
+import time
+import hashlib
+import atexit
 import shutil
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-# add function to create the 1d_signal column 
+from utils.cache import file_hash
 
-def load_data(input_file, time_column='time'):
-    df = pd.read_csv(input_file)
-    df = df.sort_values(by=time_column).reset_index(drop=True) # theoretically not needed, just making sure
+# Channels that are summed up to the 1d_signal column per sensor
+SENSOR_COLUMNS = {
+    'corsano': ['accX', 'accY', 'accZ'],
+    'cosinuss': ['acc_x', 'acc_y', 'acc_z'],
+    'vivalink': ['x', 'y', 'z'],
+    'sensomative': ['device1_value0', 'device1_value1', 'device1_value2', 'device1_value3', 'device1_value4',
+                    'device1_value5', 'device1_value6', 'device1_value7', 'device1_value8', 'device1_value9',
+                    'device1_value10', 'device1_value11', 'device1_value12']
+}
+
+# Binary formats written by convert_data.py next to the CSV file, in order of preference
+BINARY_FORMATS = {'npy': '.npcols', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Rows per row group of the parquet format, time range queries only read the row groups that overlap the range
+PARQUET_ROW_GROUP_ROWS = 100000
+
+# Formats of the saved updated_, aligned_ and resampled_ files (output_format in config.yaml)
+OUTPUT_FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet', 'feather': '.feather'}
+# Writes that may be queued in the background before save_in_background waits for the oldest one
+MAX_PENDING_WRITES = 8
+
+
+def load_data(input_file, time_column='time', columns=None, time_range=None):
+    """
+    Loads a recording sorted by time. If a converted binary version of the CSV file exists (see convert_data.py) and is
+    not older than the CSV file, it is loaded instead, otherwise the CSV file is parsed and sorted unless its time index
+    (utils/time_index.py, if already built) records that it is sorted.
+
+    Parameters:
+        input_file (str): Path to the CSV file.
+        time_column (str): Name of the time column.
+        columns (list): Columns to load (missing ones are ignored), None for all columns.
+        time_range (tuple): (start, end) to load only the rows with start <= time <= end (see load_time_range).
+    """
+    if time_range is not None:
+        return load_time_range(input_file, time_range[0], time_range[1], time_column, columns)
+
+    binary_file = find_binary_file(input_file)
+    if binary_file is not None:
+        # binary files are written sorted by convert_data.py
+        return load_binary_data(binary_file, columns)
+
+    usecols = None if columns is None else (lambda column: column in columns)
+    df = pd.read_csv(input_file, usecols=usecols)
+    if not csv_sorted_by_time(input_file, time_column):
+        df = df.sort_values(by=time_column).reset_index(drop=True)
+    return df
+
+
+def load_time_range(input_file, start, end, time_column='time', columns=None, index_folder=None):
+    """
+    Loads the rows of a recording with start <= time <= end sorted by time, without reading the rest of the file: the
+    sorted time column of a converted binary file is searched (parquet: only the row groups whose time statistics
+    overlap the range are read), a CSV file is read through its sparse time index (utils/time_index.py, stored in
+    index_folder or next to the file).
+    """
+    binary_file = find_binary_file(input_file)
+    if binary_file is None:
+        from utils.time_index import read_time_range
+        df = read_time_range(input_file, start, end, time_column, columns, index_folder)
+        if not csv_sorted_by_time(input_file, time_column, index_folder):
+            df = df.sort_values(by=time_column).reset_index(drop=True)
+    elif binary_file.endswith(BINARY_FORMATS['parquet']):
+        import pyarrow.parquet as pq
+        names = pq.read_schema(binary_file).names
+        df = pd.read_parquet(binary_file, columns=None if columns is None else [name for name in names if name in columns],
+                             filters=[(time_column, '>=', start), (time_column, '<=', end)])
+    else:
+        # binary files are written sorted by convert_data.py
+        if binary_file.endswith(BINARY_FORMATS['npy']):
+            times = np.load(os.path.join(binary_file, f"{time_column}.npy"), mmap_mode='r')
+        else:
+            import pyarrow.feather as feather
+            times = feather.read_table(binary_file, columns=[time_column], memory_map=True).column(time_column).to_numpy()
+        rows = slice(int(np.searchsorted(times, start, side='left')), int(np.searchsorted(times, end, side='right')))
+        df = load_binary_data(binary_file, columns, rows)
+    return df
+
+
+def iter_data_chunks(input_file, chunk_size, time_column='time', columns=None):
+    """
+    Yields a recording in chunks of chunk_size rows without loading it as a whole (index = row number in the file).
+    Uses the converted binary file like load_data. The recording must be sorted by time, which is checked on the way.
+    """
+    binary_file = find_binary_file(input_file)
+    if binary_file is None:
+        usecols = None if columns is None else (lambda column: column in columns)
+        chunks = pd.read_csv(input_file, usecols=usecols, chunksize=chunk_size)
+    elif binary_file.endswith(BINARY_FORMATS['npy']):
+        with open(os.path.join(binary_file, 'meta.json'), 'r') as meta_file:
+            rows = json.load(meta_file)['rows']
+        chunks = (load_binary_data(binary_file, columns, slice(start, start + chunk_size)) for start in range(0, rows, chunk_size))
+    elif binary_file.endswith(BINARY_FORMATS['parquet']):
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(binary_file).iter_batches(batch_size=chunk_size, columns=columns)
+        chunks = (batch.to_pandas() for batch in batches)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(binary_file, columns=columns, memory_map=True)
+        chunks = (table.slice(start, chunk_size).to_pandas() for start in range(0, table.num_rows, chunk_size))
+
+    offset = 0
+    last_time = -np.inf
+    for chunk in chunks:
+        if columns is not None:
+            chunk = chunk[[column for column in chunk.columns if column in columns]]
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        times = chunk[time_column].to_numpy()
+        if len(times) > 0 and (times[0] < last_time or np.any(np.diff(times) < 0)):
+            raise ValueError(f"{input_file} is not sorted by {time_column}, chunked processing requires sorted recordings")
+        if len(times) > 0:
+            last_time = times[-1]
+        offset += len(chunk)
+        yield chunk
+
+
+def csv_sorted_by_time(input_file, time_column='time', index_folder=None):
+    # sorted_by_time of the time index of a CSV file, False if the index is not built (a missing one is not built here)
+    from utils.time_index import load_time_index
+    index = load_time_index(input_file, time_column, index_folder, build=False)
+    return index is not None and index['sorted_by_time']
+
+
+def required_columns(sensor_name, time_column='time'):
+    # time, the timestamp used for plotting and the channels of the 1d_signal
+    return [time_column, 'timestamp'] + SENSOR_COLUMNS[sensor_name]
+
+
+def find_binary_file(input_file):
+    base_path = os.path.splitext(input_file)[0]
+    for extension in BINARY_FORMATS.values():
+        binary_file = base_path + extension
+        if os.path.exists(binary_file) and (not os.path.exists(input_file) or os.path.getmtime(binary_file) >= os.path.getmtime(input_file)):
+            return binary_file
+    return None
+
+
+def load_binary_data(binary_file, columns=None, rows=None):
+    # rows (slice) selects a range of rows of the npy and feather formats, used for chunked processing and time ranges
+    if binary_file.endswith(BINARY_FORMATS['npy']):
+        with open(os.path.join(binary_file, 'meta.json'), 'r') as meta_file:
+            meta = json.load(meta_file)
+        selected_columns = [column for column in meta['columns'] if columns is None or column in columns]
+        data = {}
+        for column in selected_columns:
+            # numeric columns are memory mapped, only the pages of the selected columns are read
+            values = np.load(os.path.join(binary_file, f"{column}.npy"), mmap_mode='r')
+            if rows is not None:
+                values = values[rows]
+            if column in meta['missing_values']:
+                isna = np.load(os.path.join(binary_file, f"{column}.isna.npy"), mmap_mode='r')
+                values = pd.Series(values, dtype=object).where(~(isna if rows is None else isna[rows]))
+            data[column] = values
+        return pd.DataFrame(data, columns=selected_columns, copy=True)
+
+    if binary_file.endswith(BINARY_FORMATS['parquet']):
+        df = pd.read_parquet(binary_file, columns=columns)
+    elif rows is not None:
+        import pyarrow.feather as feather
+        table = feather.read_table(binary_file, memory_map=True)
+        table = table.select([name for name in table.column_names if columns is None or name in columns])
+        df = table.slice(rows.start, rows.stop - rows.start).to_pandas()
+    else:
+        df = pd.read_feather(binary_file, columns=columns)
+    if columns is not None:
+        df = df[[column for column in df.columns if column in columns]]
     return df
 
 
+def save_binary_data(df, input_file, binary_format='npy'):
+    """Stores a DataFrame loaded with load_data next to input_file in the given binary format."""
+    binary_file = os.path.splitext(input_file)[0] + BINARY_FORMATS[binary_format]
+    if binary_format == 'parquet':
+        df.to_parquet(binary_file, index=False, row_group_size=PARQUET_ROW_GROUP_ROWS)
+    elif binary_format == 'feather':
+        df.to_feather(binary_file)
+    else:
+        os.makedirs(binary_file, exist_ok=True)
+        missing_values = []
+        for column in df.columns:
+            values = df[column].to_numpy()
+            if values.dtype.kind not in 'biuf':
+                isna = df[column].isna().to_numpy()
+                if isna.any():
+                    missing_values.append(column)
+                    np.save(os.path.join(binary_file, f"{column}.isna.npy"), isna)
+                values = df[column].fillna('').astype(str).to_numpy(dtype=str)
+            np.save(os.path.join(binary_file, f"{column}.npy"), values)
+        meta = {
+            'columns': list(df.columns),
+            'missing_values': missing_values,
+            'rows': len(df),
+            'source': os.path.basename(input_file)
+        }
+        with open(os.path.join(binary_file, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=4)
+    return binary_file
+
+
 def save_dataframe_to_csv(data, file_to_align, sensor_name_reference, prefix, output_folder_path):
     # Determine the directory structure
     aligned_dir = os.path.join(output_folder_path, f"aligned_to_{sensor_name_reference}")
@@ -18,8 +216,7 @@ def save_dataframe_to_csv(data, file_to_align, sensor_name_reference, prefix, ou
     target_dir = os.path.join(aligned_dir, file_folder)
 
     # Create the necessary directories
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
 
     # Define the full path for the output file
     output_file = os.path.join(target_dir, f"{prefix}_{os.path.basename(file_to_align)}")
@@ -27,7 +224,149 @@ def save_dataframe_to_csv(data, file_to_align, sensor_name_reference, prefix, ou
     # Save the DataFrame to the specified file
     data.to_csv(output_file, index=False)
     print(f"Data saved to: {output_file}")
-    
+
+
+def write_chunks(chunks, output_file, output_format='csv'):
+    """
+    Writes a stream of DataFrames with the same columns to one file in the given format (see OUTPUT_FORMATS) and passes
+    them on, so that a recording larger than the memory can be written chunk by chunk.
+    """
+    if output_format in ('csv', 'csv.gz'):
+        compression = {'method': 'gzip', 'compresslevel': 1} if output_format == 'csv.gz' else None
+        for number, chunk in enumerate(chunks):
+            chunk.to_csv(output_file, index=False, mode='w' if number == 0 else 'a', header=number == 0, compression=compression)
+            yield chunk
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for chunk in chunks:
+            # event_id and sync_point are empty in most chunks, as float columns every chunk has the same schema
+            table = pa.Table.from_pandas(chunk.assign(**{column: chunk[column].to_numpy(dtype=float, na_value=np.nan)
+                                                         for column in ('event_id', 'sync_point') if column in chunk}), preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(output_file, schema) if output_format == 'parquet' else pa.ipc.new_file(output_file, schema)
+            writer.write_table(table.cast(schema))
+            yield chunk
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def save_dataframe(data, file_to_align, sensor_name_reference, prefix, output_folder_path, output_format='csv'):
+    """
+    Saves data as <prefix>_<file> in the output folder of file_to_align in the given format (see OUTPUT_FORMATS). 'csv'
+    writes the same file as save_dataframe_to_csv, the other formats replace the extension of the file name.
+    """
+    if output_format == 'csv':
+        return save_dataframe_to_csv(data, file_to_align, sensor_name_reference, prefix, output_folder_path)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format '{output_format}', supported: {', '.join(OUTPUT_FORMATS)}")
+
+    file_name = f"{prefix}_{os.path.splitext(os.path.basename(file_to_align))[0]}{OUTPUT_FORMATS[output_format]}"
+    output_file = output_file_path(file_name, file_to_align, sensor_name_reference, output_folder_path)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if output_format == 'csv.gz':
+        # the fastest gzip level, the default level 9 takes several times longer for little gain
+        data.to_csv(output_file, index=False, compression={'method': 'gzip', 'compresslevel': 1})
+    elif output_format == 'parquet':
+        data.to_parquet(output_file, index=False)
+    else:
+        data.reset_index(drop=True).to_feather(output_file)
+    print(f"Data saved to: {output_file}")
+
+
+def output_format_of(path):
+    # Output format of a file name by its extension, csv if it has none of the OUTPUT_FORMATS
+    for output_format, extension in sorted(OUTPUT_FORMATS.items(), key=lambda item: -len(item[1])):
+        if path.endswith(extension):
+            return output_format
+    return 'csv'
+
+
+def read_output_file(path, columns=None):
+    # Reads a file saved with save_dataframe in any of the OUTPUT_FORMATS, only the given columns if columns is set
+    output_format = output_format_of(path)
+    if output_format == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    if output_format == 'feather':
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def time_map_provenance(reference_file, file_to_align, sensor_name_reference, sensor_name_align, settings):
+    # Inputs and settings of an alignment kept in its TimeMap, save_time_map adds the sizes and hashes of the files
+    settings_json = json.dumps(settings, sort_keys=True, default=str)
+    return {
+        'reference_file': reference_file,
+        'file_to_align': file_to_align,
+        'sensor_name_reference': sensor_name_reference,
+        'sensor_name_align': sensor_name_align,
+        'settings': json.loads(settings_json),
+        'settings_sha256': hashlib.sha256(settings_json.encode()).hexdigest(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+
+def save_time_map(time_map, file_to_align, sensor_name_reference, output_folder_path):
+    # Saves the TimeMap as time_map.json next to the aligned file, with the size and SHA-256 hash of its input files
+    for key in ('reference_file', 'file_to_align'):
+        input_file = time_map.provenance.get(key)
+        if input_file and os.path.isfile(input_file) and f'{key}_sha256' not in time_map.provenance:
+            time_map.provenance[f'{key}_size'] = os.path.getsize(input_file)
+            time_map.provenance[f'{key}_sha256'] = file_hash(input_file)
+    output_file = output_file_path("time_map.json", file_to_align, sensor_name_reference, output_folder_path)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    time_map.save(output_file)
+    print(f"Time map saved to: {output_file}")
+
+
+_writer = None
+_pending_writes = []
+
+
+def save_in_background(function, *args, **kwargs):
+    """
+    Runs the saving function in a background thread and returns immediately, so that the caller can go on (e.g.
+    plotting or the next pair of a batch) while the file is written. The writes run one after the other in the order
+    they were submitted; the data must not be modified afterwards. wait_for_writes() waits for all of them.
+    """
+    global _writer
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='output_writer')
+        # worker processes (e.g. of run_tests.py) do not run atexit, multiprocessing runs its own finalizers instead
+        from multiprocessing import util
+        util.Finalize(None, wait_for_writes, exitpriority=100)
+        atexit.register(wait_for_writes)
+    while len(_pending_writes) >= MAX_PENDING_WRITES:
+        _pending_writes.pop(0).result()
+    future = _writer.submit(function, *args, **kwargs)
+    _pending_writes.append(future)
+    return future
+
+
+def wait_for_writes():
+    # Waits for all writes started with save_in_background, errors of the writes are raised here
+    while _pending_writes:
+        _pending_writes.pop(0).result()
+
+
+def output_file_path(file_name, file_to_align, sensor_name_reference, output_folder_path):
+    # Path of an output file next to the aligned file (aligned_to_<reference sensor>/<file>/file_name)
+    return os.path.join(output_folder_path, f"aligned_to_{sensor_name_reference}", os.path.splitext(os.path.basename(file_to_align))[0], file_name)
+
+
+def save_pipeline_report(report, file_to_align, sensor_name_reference, output_folder_path):
+    # Saves the stage report of the run (see utils/instrumentation.py) as pipeline_report.json next to the aligned file
+    output_file = output_file_path("pipeline_report.json", file_to_align, sensor_name_reference, output_folder_path)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'w') as report_file:
+        json.dump(report, report_file, indent=4, default=str)
+    print(f"Pipeline report saved to: {output_file}")
+
 
 def save_yaml(config_file_path, file_to_align, sensor_name_reference, output_folder_path):
     """
@@ -43,8 +382,7 @@ def save_yaml(config_file_path, file_to_align, sensor_name_reference, output_fol
     target_dir = os.path.join(aligned_dir, file_folder)
 
     # Create the necessary directories
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
     
     # Define the full path for the output file
     config_file = os.path.join(target_dir, "config.yaml")
@@ -54,16 +392,8 @@ def save_yaml(config_file_path, file_to_align, sensor_name_reference, output_fol
 
 def create_1D_signal(df, sensor_name):
     # Determine how to create the 1d_signal column based on the sensor type
-    if 'corsano' == sensor_name:
-        df['1d_signal'] = df[['accX', 'accY', 'accZ']].abs().sum(axis=1)
-    elif 'cosinuss' == sensor_name:
-        df['1d_signal'] = df[['acc_x', 'acc_y', 'acc_z']].abs().sum(axis=1)
-    elif 'vivalink' == sensor_name:
-        df['1d_signal'] = df[['x', 'y', 'z']].abs().sum(axis=1)
-    elif 'sensomative' == sensor_name:
-        df['1d_signal'] = df[['device1_value0', 'device1_value1', 'device1_value2', 'device1_value3', 'device1_value4',
-                              'device1_value5', 'device1_value6', 'device1_value7', 'device1_value8', 'device1_value9',
-                              'device1_value10', 'device1_value11', 'device1_value12']].abs().sum(axis=1)
+    if sensor_name in SENSOR_COLUMNS:
+        df['1d_signal'] = df[SENSOR_COLUMNS[sensor_name]].abs().sum(axis=1)
     else:
         raise ValueError("Unknown file type in the input path")
 
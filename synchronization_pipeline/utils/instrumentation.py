@@ -0,0 +1,158 @@
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Optional per-stage profilers: 'cprofile' keeps the functions with the largest cumulative time of every stage,
+# 'tracemalloc' measures the peak memory allocated during every stage (slows down the stages)
+PROFILERS = ('', 'cprofile', 'tracemalloc')
+PROFILE_FUNCTIONS = 15
+
+
+class Instrumentation:
+    """
+    Collects the wall time, CPU time, memory and input/output sizes of the pipeline stages of one run.
+
+    Every stage is measured with `with instrumentation.stage(name, file=..., samples=...) as record:`, the stage adds its
+    output sizes to record. The records are kept in the order the stages finished (report()).
+    A disabled instance (DISABLED) returns a shared no-op record and measures nothing.
+
+    Parameters:
+        enabled (bool): Measure the stages.
+        profiler (str): '' (none), 'cprofile' or 'tracemalloc', see PROFILERS.
+    """
+
+    def __init__(self, enabled=True, profiler=''):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown instrumentation_profiler '{profiler}', supported: cprofile, tracemalloc")
+        self.enabled = enabled
+        self.profiler = profiler
+        self.stages = []
+        self.start_time = time.perf_counter()
+
+    def stage(self, name, **inputs):
+        if not self.enabled:
+            return _disabled_stage
+        return self._measure(name, inputs)
+
+    @contextmanager
+    def _measure(self, name, inputs):
+        record = {'stage': name}
+        record.update(inputs)
+        profile = None
+        started_tracemalloc = False
+        if self.profiler == 'cprofile':
+            profile = cProfile.Profile()
+        elif self.profiler == 'tracemalloc':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracemalloc = True
+            tracemalloc.reset_peak()
+            allocated_before, _ = tracemalloc.get_traced_memory()
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            record['wall_time'] = time.perf_counter() - wall_start
+            record['cpu_time'] = time.process_time() - cpu_start
+            if self.profiler == 'tracemalloc':
+                _, peak = tracemalloc.get_traced_memory()
+                record['peak_allocated_mb'] = max(0, peak - allocated_before) / 1e6
+                if started_tracemalloc:
+                    tracemalloc.stop()
+            if resource is not None:
+                record['max_rss_mb'] = _max_rss_mb()
+            if profile is not None:
+                record['profile'] = _top_functions(profile)
+            self.stages.append(record)
+
+    def report(self):
+        """Returns the stage records of the run and the totals per stage name."""
+        return {
+            'profiler': self.profiler,
+            'wall_time': time.perf_counter() - self.start_time,
+            'max_rss_mb': _max_rss_mb() if resource is not None else None,
+            'stages': self.stages,
+            'totals': aggregate_stages(self.stages)
+        }
+
+
+class _DisabledStage:
+    # context manager of a disabled Instrumentation, the record written to is discarded
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_disabled_stage = _DisabledStage()
+DISABLED = Instrumentation(enabled=False)
+
+
+def get_instrumentation(diverse_settings):
+    """Returns a new Instrumentation if instrumentation is enabled in diverse_settings, otherwise DISABLED."""
+    if not diverse_settings.get('instrumentation'):
+        return DISABLED
+    return Instrumentation(profiler=diverse_settings.get('instrumentation_profiler') or '')
+
+
+def aggregate_stages(stages):
+    """Sums the times, sizes and flags (e.g. cache hits) of the stage records per stage name, memory is the maximum."""
+    totals = {}
+    for record in stages:
+        total = totals.setdefault(record['stage'], {'count': 0})
+        total['count'] += 1
+        for name, value in record.items():
+            if name in ('stage', 'file', 'profile') or not isinstance(value, (int, float)):
+                continue
+            if name.endswith('_mb'):
+                total[name] = max(total.get(name, 0), value)
+            else:
+                total[name] = total.get(name, 0) + value
+    return totals
+
+
+def aggregate_reports(reports):
+    """Combines the reports of several runs (e.g. a batch of pairs) into the totals per stage."""
+    stages = [record for report in reports for record in report['stages']]
+    return {
+        'runs': len(reports),
+        'wall_time': sum(report['wall_time'] for report in reports),
+        'totals': aggregate_stages(stages)
+    }
+
+
+def format_totals(totals):
+    """Returns the totals per stage as printable table."""
+    lines = [f"{'stage':<28} {'count':>6} {'wall':>10} {'cpu':>10} {'memory':>10}"]
+    for name, total in totals.items():
+        memory = total.get('peak_allocated_mb', total.get('max_rss_mb'))
+        memory = f"{memory:>8.1f}MB" if memory is not None else f"{'-':>10}"
+        lines.append(f"{name:<28} {total['count']:>6} {total['wall_time']:>9.3f}s {total['cpu_time']:>9.3f}s {memory}")
+    return '\n'.join(lines)
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def _top_functions(profile):
+    functions = []
+    for (file, line, function), (_, calls, _, cumulative, _) in pstats.Stats(profile).stats.items():
+        functions.append({'function': f"{file}:{line}({function})", 'calls': calls, 'cumulative_time': cumulative})
+    functions.sort(key=lambda entry: entry['cumulative_time'], reverse=True)
+    return functions[:PROFILE_FUNCTIONS]
@@ -0,0 +1,170 @@
+import io
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Increase when the format of the index files changes
+TIME_INDEX_VERSION = 2
+# The index of file.csv is stored next to it as file.timeindex.json (or in an index folder, see time_index_path)
+TIME_INDEX_EXTENSION = '.timeindex.json'
+# Rows per indexed block: a range query reads the blocks that overlap the range, so at most two partial blocks too many
+TIME_INDEX_BLOCK_ROWS = 10000
+# Bytes read at once while searching the line breaks of a file
+READ_BLOCK_BYTES = 1 << 24
+
+
+def time_index_path(input_file, index_folder=None):
+    """Returns the path of the time index of input_file, next to it or in index_folder (e.g. for read-only datasets)."""
+    if not index_folder:
+        return os.path.splitext(input_file)[0] + TIME_INDEX_EXTENSION
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    path_hash = hashlib.sha256(os.path.abspath(input_file).encode()).hexdigest()[:16]
+    return os.path.join(index_folder, f"{name}-{path_hash}{TIME_INDEX_EXTENSION}")
+
+
+def build_time_index(input_file, time_column='time', block_rows=TIME_INDEX_BLOCK_ROWS, index_folder=None):
+    """
+    Builds and saves the sparse time index of a CSV recording: the byte offset of every block_rows-th row and the
+    smallest and largest time of every block. Two sequential passes over the file, only the time column is parsed.
+    If the rows are not one per line (blank lines, quoted line breaks) the index has no offsets and range queries read
+    the whole file. Raises a ValueError if the file has no time column.
+    """
+    with open(input_file, 'rb') as file:
+        header = file.readline()
+    columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+    if time_column not in columns:
+        raise ValueError(f"No '{time_column}' column in {input_file}")
+
+    offsets, data_lines, size = _block_offsets(input_file, len(header), block_rows)
+    min_times, max_times = [], []
+    rows = 0
+    is_sorted = True
+    last_time = -np.inf
+    for chunk in pd.read_csv(input_file, usecols=[time_column], chunksize=block_rows):
+        times = pd.to_numeric(chunk[time_column], errors='coerce').to_numpy(dtype=float)
+        valid = times[~np.isnan(times)]
+        # blocks without a valid time are never read
+        min_times.append(float(valid.min()) if len(valid) else None)
+        max_times.append(float(valid.max()) if len(valid) else None)
+        # sorted_by_time: load_data keeps the file order, so missing times (sorted last by pandas) count as unsorted
+        is_sorted = is_sorted and len(valid) == len(times)
+        if len(valid):
+            is_sorted = is_sorted and bool(valid[0] >= last_time) and bool(np.all(np.diff(valid) >= 0))
+            last_time = valid[-1]
+        rows += len(chunk)
+
+    stat = os.stat(input_file)
+    index = {
+        'version': TIME_INDEX_VERSION,
+        'source': os.path.basename(input_file),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime_ns,
+        'time_column': time_column,
+        'header': header.decode(),
+        'columns': columns,
+        'rows': rows,
+        'block_rows': block_rows,
+        'sorted_by_time': is_sorted,
+        'offsets': offsets + [size] if rows == data_lines else None,    # start of every block and the end of the data
+        'min_times': min_times,
+        'max_times': max_times
+    }
+    index_file = time_index_path(input_file, index_folder)
+    if index_folder:
+        os.makedirs(index_folder, exist_ok=True)
+    temporary_file = f"{index_file}.{os.getpid()}.tmp"
+    with open(temporary_file, 'w') as file:
+        json.dump(index, file)
+    os.replace(temporary_file, index_file)
+    return index
+
+
+def _block_offsets(input_file, header_size, block_rows):
+    # byte offsets of the data rows 0, block_rows, 2 * block_rows, ... (the line breaks are searched with NumPy), the
+    # number of data lines and the size of the file. Every line break that is not the last byte starts a line.
+    size = os.path.getsize(input_file)
+    offsets = []
+    lines = 0
+    position = header_size
+    line_starts = np.array([header_size] if size > header_size else [], dtype=np.int64)
+    with open(input_file, 'rb') as file:
+        file.seek(header_size)
+        while True:
+            offsets.extend(line_starts[(lines + np.arange(len(line_starts))) % block_rows == 0].tolist())
+            lines += len(line_starts)
+            block = file.read(READ_BLOCK_BYTES)
+            if not block:
+                break
+            line_starts = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n')) + position + 1
+            line_starts = line_starts[line_starts < size]
+            position += len(block)
+    return offsets, lines, size
+
+
+def load_time_index(input_file, time_column='time', index_folder=None, build=True):
+    """
+    Returns the time index of a CSV recording. A missing index or one of an older version of the file is built
+    (build=True) or None is returned.
+    """
+    try:
+        with open(time_index_path(input_file, index_folder), 'r') as file:
+            index = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = None
+    if index is not None:
+        stat = os.stat(input_file)
+        if (index.get('version') != TIME_INDEX_VERSION or index['time_column'] != time_column or
+                index['source_size'] != stat.st_size or index['source_mtime'] != stat.st_mtime_ns):
+            index = None
+    if index is None and build:
+        index = build_time_index(input_file, time_column, index_folder=index_folder)
+    return index
+
+
+def read_time_ranges(input_file, ranges, time_column='time', columns=None, index_folder=None):
+    """
+    Reads the rows of a CSV recording with start <= time <= end for every (start, end) in ranges through its time index
+    (built on first use): only the blocks whose times overlap a range are read and parsed, consecutive blocks at once.
+    Returns one DataFrame per range with the rows in file order and a RangeIndex.
+
+    Parameters:
+        columns (list): Columns to load (missing ones are ignored), None for all columns.
+        index_folder (str): Folder of the time indexes, None to store them next to the files.
+    """
+    index = load_time_index(input_file, time_column, index_folder)
+    usecols = None if columns is None else (lambda column: column in columns or column == time_column)
+    if index['offsets'] is None:
+        # not indexable by line, the whole file is parsed once for all ranges
+        df = pd.read_csv(input_file, usecols=usecols)
+        return [_select(df, start, end, time_column, columns) for start, end in ranges]
+
+    header = index['header'].encode()
+    offsets = np.asarray(index['offsets'], dtype=np.int64)
+    min_times = np.array([np.inf if time is None else time for time in index['min_times']])
+    max_times = np.array([-np.inf if time is None else time for time in index['max_times']])
+    results = []
+    with open(input_file, 'rb') as file:
+        for start, end in ranges:
+            blocks = np.flatnonzero((max_times >= start) & (min_times <= end))
+            parts = [header]
+            for run in (np.split(blocks, np.flatnonzero(np.diff(blocks) > 1) + 1) if len(blocks) else []):
+                file.seek(offsets[run[0]])
+                parts.append(file.read(offsets[run[-1] + 1] - offsets[run[0]]))
+            results.append(_select(pd.read_csv(io.BytesIO(b''.join(parts)), usecols=usecols), start, end, time_column, columns))
+    return results
+
+
+def _select(df, start, end, time_column, columns):
+    # rows with start <= time <= end with a RangeIndex and only the requested columns
+    times = pd.to_numeric(df[time_column], errors='coerce')
+    df = df[(times >= start) & (times <= end)].reset_index(drop=True)
+    if columns is not None:
+        df = df[[column for column in df.columns if column in columns]]
+    return df
+
+
+def read_time_range(input_file, start, end, time_column='time', columns=None, index_folder=None):
+    """Reads the rows of a CSV recording with start <= time <= end (see read_time_ranges)."""
+    return read_time_ranges(input_file, [(start, end)], time_column, columns, index_folder)[0]
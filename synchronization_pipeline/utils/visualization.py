@@ -1,82 +1,68 @@
 import plotly.graph_objects as go
 import plotly.io as pio
+from plotly.subplots import make_subplots
+import numpy as np
 import os
 
-def plot_interactive_html(df1, df2, resampled_df2, signal_column1, signal_column2, input_file1, input_file2, plot_settings):
+# Default number of points per signal trace when decimating
+MAX_POINTS = 10000
+# Time (in s) shown before and after an event in the event panels
+EVENT_PANEL_MARGIN = 5.0
+
+
+def minmax_decimate(values, max_points=MAX_POINTS):
+    """
+    Returns the sorted indices of at most max_points samples that keep the shape of the signal: the signal is split into
+    max_points / 2 equally long buckets and the minimum and maximum of every bucket are kept, so peaks are never lost.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, max_points // 2)
+    size = int(np.ceil(n / buckets))
+    buckets = int(np.ceil(n / size))
+    padded_min = np.full(buckets * size, np.inf)
+    padded_max = np.full(buckets * size, -np.inf)
+    valid = ~np.isnan(values)
+    padded_min[:n] = np.where(valid, values, np.inf)
+    padded_max[:n] = np.where(valid, values, -np.inf)
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate((offsets + padded_min.reshape(buckets, size).argmin(axis=1),
+                              offsets + padded_max.reshape(buckets, size).argmax(axis=1), [0, n - 1]))
+    return np.unique(np.minimum(indices, n - 1))
+
+
+def plot_interactive_html(df1, df2, resampled_df2, signal_column1, signal_column2, input_file1, input_file2, plot_settings, output_file='interactive_plot.html'):
+    """
+    Plots the reference, the original and the resampled signal to align with their events and sync points and saves the
+    figure as HTML file output_file. With plot_settings['decimation'] the signals are drawn with WebGL and decimated to
+    plot_settings['max_points'] points per trace (event and sync point markers are exact), with
+    plot_settings['event_panels'] every event of the reference is additionally shown at full resolution in
+    <output_file>_events.html.
+    """
     scaling_factor_reference = plot_settings['scaling_factor_reference']
     scaling_factor_align = plot_settings['scaling_factor_align']
+    decimation = plot_settings.get('decimation', False)
+    max_points = plot_settings.get('max_points', MAX_POINTS) if decimation else None
+    scatter = go.Scattergl if decimation else go.Scatter
 
     fig = go.Figure()
 
     # Plot original signal from input_file1
-    fig.add_trace(go.Scatter(
-        x=df1['timestamp'],
-        y=df1[signal_column1]*scaling_factor_reference,
-        mode='lines',
-        name=f'Original {os.path.basename(input_file1)}'
-    ))
+    fig.add_trace(_signal_trace(scatter, df1['timestamp'], df1[signal_column1]*scaling_factor_reference, max_points,
+                                name=f'Original {os.path.basename(input_file1)}'))
 
     # Plot original signal from input_file2
-    fig.add_trace(go.Scatter(
-        x=df2['timestamp'],
-        y=df2[signal_column2]*scaling_factor_align,
-        mode='lines',
-        name=f'Original {os.path.basename(input_file2)}',
-        line=dict(color='orange')
-    ))
+    fig.add_trace(_signal_trace(scatter, df2['timestamp'], df2[signal_column2]*scaling_factor_align, max_points,
+                                name=f'Original {os.path.basename(input_file2)}', line=dict(color='orange')))
 
     # Plot resampled signal from input_file2
-    fig.add_trace(go.Scatter(
-        x=resampled_df2['timestamp'],
-        y=resampled_df2[signal_column2]*scaling_factor_align,
-        mode='lines',
-        name='Resampled Signal 2',
-        line=dict(color='purple')
-    ))
-
-    # Annotate even and odd events for input_file1
-    even_events = df1[(df1['event_id'].notna()) & (df1['event_id'] % 2 == 0)]
-    odd_events = df1[(df1['event_id'].notna()) & (df1['event_id'] % 2 == 1)]
-
-    # Plot even events
-    fig.add_trace(go.Scatter(
-        x=even_events['timestamp'],
-        y=even_events[signal_column1]*scaling_factor_reference,
-        mode='markers',
-        marker=dict(color='green', symbol='circle'),
-        name='File 1 Even Event ID'
-    ))
-
-    # Plot odd events
-    fig.add_trace(go.Scatter(
-        x=odd_events['timestamp'],
-        y=odd_events[signal_column1]*scaling_factor_reference,
-        mode='markers',
-        marker=dict(color='red', symbol='circle'),
-        name='File 1 Odd Event ID'
-    ))
-
-    # Annotate even and odd events for input_file2
-    even_events_2 = df2[(df2['event_id'].notna()) & (df2['event_id'] % 2 == 0)]
-    odd_events_2 = df2[(df2['event_id'].notna()) & (df2['event_id'] % 2 == 1)]
-
-    # Plot even events for original_df2
-    fig.add_trace(go.Scatter(
-        x=even_events_2['timestamp'],
-        y=even_events_2[signal_column2]*scaling_factor_align,
-        mode='markers',
-        marker=dict(color='blue', symbol='diamond'),
-        name='File 2 Even Event ID'
-    ))
-
-    # Plot odd events for original_df2
-    fig.add_trace(go.Scatter(
-        x=odd_events_2['timestamp'],
-        y=odd_events_2[signal_column2]*scaling_factor_align,
-        mode='markers',
-        marker=dict(color='black', symbol='diamond'),
-        name='File 2 Odd Event ID'
-    ))
+    fig.add_trace(_signal_trace(scatter, resampled_df2['timestamp'], resampled_df2[signal_column2]*scaling_factor_align, max_points,
+                                name='Resampled Signal 2', line=dict(color='purple')))
+
+    for trace in _marker_traces(scatter, df1, df2, signal_column1, signal_column2, scaling_factor_reference, scaling_factor_align):
+        fig.add_trace(trace)
 
     # Set plot title and labels
     fig.update_layout(
@@ -87,4 +73,74 @@ def plot_interactive_html(df1, df2, resampled_df2, signal_column1, signal_column
     )
 
     # Save and open the plot as an HTML file
-    pio.write_html(fig, file='interactive_plot.html', auto_open=True)
+    output_folder = os.path.dirname(output_file)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+    pio.write_html(fig, file=output_file, auto_open=plot_settings.get('auto_open', True))
+    print(f"Plot saved to: {output_file}")
+
+    if plot_settings.get('event_panels', False):
+        event_file = f"{os.path.splitext(output_file)[0]}_events.html"
+        plot_event_panels(df1, df2, resampled_df2, signal_column1, signal_column2, plot_settings, event_file)
+
+
+def plot_event_panels(df1, df2, resampled_df2, signal_column1, signal_column2, plot_settings, output_file):
+    """Saves one panel per event of df1 with all signals at full resolution around the event as HTML file."""
+    scaling_factor_reference = plot_settings['scaling_factor_reference']
+    scaling_factor_align = plot_settings['scaling_factor_align']
+    events = df1[df1['event_id'].notna()].groupby('event_id')['time'].agg(['min', 'max'])
+    if events.empty:
+        print("No events to plot")
+        return
+
+    fig = make_subplots(rows=len(events), cols=1, subplot_titles=[f"Event {int(event_id)}" for event_id in events.index],
+                        vertical_spacing=min(0.3 / len(events), 0.05))
+    for row, (_, event) in enumerate(events.iterrows(), start=1):
+        start, end = event['min'] - EVENT_PANEL_MARGIN, event['max'] + EVENT_PANEL_MARGIN
+        window1 = df1[(df1['time'] >= start) & (df1['time'] <= end)]
+        window2 = df2[(df2['time'] >= start) & (df2['time'] <= end)]
+        resampled_window = resampled_df2[(resampled_df2['time'] >= start) & (resampled_df2['time'] <= end)]
+        traces = [
+            go.Scattergl(x=window1['timestamp'], y=window1[signal_column1]*scaling_factor_reference, mode='lines', name='Reference',
+                         line=dict(color='#1f77b4')),
+            go.Scattergl(x=window2['timestamp'], y=window2[signal_column2]*scaling_factor_align, mode='lines', name='Original Signal 2',
+                         line=dict(color='orange')),
+            go.Scattergl(x=resampled_window['timestamp'], y=resampled_window[signal_column2]*scaling_factor_align, mode='lines',
+                         name='Resampled Signal 2', line=dict(color='purple'))
+        ]
+        traces += _marker_traces(go.Scattergl, window1, window2, signal_column1, signal_column2, scaling_factor_reference, scaling_factor_align)
+        for trace in traces:
+            trace.showlegend = row == 1
+            trace.legendgroup = trace.name
+            fig.add_trace(trace, row=row, col=1)
+
+    fig.update_layout(title='Detected Events', height=300 * len(events), template='plotly_white')
+    pio.write_html(fig, file=output_file, auto_open=False)
+    print(f"Event panels saved to: {output_file}")
+
+
+def _signal_trace(scatter, x, y, max_points, **kwargs):
+    if max_points is not None:
+        indices = minmax_decimate(y, max_points)
+        x, y = x.iloc[indices], y.iloc[indices]
+    return scatter(x=x, y=y, mode='lines', **kwargs)
+
+
+def _marker_traces(scatter, df1, df2, signal_column1, signal_column2, scaling_factor_reference, scaling_factor_align):
+    # Event markers (even and odd event ids) and sync point markers of both files, all samples are drawn
+    traces = []
+    for df, signal_column, scaling_factor, label, symbol, colors in [
+            (df1, signal_column1, scaling_factor_reference, 'File 1', 'circle', ('green', 'red')),
+            (df2, signal_column2, scaling_factor_align, 'File 2', 'diamond', ('blue', 'black'))]:
+        even_events = df[(df['event_id'].notna()) & (df['event_id'] % 2 == 0)]
+        odd_events = df[(df['event_id'].notna()) & (df['event_id'] % 2 == 1)]
+        traces.append(scatter(x=even_events['timestamp'], y=even_events[signal_column]*scaling_factor, mode='markers',
+                              marker=dict(color=colors[0], symbol=symbol), name=f'{label} Even Event ID'))
+        traces.append(scatter(x=odd_events['timestamp'], y=odd_events[signal_column]*scaling_factor, mode='markers',
+                              marker=dict(color=colors[1], symbol=symbol), name=f'{label} Odd Event ID'))
+        if 'sync_point' in df.columns:
+            sync_points = df[df['sync_point'].notna()]
+            traces.append(scatter(x=sync_points['timestamp'], y=sync_points[signal_column]*scaling_factor, mode='markers',
+                                  marker=dict(color='gold', symbol='star', size=12, line=dict(color='black', width=1)),
+                                  name=f'{label} Sync Points'))
+    return traces
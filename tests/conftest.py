@@ -0,0 +1,18 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--exhaustive', action='store_true', default=False, help="Also run the tests over every recording in data/.")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "exhaustive: slow test over every recording in data/, only runs with --exhaustive")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--exhaustive'):
+        return
+    skip = pytest.mark.skip(reason="runs only with --exhaustive")
+    for item in items:
+        if 'exhaustive' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,59 @@
+# banded_dtw against a reference DTW over the full cost matrix (unconstrained and restricted to the same Sakoe-Chiba
+# band), dtw_lower_bound as lower bound of banded_dtw and the early abandoning of banded_dtw, on seeded random sequences.
+# Usage: python -m pytest tests
+
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.event_comparison import banded_dtw, dtw_lower_bound, _band
+
+WINDOW_FRACTIONS = [None, 0.05, 0.2, 0.5]
+# lengths of the sequences, including single samples and very different lengths
+LENGTHS = [(1, 1), (1, 7), (7, 1), (30, 30), (25, 60), (80, 35)]
+
+
+def reference_dtw(x, y, band=None):
+    # textbook DTW over the full (n + 1) x (m + 1) matrix, cells outside the band (lo, hi) are not reachable
+    n, m = len(x), len(y)
+    accumulated = np.full((n + 1, m + 1), np.inf)
+    accumulated[0, 0] = 0.0
+    for i in range(n):
+        columns = range(m) if band is None else range(band[0][i], band[1][i])
+        for j in columns:
+            accumulated[i + 1, j + 1] = abs(x[i] - y[j]) + min(accumulated[i, j], accumulated[i, j + 1], accumulated[i + 1, j])
+    return accumulated[n, m]
+
+
+def random_sequences(n, m, seed):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.standard_normal(n)), np.cumsum(rng.standard_normal(m))
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('n, m', LENGTHS)
+def test_unconstrained_banded_dtw_matches_reference(n, m, seed):
+    x, y = random_sequences(n, m, seed)
+    assert banded_dtw(x, y, window_fraction=None) == pytest.approx(reference_dtw(x, y), rel=1e-12)
+
+
+@pytest.mark.parametrize('window_fraction', WINDOW_FRACTIONS)
+@pytest.mark.parametrize('n, m', LENGTHS)
+def test_banded_dtw_matches_reference_in_band(n, m, window_fraction):
+    x, y = random_sequences(n, m, 0)
+    assert banded_dtw(x, y, window_fraction) == pytest.approx(reference_dtw(x, y, _band(n, m, window_fraction)), rel=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('window_fraction', WINDOW_FRACTIONS)
+@pytest.mark.parametrize('n, m', LENGTHS)
+def test_lower_bound_and_early_abandoning(n, m, window_fraction, seed):
+    x, y = random_sequences(n, m, seed)
+    distance = banded_dtw(x, y, window_fraction)
+    assert dtw_lower_bound(x, y, window_fraction) <= distance * (1 + 1e-12)
+    # never abandoned when the distance is within max_distance, otherwise inf or the exact distance
+    assert banded_dtw(x, y, window_fraction, max_distance=distance) == pytest.approx(distance, rel=1e-12)
+    assert banded_dtw(x, y, window_fraction, max_distance=0.5 * distance) in (np.inf, pytest.approx(distance, rel=1e-12))
@@ -0,0 +1,118 @@
+# Equivalence of identify_events with the original per-sample scan (identify_events_legacy), with the LOF flags of the
+# pipeline and with seeded random flags of several densities, at several thresholds: on one original recording per
+# sensor, a drifted recording and seeded synthetic signals with irregular sampling. The sweep over every recording in data/
+# takes several minutes and only runs with --exhaustive.
+# Usage: python -m pytest tests [--exhaustive]
+
+import os
+import sys
+import glob
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.event_detection import identify_events, identify_events_legacy
+from pipeline_steps.outlier_detection import detect_outliers
+from utils.data_utils import load_data, create_1D_signal, calculate_1D_signal_derivative
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data')
+SENSOR_FOLDERS = {
+    'cosinuss_ear_acc_x_acc_y_acc_z': 'cosinuss',
+    'corsano_wrist_acc': 'corsano',
+    'vivalnk_vv330_acceleration': 'vivalink',
+    'sensomative': 'sensomative'
+}
+OUTLIER_NEIGHBORS = {'cosinuss': 400, 'corsano': 200, 'vivalink': 50, 'sensomative': 20}
+# (min_time_event, min_outlier_fraction_event)
+THRESHOLDS = [(0.5, 0.5), (0.2, 0.6), (1.0, 0.8)]
+# fraction of outliers of the random flags
+RANDOM_DENSITIES = [0.05, 0.3, 0.7]
+# one original recording per sensor and a drifted recording (paths relative to DATA_FOLDER)
+REPRESENTATIVE_RECORDINGS = [
+    ('sensei-223/cosinuss_ear_acc_x_acc_y_acc_z/end_K41C.9ZA0_2022-11-07_10-44-13_acc_x_acc_y_acc_z.csv', 'cosinuss'),
+    ('sensei-103/corsano_wrist_acc/start_2022-11-08.csv', 'corsano'),
+    ('sensei-103/vivalnk_vv330_acceleration/start_20221108_0800.csv', 'vivalink'),
+    ('sensei-103/vivalnk_vv330_acceleration/drifted/start/start_20221108_0800_synched_to_corsano_timedrift2s.csv', 'vivalink'),
+    ('sensei-103/sensomative/start_sensei_103_2022-11-08_09-57-41-307_mod221207SA.csv', 'sensomative'),
+]
+# (number of samples, sampling rate in Hz) of the synthetic signals
+SYNTHETIC_SIGNALS = [(1500, 25), (1000, 100), (500, 5)]
+
+
+def find_recordings():
+    # every CSV file below a sensor folder (snippets, ground truth and drifted files) with its sensor
+    recordings = []
+    for input_file in sorted(glob.glob(os.path.join(DATA_FOLDER, '**', '*.csv'), recursive=True)):
+        folders = os.path.relpath(input_file, DATA_FOLDER).split(os.sep)[:-1]
+        sensors = [SENSOR_FOLDERS[folder] for folder in folders if folder in SENSOR_FOLDERS]
+        if sensors:
+            recordings.append((input_file, sensors[0]))
+    return recordings
+
+
+def outlier_flag_sets(df, signal_column, sensor_name, seed):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield 'lof', detect_outliers(df, signal_column, n_neighbors=OUTLIER_NEIGHBORS[sensor_name], method='lof')
+    rng = np.random.default_rng(seed)
+    for density in RANDOM_DENSITIES:
+        yield f"random {density}", rng.random(len(df)) < density
+
+
+def recording_id(value):
+    return os.path.relpath(value, DATA_FOLDER) if os.path.isabs(str(value)) else str(value)
+
+
+def check_recording(input_file, sensor_name):
+    df = create_1D_signal(load_data(input_file), sensor_name)
+    signal_column = '1d_signal'
+    if sensor_name == 'sensomative':
+        df = calculate_1D_signal_derivative(df, '1d_signal')
+        signal_column = '1d_signal_derivative'
+    check_flag_sets(df, outlier_flag_sets(df, signal_column, sensor_name, seed=len(df)))
+
+
+def check_flag_sets(df, flag_sets):
+    for flags_name, outlier_flags in flag_sets:
+        for threshold, min_outlier_percentage in THRESHOLDS:
+            events = identify_events(df, outlier_flags, 'time', threshold, min_outlier_percentage)
+            legacy_events = identify_events_legacy(df, outlier_flags, 'time', threshold, min_outlier_percentage)
+            assert events == legacy_events, f"{flags_name} flags, threshold {threshold}, min_outlier_percentage {min_outlier_percentage}"
+
+
+def synthetic_flag_sets(n_samples, seed):
+    # random flags of several densities and bursts of flags, as LOF flags them around movements
+    rng = np.random.default_rng(seed)
+    for density in RANDOM_DENSITIES:
+        yield f"random {density}", rng.random(n_samples) < density
+    bursts = np.zeros(n_samples, dtype=bool)
+    for start in rng.integers(0, n_samples, size=max(1, n_samples // 100)):
+        burst = slice(start, min(start + rng.integers(1, 40), n_samples))
+        bursts[burst] = rng.random(burst.stop - burst.start) < 0.8
+    yield 'bursts', bursts
+
+
+@pytest.mark.parametrize('input_file, sensor_name', [(os.path.join(DATA_FOLDER, path), sensor_name) for path, sensor_name in REPRESENTATIVE_RECORDINGS],
+                         ids=recording_id)
+def test_identify_events_matches_legacy(input_file, sensor_name):
+    check_recording(input_file, sensor_name)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('n_samples, sampling_rate', SYNTHETIC_SIGNALS)
+def test_identify_events_matches_legacy_synthetic(n_samples, sampling_rate, seed):
+    # sampling with jitter and a few gaps longer than the thresholds
+    rng = np.random.default_rng(seed)
+    intervals = rng.uniform(0.5, 1.5, n_samples) / sampling_rate
+    intervals[rng.integers(0, n_samples, size=5)] += rng.uniform(0.5, 3.0, size=5)
+    df = pd.DataFrame({'time': np.cumsum(intervals)})
+    check_flag_sets(df, synthetic_flag_sets(n_samples, seed))
+
+
+@pytest.mark.exhaustive
+@pytest.mark.parametrize('input_file, sensor_name', find_recordings(), ids=recording_id)
+def test_identify_events_matches_legacy_all_recordings(input_file, sensor_name):
+    check_recording(input_file, sensor_name)
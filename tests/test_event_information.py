@@ -0,0 +1,72 @@
+# Equivalence of extract_event_information with the original per-event implementation (extract_event_information_legacy)
+# on the events of one recording per sensor (LOF flags as in the pipeline) and on seeded synthetic signals with
+# irregular sampling, missing values and random events, for several normalization windows.
+# Usage: python -m pytest tests
+
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.event_detection import identify_events
+from pipeline_steps.event_information import extract_event_information, extract_event_information_legacy
+from pipeline_steps.outlier_detection import detect_outliers
+from utils.data_utils import load_data, create_1D_signal, calculate_1D_signal_derivative
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data')
+OUTLIER_NEIGHBORS = {'cosinuss': 400, 'corsano': 200, 'vivalink': 50, 'sensomative': 20}
+RECORDINGS = [
+    ('sensei-223/cosinuss_ear_acc_x_acc_y_acc_z/end_K41C.9ZA0_2022-11-07_10-44-13_acc_x_acc_y_acc_z.csv', 'cosinuss'),
+    ('sensei-103/corsano_wrist_acc/start_2022-11-08.csv', 'corsano'),
+    ('sensei-103/vivalnk_vv330_acceleration/start_20221108_0800.csv', 'vivalink'),
+    ('sensei-103/sensomative/start_sensei_103_2022-11-08_09-57-41-307_mod221207SA.csv', 'sensomative'),
+]
+# normalization_window_duration in s
+WINDOW_DURATIONS = [0, 2, 10]
+
+
+def assert_same_event_information(df, events, signal_column, normalization_window_duration):
+    event_stats = extract_event_information(df, events, signal_column, normalization_window_duration)
+    legacy_event_stats = extract_event_information_legacy(df, events, signal_column, normalization_window_duration)
+    assert len(event_stats) == len(legacy_event_stats)
+    for stats, legacy_stats in zip(event_stats, legacy_event_stats):
+        for key in ('event_id', 'start_index', 'start_time', 'end_time', 'min_value_index', 'max_value_index'):
+            assert stats[key] == legacy_stats[key], f"event {legacy_stats['event_id']}: {key}"
+        np.testing.assert_allclose(stats['normalized_event_data'], legacy_stats['normalized_event_data'].to_numpy(),
+                                   rtol=1e-9, atol=1e-12, err_msg=f"event {legacy_stats['event_id']}")
+
+
+@pytest.mark.parametrize('normalization_window_duration', WINDOW_DURATIONS)
+@pytest.mark.parametrize('path, sensor_name', RECORDINGS, ids=[path for path, _ in RECORDINGS])
+def test_extract_event_information_matches_legacy(path, sensor_name, normalization_window_duration):
+    df = create_1D_signal(load_data(os.path.join(DATA_FOLDER, path)), sensor_name)
+    signal_column = '1d_signal'
+    if sensor_name == 'sensomative':
+        df = calculate_1D_signal_derivative(df, '1d_signal')
+        signal_column = '1d_signal_derivative'
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        outlier_flags = detect_outliers(df, signal_column, n_neighbors=OUTLIER_NEIGHBORS[sensor_name], method='lof')
+    events = identify_events(df, outlier_flags, 'time', 0.5, 0.5)
+    assert events
+    assert_same_event_information(df, events, signal_column, normalization_window_duration)
+
+
+@pytest.mark.parametrize('normalization_window_duration', WINDOW_DURATIONS)
+@pytest.mark.parametrize('seed', range(3))
+def test_extract_event_information_matches_legacy_synthetic(seed, normalization_window_duration):
+    # jittered sampling at 25 Hz around a large offset (as Unix times), a few missing values, random events
+    rng = np.random.default_rng(seed)
+    n_samples = 3000
+    times = 1.6e9 + np.cumsum(rng.uniform(0.02, 0.06, n_samples))
+    values = 1.0 + 0.1 * rng.standard_normal(n_samples)
+    values[rng.integers(0, n_samples, size=10)] = np.nan
+    df = pd.DataFrame({'time': times, 'signal': values})
+    starts = np.sort(rng.choice(n_samples - 50, size=20, replace=False))
+    events = [{'event_id': event_id, 'indices': list(range(start, start + rng.integers(1, 50)))}
+              for event_id, start in enumerate(starts, start=1)]
+    assert_same_event_information(df, events, 'signal', normalization_window_duration)
@@ -0,0 +1,44 @@
+# A run of the pipeline without plotting must not import the plotting libraries (plotly, matplotlib), they take longer
+# to import than the rest of the pipeline. A pair from data/ is aligned with plotting: False in a fresh interpreter.
+# Usage: python -m pytest tests
+
+import os
+import sys
+import json
+import yaml
+import subprocess
+
+PIPELINE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline')
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data')
+REFERENCE_FILE = os.path.join(DATA_FOLDER, 'sensei-103/corsano_wrist_acc/start_2022-11-08.csv')
+FILE_TO_ALIGN = os.path.join(DATA_FOLDER, 'sensei-103/sensomative/drifted/start/start_sensei_103_2022-11-08_09-57-41-307_mod221207SA_synched_to_corsano_timedrift1s.csv')
+FORBIDDEN = ['plotly', 'matplotlib']
+
+RUN_SCRIPT = """
+import sys, json
+sys.path.append(sys.argv[1])
+from main import settings_from_config, run_synchronization_pipeline
+from utils.data_utils import wait_for_writes
+config = json.loads(sys.argv[2])
+outlier_settings, diverse_settings, plotting, plot_settings = settings_from_config(config)
+run_synchronization_pipeline(config['reference_file'], config['file_to_align'], config['sensor_name_reference'], config['sensor_name_align'],
+                             outlier_settings[config['sensor_name_reference']], outlier_settings[config['sensor_name_align']],
+                             diverse_settings, plotting, plot_settings)
+wait_for_writes()
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def test_run_without_plotting_imports_no_plotting_libraries(tmp_path):
+    with open(os.path.join(PIPELINE_FOLDER, 'config.yaml')) as config_file:
+        config = yaml.safe_load(config_file)
+    config.update(reference_file=REFERENCE_FILE, file_to_align=FILE_TO_ALIGN, sensor_name_reference='corsano', sensor_name_align='sensomative',
+                  plotting=False, cache_folder_path='', output_folder_path=str(tmp_path))
+    result = subprocess.run([sys.executable, '-c', RUN_SCRIPT, PIPELINE_FOLDER, json.dumps(config)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    modules = json.loads(result.stdout.strip().splitlines()[-1])
+    imported = sorted({module.split('.')[0] for module in modules if module.split('.')[0] in FORBIDDEN})
+    assert not imported, f"run without plotting imported {', '.join(imported)}"
+    # the pair was actually aligned
+    assert os.listdir(tmp_path)
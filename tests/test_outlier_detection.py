@@ -0,0 +1,80 @@
+# lof_1d against the sklearn LocalOutlierFactor (lof_sklearn) and a brute-force LOF with the neighbourhood of Breunig et
+# al. (every sample within the k-distance), on seeded tie-free signals and on quantized signals with ties.
+# Usage: python -m pytest tests
+
+import os
+import sys
+import warnings
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from pipeline_steps.outlier_detection import lof_1d, lof_sklearn, LOF_THRESHOLD
+
+# (number of samples, n_neighbors)
+SIZES = [(2000, 20), (2000, 200), (500, 50)]
+# decimals the quantized signals are rounded to
+DECIMALS = [0, 1, 2, 3]
+
+
+def random_signal(n_samples, seed):
+    # random walk with noise and a few spikes, like the 1D signal of an accelerometer
+    rng = np.random.default_rng(seed)
+    signal = np.cumsum(rng.standard_normal(n_samples)) * 0.1 + rng.standard_normal(n_samples)
+    spikes = rng.integers(0, n_samples, size=n_samples // 100)
+    signal[spikes] += rng.uniform(3, 10, size=len(spikes))
+    return signal
+
+
+def breunig_neighborhoods(values, n_neighbors):
+    # N_k of every sample (boolean matrix) with all samples within the k-distance
+    k = min(n_neighbors, len(values) - 1)
+    distances = np.abs(values[:, None] - values[None, :])
+    np.fill_diagonal(distances, np.inf)
+    k_distance = np.sort(distances, axis=1)[:, k - 1]
+    return distances <= k_distance[:, None], distances, k_distance
+
+
+def lof_breunig(values, n_neighbors):
+    neighborhoods, distances, k_distance = breunig_neighborhoods(values, n_neighbors)
+    reach_distance = np.where(neighborhoods, np.maximum(k_distance[None, :], distances), 0.0)
+    lrd = 1.0 / (reach_distance.sum(axis=1) / neighborhoods.sum(axis=1) + 1e-10)
+    lof = (neighborhoods * lrd[None, :]).sum(axis=1) / neighborhoods.sum(axis=1) / lrd
+    return lof > LOF_THRESHOLD
+
+
+def sklearn_flags(values, n_neighbors):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')    # duplicate values
+        return lof_sklearn(values, n_neighbors)
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('n_samples, n_neighbors', SIZES)
+def test_lof_1d_matches_sklearn_without_ties(n_samples, n_neighbors, seed):
+    values = random_signal(n_samples, seed)
+    assert len(np.unique(values)) == n_samples
+    np.testing.assert_array_equal(lof_1d(values, n_neighbors), sklearn_flags(values, n_neighbors))
+
+
+@pytest.mark.parametrize('decimals', DECIMALS)
+@pytest.mark.parametrize('n_samples, n_neighbors', SIZES)
+def test_lof_1d_on_quantized_signals(n_samples, n_neighbors, decimals):
+    values = np.round(random_signal(n_samples, decimals), decimals)
+    flags = lof_1d(values, n_neighbors)
+    np.testing.assert_array_equal(flags, lof_breunig(values, n_neighbors))
+
+    # a sample whose own and whose neighbours' neighbourhoods hold exactly k samples has the same score in sklearn,
+    # whichever tied samples its tree keeps: the flags may only differ where a tie enters the score
+    neighborhoods, _, _ = breunig_neighborhoods(values, n_neighbors)
+    tie_free = neighborhoods.sum(axis=1) == min(n_neighbors, n_samples - 1)
+    tie_free &= ~np.any(neighborhoods & ~tie_free[None, :], axis=1)
+    differs = flags != sklearn_flags(values, n_neighbors)
+    assert not np.any(differs & tie_free)
+
+
+def test_lof_1d_constant_and_short_signals():
+    assert not lof_1d(np.zeros(100), 20).any()
+    assert not lof_1d(np.array([1.0]), 20).any()
+    np.testing.assert_array_equal(lof_1d(np.array([0.0, 1.0, 1.0, 1.0, 9.0]), 20), lof_breunig(np.array([0.0, 1.0, 1.0, 1.0, 9.0]), 20))
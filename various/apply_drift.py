@@ -1,14 +1,22 @@
 # This script modifies the input file by applying a time drift and clock rate change (given in percent) to the time (and timestamps).
 # If no clock drift time and clock rate change is given, create files with 2s and 4s drift with 0.5%, 1% and 2% clock rate change.
+# The input file is parsed once for all drifts and the drift is applied vectorized (drift_synthesis.py). To test the
+# pipeline without writing drifted copies, use the drift scenarios of drift_synthesis.py in memory instead
+# (see error_quantification/stress_test_drift.py).
 # Usage: python script.py <input_file> [<time_drift_seconds> <clock_rate_change>]
 
 import pandas as pd
 import sys
 import os
 
-def apply_time_drift_and_clock_rate_change(input_file, time_drift_seconds, clock_rate_change):
-    # Load the data from the input file
-    df = pd.read_csv(input_file)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from drift_synthesis import DriftScenario, drift_times
+
+def apply_time_drift_and_clock_rate_change(input_file, time_drift_seconds, clock_rate_change, df=None):
+    # Load the data from the input file (if not loaded already)
+    if df is None:
+        df = pd.read_csv(input_file)
     
     # Ensure the required columns are present
     if 'time' not in df.columns or 'timestamp' not in df.columns:
@@ -16,8 +24,8 @@ def apply_time_drift_and_clock_rate_change(input_file, time_drift_seconds, clock
         return
 
     # Apply time drift and clock rate change
-    first_time = df['time'].iloc[0]
-    df['time'] = df['time'].apply(lambda x: x + time_drift_seconds + clock_rate_change * (x - first_time))
+    df = df.copy()
+    df['time'] = drift_times(df['time'].to_numpy(dtype=float), DriftScenario(offset=time_drift_seconds, clock_rate_change=clock_rate_change))
 
     # Update the 'timestamp' column based on new 'time' column
     df['timestamp'] = pd.to_datetime(df['time'], unit='s')
@@ -42,9 +50,10 @@ if __name__ == "__main__":
         predefined_time_drifts = [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2]
         predefined_clock_rate_changes = [0] # 0.5%, 1%, 2%
 
+        df = pd.read_csv(input_file)
         for time_drift in predefined_time_drifts:
             for clock_rate in predefined_clock_rate_changes:
-                apply_time_drift_and_clock_rate_change(input_file, time_drift, clock_rate)
+                apply_time_drift_and_clock_rate_change(input_file, time_drift, clock_rate, df)
     elif len(sys.argv) == 4:
         input_file = sys.argv[1]
         time_drift_seconds = float(sys.argv[2])
@@ -6,99 +6,130 @@
 # 2. Iterates over all user folders, processes CSV files, and extracts data within specified timestamp ranges (with +30 seconds at start end +35 seconds at the end).
 # 3. Skips files without a 'time' column or files where no data is found in the specified ranges.
 # 4. Saves the extracted data (if at least 50 datapoints are available) while maintaining the original subfolder structure.
+# The ranges are read through the sparse time index of every CSV file (synchronization_pipeline/utils/time_index.py,
+# built on the first run next to the file or in --index_folder), so only the blocks around the ranges are parsed instead
+# of the whole recording. The files are processed in --workers processes.
+# Usage: python extract_data_of_synching_events.py [--dataset_path <path>] [--workers N] [--index_folder <folder>]
 
 import os
+import re
+import sys
+import argparse
 import pandas as pd
 from datetime import datetime, timedelta
-import re
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../synchronization_pipeline'))
+
+from utils.time_index import read_time_ranges
 
 # Define path to Sensei-V2 dataset
 #path_to_sensei_v2_dataset = 'C:/Users/pasca/Documents/SemesterThesisData/'
 path_to_sensei_v2_dataset = 'C:/Users/hrkuc/Documents/Semester Project/SemesterThesisData/'
 
-# Step 1: Read the Excel file to get the timestamps and the starting date
-excel_file = os.path.join(path_to_sensei_v2_dataset, 'Sensei-V2 - Modified-Labels.xlsx')
-date_file = os.path.join(path_to_sensei_v2_dataset, 'SCAI-SENSEI-V2/Pilot-Tests - Device Logs.xlsx')
-df_labels = pd.read_excel(excel_file)
-df_dates = pd.read_excel(date_file, header=1)  # Use the second row as header
-
-# Step 2: Iterate over all user folders and process CSV files in subfolders
-input_folder = os.path.join(path_to_sensei_v2_dataset, 'SCAI-SENSEI-V2')
-output_folder = os.path.join(path_to_sensei_v2_dataset, 'SCAI-SENSEI-V2/start_end_data/')
-os.makedirs(output_folder, exist_ok=True)
-
-for index, row in df_labels.iterrows():
-    user_id = row['User']
-    start_time_1 = row['Timestamp_Touchpad_START_1']
-    end_time_1 = row['Timestamp_Touchpad_START_3']
-    start_time_3 = row['Timestamp_Touchpad_END_1']
-    end_time_3 = row['Timestamp_Touchpad_END_3']
-
-    # Get the starting date for the user from the date file
-    user_date_row = df_dates[df_dates['Participant ID'] == user_id]
+# Minimum number of datapoints of an extracted range
+MIN_DATAPOINTS = 50
+
+
+def user_windows(row, df_dates):
+    # (start, end) Unix timestamps of the start and end range of a user, None if the starting date is not found
+    user_date_row = df_dates[df_dates['Participant ID'] == row['User']]
     if user_date_row.empty:
-        print(f"Starting date for user {user_id} not found, skipping...")
-        continue
+        return None
     starting_date_str = user_date_row.iloc[0]['Starting Date and Time']
 
     # Extract only the date part from the starting date string
     starting_date_str = re.match(r'\d{1,2}\.\d{1,2}\.\d{4}', starting_date_str).group()
     starting_date = datetime.strptime(starting_date_str, '%d.%m.%Y').date()
 
-    # Combine date and time to get full datetime
-    start_datetime_1 = datetime.combine(starting_date, start_time_1) - timedelta(seconds=30)
-    end_datetime_1 = datetime.combine(starting_date, end_time_1) + timedelta(seconds=35)
-    start_datetime_3 = datetime.combine(starting_date, start_time_3) - timedelta(seconds=30)
-    end_datetime_3 = datetime.combine(starting_date, end_time_3) + timedelta(seconds=35)
-
-    # Convert to Unix timestamp
-    start_unix_1 = int(start_datetime_1.timestamp())
-    end_unix_1 = int(end_datetime_1.timestamp())
-    start_unix_3 = int(start_datetime_3.timestamp())
-    end_unix_3 = int(end_datetime_3.timestamp())
-
-    user_folder = os.path.join(input_folder, user_id)  # Assuming the folder is named by the user ID
-    print(user_folder)
-    if not os.path.exists(user_folder):
-        print(f"User folder {user_folder} not found, skipping...")
-        continue
-
-    for root, dirs, files in os.walk(user_folder):
-        for file in files:
-            if file.endswith('.csv'):
-                csv_file_path = os.path.join(root, file)
-                
-                try:
-                    df_csv = pd.read_csv(csv_file_path)
-                except:
-                    print(f"Could not read file {csv_file_path}, skipping...")
-                    continue
-                    
-                # Check if 'time' column exists
-                if 'time' not in df_csv.columns:
-                    print(f"No 'time' column in file {csv_file_path}, skipping...")
-                    continue
-
-                # Step 3: Extract the data within the specified timestamp ranges
-                extracted_data_1 = df_csv[(df_csv['time'] >= start_unix_1) & (df_csv['time'] <= end_unix_1)]
-                extracted_data_2 = df_csv[(df_csv['time'] >= start_unix_3) & (df_csv['time'] <= end_unix_3)]
-
-                # Skip if no data is found in the time interval or if less than 50 datapoints are available
-                if len(extracted_data_1) < 50 and len(extracted_data_2) < 50:
-                    print(f"Not enough data points found in the specified time intervals for file {csv_file_path}, skipping...")
-                    continue
-
-                # Step 4: Preserve the subfolder structure and save the extracted data to new files
-                relative_path = os.path.relpath(root, input_folder)
-                user_output_folder = os.path.join(output_folder, relative_path)
-                os.makedirs(user_output_folder, exist_ok=True)
-
-                if len(extracted_data_1) >= 50:
-                    output_file_path_1 = os.path.join(user_output_folder, f'start_{file}')
-                    extracted_data_1.to_csv(output_file_path_1, index=False)
-                    print(f"Extracted data for start range saved to {output_file_path_1}")
-
-                if len(extracted_data_2) >= 50:
-                    output_file_path_2 = os.path.join(user_output_folder, f'end_{file}')
-                    extracted_data_2.to_csv(output_file_path_2, index=False)
-                    print(f"Extracted data for end range saved to {output_file_path_2}")
\ No newline at end of file
+    # Combine date and time to get full datetime and convert to Unix timestamp
+    windows = []
+    for start_column, end_column in [('Timestamp_Touchpad_START_1', 'Timestamp_Touchpad_START_3'),
+                                     ('Timestamp_Touchpad_END_1', 'Timestamp_Touchpad_END_3')]:
+        start_datetime = datetime.combine(starting_date, row[start_column]) - timedelta(seconds=30)
+        end_datetime = datetime.combine(starting_date, row[end_column]) + timedelta(seconds=35)
+        windows.append((int(start_datetime.timestamp()), int(end_datetime.timestamp())))
+    return windows
+
+
+def extract_file(csv_file_path, windows, user_output_folder, index_folder=None):
+    """Extracts the start and end range of one CSV file and saves them, returns the messages (run in a worker process)."""
+    try:
+        columns = pd.read_csv(csv_file_path, nrows=0).columns
+    except Exception:
+        return [f"Could not read file {csv_file_path}, skipping..."]
+
+    # Check if 'time' column exists
+    if 'time' not in columns:
+        return [f"No 'time' column in file {csv_file_path}, skipping..."]
+
+    # Step 3: Extract the data within the specified timestamp ranges (only the indexed blocks around them are read)
+    try:
+        extracted_data = read_time_ranges(csv_file_path, windows, index_folder=index_folder)
+    except Exception:
+        return [f"Could not read file {csv_file_path}, skipping..."]
+
+    # Skip if no data is found in the time interval or if less than 50 datapoints are available
+    if all(len(data) < MIN_DATAPOINTS for data in extracted_data):
+        return [f"Not enough data points found in the specified time intervals for file {csv_file_path}, skipping..."]
+
+    # Step 4: Preserve the subfolder structure and save the extracted data to new files
+    os.makedirs(user_output_folder, exist_ok=True)
+    messages = []
+    file = os.path.basename(csv_file_path)
+    for prefix, data in zip(['start', 'end'], extracted_data):
+        if len(data) >= MIN_DATAPOINTS:
+            output_file_path = os.path.join(user_output_folder, f'{prefix}_{file}')
+            data.to_csv(output_file_path, index=False)
+            messages.append(f"Extracted data for {prefix} range saved to {output_file_path}")
+    return messages
+
+
+def main(dataset_path, workers, index_folder):
+    # Step 1: Read the Excel file to get the timestamps and the starting date
+    excel_file = os.path.join(dataset_path, 'Sensei-V2 - Modified-Labels.xlsx')
+    date_file = os.path.join(dataset_path, 'SCAI-SENSEI-V2/Pilot-Tests - Device Logs.xlsx')
+    df_labels = pd.read_excel(excel_file)
+    df_dates = pd.read_excel(date_file, header=1)  # Use the second row as header
+
+    # Step 2: Iterate over all user folders and collect the CSV files in subfolders
+    input_folder = os.path.join(dataset_path, 'SCAI-SENSEI-V2')
+    output_folder = os.path.join(dataset_path, 'SCAI-SENSEI-V2/start_end_data/')
+    os.makedirs(output_folder, exist_ok=True)
+
+    tasks = []
+    for _, row in df_labels.iterrows():
+        user_id = row['User']
+        windows = user_windows(row, df_dates)
+        if windows is None:
+            print(f"Starting date for user {user_id} not found, skipping...")
+            continue
+
+        user_folder = os.path.join(input_folder, user_id)  # Assuming the folder is named by the user ID
+        print(user_folder)
+        if not os.path.exists(user_folder):
+            print(f"User folder {user_folder} not found, skipping...")
+            continue
+
+        for root, dirs, files in os.walk(user_folder):
+            for file in files:
+                if file.endswith('.csv'):
+                    user_output_folder = os.path.join(output_folder, os.path.relpath(root, input_folder))
+                    tasks.append((os.path.join(root, file), windows, user_output_folder, index_folder))
+
+    # the messages of every file are printed together, in the order of the files
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for messages in executor.map(extract_file, *zip(*tasks)) if tasks else []:
+            for message in messages:
+                print(message)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the start and end ranges of the synching events from the SCAI-SENSEI V2 dataset.")
+    parser.add_argument("--dataset_path", default=path_to_sensei_v2_dataset, help="Folder of the Sensei-V2 dataset.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--index_folder", default=None, help="Folder of the time indexes (default: next to the CSV files).")
+    args = parser.parse_args()
+
+    sys.exit(main(args.dataset_path, args.workers, args.index_folder))